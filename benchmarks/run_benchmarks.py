@@ -0,0 +1,322 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import statistics
+import numpy as np
+
+import rocketsimu.simulator as simu
+import rocketsimu.dispersion as dispersion
+from rocketsimu.engine import RocketEngine
+from rocketsimu.air import standard_aero_coeff
+from rocketsimu.solver import TrajectorySolver
+
+'''
+弾道計算の主要な処理の実行時間を計測し, 結果をJSONで出力するベンチマーク
+
+使い方 (リポジトリのルートから)
+    python benchmarks/run_benchmarks.py -o bench.json
+    python benchmarks/run_benchmarks.py -o bench_new.json --compare bench.json
+
+各ベンチマークは setup関数として定義し, (計測する関数, 1回の呼び出しあたりの操作数) を返す.
+計測する関数はウォームアップ(numbaのコンパイルなど)として一度呼んだ後, repeat回計測する.
+'''
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SAMPLE_PARAMETERS = os.path.join(ROOT_DIR, 'samples', 'sample_parameters.json')
+
+BENCHMARKS = []
+
+
+def benchmark(name, repeat=5, unit='call'):
+    '''
+    ベンチマークのsetup関数を登録するデコレータ
+    INPUT
+        name: ベンチマーク名(出力JSONのキー)
+        repeat: 計測回数
+        unit: 操作数の単位(ops/sの表示用)
+    '''
+    def register(setup):
+        BENCHMARKS.append({'name': name, 'setup': setup, 'repeat': repeat, 'unit': unit})
+        return setup
+    return register
+
+
+def load_sample_parameters():
+    with open(SAMPLE_PARAMETERS) as f:
+        params = json.load(f)
+    params['thrust_curve_csv'] = os.path.join(os.path.dirname(SAMPLE_PARAMETERS), params['thrust_curve_csv'])
+    return params
+
+
+# ----------------------------
+#    Benchmarks
+# ----------------------------
+@benchmark('simulate_single_python', repeat=3, unit='flight')
+def setup_simulate_python(options):
+    params = load_sample_parameters()
+    return lambda: simu.simulate(params, cons_out=False, backend='python'), 1
+
+
+@benchmark('simulate_single_numba', repeat=5, unit='flight')
+def setup_simulate_numba(options):
+    params = load_sample_parameters()
+    return lambda: simu.simulate(params, cons_out=False, backend='numba'), 1
+
+
+def _rhs_samples(n=200):
+    # 実際の弾道上の(t, u, state)を運動方程式の入力とする
+    params = load_sample_parameters()
+    _, rocket = simu._prepare_rocket(params)
+    solver = TrajectorySolver(rocket, dt=params['dt'], max_t=params['t_max'], cons_out=False, output='steps')
+    solution = solver.solve()
+    log = solver.solver_log
+    idx = np.linspace(0, len(solver.t) - 1, n).astype(int)
+    samples = []
+    for t, u in zip(solver.t[idx], solution[idx]):
+        if t < log['MECO']['t']:
+            state = 2
+        elif 'drogue' in log and t >= log['drogue']['t'] and t < log['para']['t']:
+            state = 3.5
+        elif t >= log['para']['t']:
+            state = 4
+        else:
+            state = 3
+        samples.append((t, u, state))
+    return rocket, solver, samples
+
+
+@benchmark('rhs_python', repeat=5, unit='rhs')
+def setup_rhs_python(options):
+    _, solver, samples = _rhs_samples()
+    f = solver._TrajectorySolver__f_dynamics
+
+    def run():
+        for t, u, state in samples:
+            f(t, u, state)
+    return run, len(samples)
+
+
+@benchmark('rhs_numba', repeat=5, unit='rhs')
+def setup_rhs_numba(options):
+    from rocketsimu.rhs_numba import NumbaRHS
+    rocket, _, samples = _rhs_samples()
+    samples = samples * 25
+    f = NumbaRHS(rocket)
+
+    def run():
+        for t, u, state in samples:
+            f(t, u, state)
+    return run, len(samples)
+
+
+@benchmark('standard_air_scalar', repeat=5, unit='call')
+def setup_standard_air_scalar(options):
+    _, rocket = simu._prepare_rocket(load_sample_parameters())
+    h_list = np.linspace(0.0, 20000.0, 10000).tolist()
+    standard_air = rocket.air.standard_air
+
+    def run():
+        for h in h_list:
+            standard_air(h)
+    return run, len(h_list)
+
+
+@benchmark('standard_air_array', repeat=5, unit='point')
+def setup_standard_air_array(options):
+    _, rocket = simu._prepare_rocket(load_sample_parameters())
+    h_array = np.linspace(0.0, 20000.0, 100000)
+    return lambda: rocket.air.standard_air(h_array), len(h_array)
+
+
+@benchmark('aero_coefficients_scalar', repeat=5, unit='call')
+def setup_aero_scalar(options):
+    rng = np.random.default_rng(0)
+    mach = rng.uniform(0.0, 1.5, 10000).tolist()
+    alpha = rng.uniform(0.0, np.deg2rad(15.0), 10000).tolist()
+    coefficients = standard_aero_coeff.coefficients
+
+    def run():
+        for m, a in zip(mach, alpha):
+            coefficients(m, a)
+    return run, len(mach)
+
+
+@benchmark('aero_coefficients_array', repeat=5, unit='point')
+def setup_aero_array(options):
+    rng = np.random.default_rng(0)
+    mach = rng.uniform(0.0, 1.5, 100000)
+    alpha = rng.uniform(0.0, np.deg2rad(15.0), 100000)
+    return lambda: standard_aero_coeff.coefficients(mach, alpha), len(mach)
+
+
+@benchmark('thrust_load_lpf', repeat=5, unit='load')
+def setup_thrust_load(options):
+    params = load_sample_parameters()
+
+    def run():
+        engine = RocketEngine(params)
+        engine.loadThrust(params['thrust_curve_csv'], params['thrust_dt'], cache=False)
+    return run, 1
+
+
+@benchmark('thrust_load_cached', repeat=5, unit='load')
+def setup_thrust_load_cached(options):
+    params = load_sample_parameters()
+    # 1回目の読み込みで前処理結果をキャッシュしておく
+    RocketEngine(params).loadThrust(params['thrust_curve_csv'], params['thrust_dt'])
+
+    def run():
+        engine = RocketEngine(params)
+        engine.loadThrust(params['thrust_curve_csv'], params['thrust_dt'])
+    return run, 1
+
+
+@benchmark('wind_sweep', repeat=1, unit='flight')
+def setup_wind_sweep(options):
+    params = load_sample_parameters()
+    # サンプルのhybrid風は基準風速を参照しないため, べき法則風で風速/風向を振る
+    params['wind_model'] = 'power'
+    params['wind_parameters'] = {'z0': 2.0, 'n': 4.5, 'wind_std': [0.0, 0.0, 0.0]}
+    n_speed = max(1, options.sweep_cases // 10)
+    n_azimuth = max(1, options.sweep_cases // n_speed)
+    cases = dispersion.wind_cases(
+                params,
+                np.linspace(1.0, 7.0, n_speed),
+                np.linspace(0, 2*np.pi, n_azimuth, endpoint=False))
+
+    def run():
+        dispersion.run_dispersion(
+            params,
+            cases,
+            n_workers=options.workers,
+            backend='numba',
+            trajectory=False)
+    return run, len(cases)
+
+
+@benchmark('surrogate_predict', repeat=5, unit='point')
+def setup_surrogate_predict(options):
+    from rocketsimu.surrogate import RBFModel
+    # 4変数, 200点の代替モデル
+    rng = np.random.default_rng(0)
+    X = rng.random((200, 4))
+    model = RBFModel(X, np.c_[np.sin(3*X[:, 0]) + X[:, 1], X[:, 2] * X[:, 3], X[:, 0]**2])
+    X_query = rng.random((100000, 4))
+    return lambda: model.predict(X_query), len(X_query)
+
+
+# ----------------------------
+#    Runner
+# ----------------------------
+def run_benchmark(bench, options):
+    func, n_ops = bench['setup'](options)
+    # ウォームアップ(JITコンパイル, キャッシュの作成など)
+    func()
+    times = []
+    for _ in range(bench['repeat']):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    median = statistics.median(times)
+    return {
+        'repeat': bench['repeat'],
+        'n_ops': n_ops,
+        'unit': bench['unit'],
+        'times': times,
+        'min': min(times),
+        'median': median,
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'ops_per_sec': n_ops / median
+    }
+
+
+def environment_info():
+    import scipy
+    info = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'rocketsimu_version': simu.__version__,
+        'commit': None
+    }
+    try:
+        import numba
+        info['numba'] = numba.__version__
+    except ImportError:
+        info['numba'] = None
+    try:
+        info['commit'] = subprocess.check_output(
+                            ['git', 'rev-parse', 'HEAD'],
+                            cwd=ROOT_DIR,
+                            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def compare(results, baseline, threshold):
+    '''
+    基準の結果(baseline)に対する中央値の比を表示し, threshold倍以上遅くなったベンチマーク名のリストを返す
+    '''
+    regressions = []
+    print('\n{:<28}{:>12}{:>12}{:>9}'.format('benchmark', 'base [s]', 'new [s]', 'ratio'))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['median'] / baseline[name]['median']
+        mark = ''
+        if ratio >= threshold:
+            regressions.append(name)
+            mark = '  <- regression'
+        print('{:<28}{:>12.4g}{:>12.4g}{:>9.2f}{}'.format(
+            name, baseline[name]['median'], result['median'], ratio, mark))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', help='output JSON filename')
+    parser.add_argument('-k', '--filter', help='run only benchmarks whose name contains this string')
+    parser.add_argument('-c', '--compare', help='baseline JSON filename to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='median time ratio regarded as a regression in --compare (default: 1.2)')
+    parser.add_argument('--sweep-cases', type=int, default=100, help='number of cases of the wind sweep')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes of the wind sweep')
+    options = parser.parse_args(argv)
+
+    results = {}
+    for bench in BENCHMARKS:
+        if options.filter and options.filter not in bench['name']:
+            continue
+        result = run_benchmark(bench, options)
+        results[bench['name']] = result
+        print('{:<28} median {:>10.4g} [s]  {:>12.4g} {}/s'.format(
+            bench['name'], result['median'], result['ops_per_sec'], result['unit']))
+
+    output = {'environment': environment_info(), 'results': results}
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(output, f, indent=4)
+        print('results were written to', options.output)
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, options.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
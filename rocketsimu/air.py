@@ -1,3 +1,5 @@
+import math
+import bisect
 import numpy as np
 import pandas as pd
 from scipy import interpolate
@@ -7,122 +9,161 @@ from scipy.interpolate import interp1d
 from .wind import Wind
 
 class Air:
-    def __init__(self, wind: Wind, T0=298.0, p0=1.013e5):
+    # gas constant [J/kg.K]
+    R = 287.15
+    # gravitational accel. [m/s^2]
+    g = 9.81
+
+    # 各層の上端高度[m]と気温減率[K/m]
+    # (Troposphere, Tropopause, Stratosphere 1, 2, Stratopause,
+    #  Mesosphere 1, 2, Mesopause, Thermosphere)
+    # 110km以上は110kmの値で一定とする
+    LAYER_TOP = (11000., 20000., 32000., 47000., 51000., 71000., 85000., 90000., 110000.)
+    LAPSE_RATE = (-0.0065, 0.0, 0.001, 0.0028, 0.0, -0.0028, -0.002, 0.0, 0.0026675)
+
+    def __init__(self, wind: Wind, T0=298.0, p0=1.013e5, table_dh=None, table_h_range=(-1000., 110000.)):
+        '''
+        INPUT
+            wind: Windインスタンス
+            T0, p0: 地表の気温[K], 気圧[Pa]
+            table_dh: 指定した場合, この刻み[m]の補間テーブルをstandard_airで使用する
+            table_h_range: 補間テーブルの高度範囲[m]. 範囲外は厳密式で計算する
+        '''
         self.wind = wind
         self.T0 = T0
         self.p0 = p0
-    
+
+        # 各層の下端の高度, 気温, 気圧を事前に計算しておく
+        self.layer_base_h = np.r_[0., self.LAYER_TOP]
+        self.layer_gamma = np.r_[self.LAPSE_RATE, 0.]
+        self.layer_base_T = np.zeros(len(self.layer_base_h))
+        self.layer_base_p = np.zeros(len(self.layer_base_h))
+        self.layer_base_T[0] = T0
+        self.layer_base_p[0] = p0
+        for i in range(len(self.LAYER_TOP)):
+            h_b = self.layer_base_h[i]
+            h_top = self.layer_base_h[i+1]
+            T_b = self.layer_base_T[i]
+            p_b = self.layer_base_p[i]
+            gamma = self.layer_gamma[i]
+            if gamma == 0.:
+                T = T_b
+                p = p_b * np.exp((-self.g/(self.R*T_b)) * (h_top - h_b))
+            else:
+                T = T_b + gamma * (h_top - h_b)
+                p = p_b * (T / T_b)**(-self.g / (gamma*self.R))
+            self.layer_base_T[i+1] = T
+            self.layer_base_p[i+1] = p
+        self.__layer_top = list(self.LAYER_TOP)
+        self.__last_layer = len(self.LAYER_TOP)
+        # スカラ計算用(numpyスカラのオーバーヘッドを避ける)
+        self.__layers = [
+            (float(h_b), float(T_b), float(p_b), float(gamma))
+            for h_b, T_b, p_b, gamma in zip(
+                self.layer_base_h, self.layer_base_T, self.layer_base_p, self.layer_gamma)
+        ]
+
+        self.table_dh = None
+        self.table_max_rel_error = None
+        if table_dh is not None:
+            self.build_table(table_dh, *table_h_range)
+
+    def __layer_Tp(self, i, h):
+        # 第i層内の高度hにおける気温と気圧(スカラ)
+        h_b, T_b, p_b, gamma = self.__layers[i]
+        if i == len(self.LAYER_TOP):
+            return T_b, p_b
+        elif gamma == 0.:
+            return T_b, p_b * math.exp((-self.g/(self.R*T_b)) * (h - h_b))
+        else:
+            T = T_b + gamma * (h - h_b)
+            return T, p_b * (T / T_b)**(-self.g / (gamma*self.R))
+
+    def build_table(self, dh=10.0, h_min=-1000., h_max=110000.):
+        '''
+        等間隔の補間テーブルを作成し, 以降のstandard_airで使用する
+        テーブルの最大相対誤差(各区間の中点で評価)をtable_max_rel_errorに保持する
+        (dh=10mで5e-7程度)
+        '''
+        n = int(np.ceil((h_max - h_min) / dh)) + 1
+        h = h_min + dh * np.arange(n)
+        self.table_dh = None
+        table = np.array(self.__standard_air_exact(h))
+
+        h_mid = h[:-1] + dh/2
+        exact = np.array(self.__standard_air_exact(h_mid))
+        approx = (table[:, :-1] + table[:, 1:]) / 2
+        self.table_max_rel_error = float(np.max(np.abs(approx - exact) / np.abs(exact)))
+
+        self.__table = table
+        self.__table_rows = [tuple(row) for row in table.T.tolist()]
+        self.table_h_min = h_min
+        self.table_h_max = h[-1]
+        self.table_dh = dh
+
     def standard_air(self, h):
         '''
         returns air property given an altitude  
-        INPUT: h = altitude [m]
+        INPUT: h = altitude [m] (scalar or array)
+        OUTPUT: T[K], p[Pa], rho[kg/m^3], a[m/s]
         '''
+        if isinstance(h, float) or np.ndim(h) == 0:
+            h = float(h)
+            if self.table_dh is not None and self.table_h_min <= h < self.table_h_max:
+                pos = (h - self.table_h_min) / self.table_dh
+                i = int(pos)
+                frac = pos - i
+                T0, p0, rho0, a0 = self.__table_rows[i]
+                T1, p1, rho1, a1 = self.__table_rows[i+1]
+                return T0 + (T1 - T0)*frac, p0 + (p1 - p0)*frac,\
+                        rho0 + (rho1 - rho0)*frac, a0 + (a1 - a0)*frac
 
-        # gas constant
-        R = 287.15  # [J/kg.K]
-        # gravitational accel.
-        g = 9.81  # [m/s^2]
-
-        if h <= 11.*10**3:
-            # *** Troposphere ***
-            # temperature lapse rate
-            gamma = -0.0065
-            # temperature[K]
-            T = self.T0 + gamma * h
-            # pressure[Pa]
-            p = self.p0 * (T / self.T0)**(-g / (gamma*R))
-
-        elif h <= 20.*10**3:
-            # *** Tropopause ***
-            # temperature is const at 11km-20km
-            # p11 = pressure at 11km alt.
-            T,p11,_,_ = self.standard_air(11000.)
-            # pressure
-            p = p11 * np.exp( (-g/(R*T)) * (h-11000.) )
-
-        elif h <= 32.*10**3:
-            # *** Stratosphere 1 ***
-            # temp, pressure at 20km alt.
-            T20,p20,_,_ = self.standard_air(20000.)
-            # temperature lapse rate
-            gamma = 0.001
-            # temperature
-            T = T20 + gamma * (h-20000.) # [K]
-            #pressure
-            p = p20 * (T/T20)**(-g/(gamma*R)) #[Pa]
-
-        elif h <= 47.*10**3:
-            # *** Stratosphere 2 ***
-            # temp, pressure at 32km alt.
-            T32,p32,_,_ = self.standard_air(32000.)
-            # temperature lapse rate
-            gamma = 0.0028
-            # temperature
-            T = T32 + gamma * (h-32000.) # [K]
-            #pressure
-            p = p32 * (T/T32)**(-g/(gamma*R)) #[Pa]
-
-        elif h <= 51.*10**3:
-            # *** Stratopause ***
-            # temp, pressure at 47km alt.
-            T,p47,_,_ = self.standard_air(47000.)
-            # pressure
-            p = p47 * np.exp( (-g/(R*T)) * (h-47000.) )
-
-        elif h <= 71.*10**3:
-            # *** Mesosphere 1 ***
-            # temp, pressure at 51km alt.
-            T51,p51,_,_ = self.standard_air(51000.)
-            # temperature lapse rate
-            gamma = -0.0028
-            # temperature
-            T = T51 + gamma * (h-51000.) # [K]
-            #pressure
-            p = p51 * (T/T51)**(-g/(gamma*R)) #[Pa]
-
-        elif h <= 85.*10**3:
-            # *** Mesosphere 2 ***
-            # temp, pressure at 71km alt.
-            T71,p71,_,_ = self.standard_air(71000.)
-            # temperature lapse rate
-            gamma = -0.002
-            # temperature
-            T = T71 + gamma * (h-71000.) # [K]
-            #pressure
-            p = p71 * (T/T71)**(-g/(gamma*R)) #[Pa]
-
-        elif h <= 90.*10**3:
-            # *** Mesopause ***
-            # temp, pressure at 47km alt.
-            T,p85,_,_ = self.standard_air(85000.)
-            # pressure
-            p = p85 * np.exp( (-g/(R*T)) * (h-85000.) )
-
-        elif h <= 110.*10**3:
-            # *** Thermosphere  ***
-            # temp, pressure at 51km alt.
-            T90,p90,_,_ = self.standard_air(90000.)
-            # temperature lapse rate
-            gamma = 0.0026675
-            # temperature
-            T = T90 + gamma * (h-90000.) # [K]
-            #pressure
-            p = p90 * (T/T90)**(-g/(gamma*R)) #[Pa]
+            i = bisect.bisect_left(self.__layer_top, h)
+            T, p = self.__layer_Tp(i, h)
+            # density, acoustic speed
+            return T, p, p/(self.R*T), math.sqrt(1.4*self.R*T)
 
-        else:
-            T110,p110,_,_ = self.standard_air(110000.)
-            T = T110
-            p = p110
+        h = np.asarray(h, dtype=float)
+        if self.table_dh is None:
+            return self.__standard_air_exact(h)
+
+        in_table = (h >= self.table_h_min) & (h < self.table_h_max)
+        if not in_table.all():
+            # テーブル範囲外を含む場合は厳密式で計算する
+            return self.__standard_air_exact(h)
+        pos = (h - self.table_h_min) / self.table_dh
+        i = pos.astype(int)
+        frac = pos - i
+        return tuple(
+            column[i] + (column[i+1] - column[i]) * frac for column in self.__table
+        )
 
-        #END IF
+    def __standard_air_exact(self, h):
+        i = np.searchsorted(self.LAYER_TOP, h, side='left')
+        h_b = self.layer_base_h[i]
+        T_b = self.layer_base_T[i]
+        p_b = self.layer_base_p[i]
+        gamma = self.layer_gamma[i]
+
+        # temperature[K]
+        T = T_b + gamma * (h - h_b)
+        T = np.where(i == self.__last_layer, T_b, T)
+
+        # pressure[Pa]
+        isothermal = gamma == 0.
+        gamma_safe = np.where(isothermal, 1.0, gamma)
+        p_gradient = p_b * (T / T_b)**(-self.g / (gamma_safe*self.R))
+        p_isothermal = p_b * np.exp((-self.g/(self.R*T_b)) * (h - h_b))
+        p = np.where(isothermal, p_isothermal, p_gradient)
+        p = np.where(i == self.__last_layer, p_b, p)
 
         # density
-        rho = p/(R*T) #[kg/m^3]
+        rho = p/(self.R*T) #[kg/m^3]
 
         # acoustic speed
-        a = np.sqrt(1.4*R*T) # [m/s]
+        a = np.sqrt(1.4*self.R*T) # [m/s]
 
-        return T,p,rho,a
+        return T, p, rho, a
 
 
 class _StandardAeroCoeff:
@@ -151,7 +192,7 @@ class _StandardAeroCoeff:
 
         self.CP_vs_MachAlpha = RectBivariateSpline(Mach_array, AOA_array, CP_array)
         # Mach0.3, AoA=2degの圧力中心位置をCPスケーリングの基準とする
-        self.CP_scale_basevalue = float(self.CP_vs_MachAlpha(0.3, 2.0*np.pi/180.0))
+        self.CP_scale_basevalue = float(self.CP_vs_MachAlpha.ev(0.3, 2.0*np.pi/180.0))
 
         # Cd0のロード
         try:
@@ -171,8 +212,103 @@ class _StandardAeroCoeff:
         self.Clalpha_vs_Mach = interp1d(data[:, 0], data[:, 1], kind='linear')
         self.Clalpha_scale_basevalue = self.Clalpha_vs_Mach(0.0)
 
+        self.__buildFastTables()
+
+    def __buildFastTables(self):
+        '''
+        coefficients()で使用する正規化済みのテーブルを作成する
+        Cd0, Clalphaは元データの折れ線をそのまま保持し,
+        CPは双3次スプラインを区間ごとの多項式係数に展開して保持する
+        (どちらも元の補間と同じ値になる)
+        '''
+        self.Cd0_table_mach = np.asarray(self.Cd0_vs_Mach.x, dtype=float)
+        self.Cd0_table = self.Cd0_vs_Mach.y / self.Cd0_scale_basevalue
+        self.Clalpha_table_mach = np.asarray(self.Clalpha_vs_Mach.x, dtype=float)
+        self.Clalpha_table = self.Clalpha_vs_Mach.y / self.Clalpha_scale_basevalue
+        # スカラ評価用
+        self.__Cd0_x = self.Cd0_table_mach.tolist()
+        self.__Cd0_y = self.Cd0_table.tolist()
+        self.__Clalpha_x = self.Clalpha_table_mach.tolist()
+        self.__Clalpha_y = self.Clalpha_table.tolist()
+
+        # スプラインの節点(区間の境界)
+        tx, ty = self.CP_vs_MachAlpha.get_knots()
+        self.CP_breaks_mach = np.unique(tx)
+        self.CP_breaks_alpha = np.unique(ty)
+        n_mach = len(self.CP_breaks_mach) - 1
+        n_alpha = len(self.CP_breaks_alpha) - 1
+
+        # 各区間内で4x4点の値から c[k, l] * dm^k * da^l の係数を求める
+        s = np.linspace(0., 1., 4)
+        V = np.vander(s, 4, increasing=True)
+        V_inv = np.linalg.inv(V)
+        self.CP_poly = np.empty((n_mach, n_alpha, 4, 4))
+        for i in range(n_mach):
+            m0, m1 = self.CP_breaks_mach[i:i+2]
+            for j in range(n_alpha):
+                a0, a1 = self.CP_breaks_alpha[j:j+2]
+                values = self.CP_vs_MachAlpha(m0 + (m1-m0)*s, a0 + (a1-a0)*s)
+                coef = V_inv @ values @ V_inv.T
+                # 正規化座標から物理座標(区間始点からの差)の係数に変換
+                scale = np.outer((m1-m0)**-np.arange(4.), (a1-a0)**-np.arange(4.))
+                self.CP_poly[i, j] = coef * scale / self.CP_scale_basevalue
+        self.__CP_mach_x = self.CP_breaks_mach.tolist()
+        self.__CP_alpha_x = self.CP_breaks_alpha.tolist()
+        self.__CP_poly = self.CP_poly.tolist()
+
+    def coefficients(self, mach, AoA, Cd0_scale=1.0, Clalpha_scale=1.0, CP_scale=1.0):
+        '''
+        Cd, Cl, CPを一度に求める高速評価
+        Cd(), Cl(), CP()と(丸め誤差の範囲で)同じ値を返す.
+        マッハ数, 迎角がデータ範囲外の場合は端の値を使用する
+        INPUT
+            mach, AoA: マッハ数, 迎角[rad] (スカラまたは配列)
+            Cd0_scale, Clalpha_scale, CP_scale: Cd0(), Clalpha(), CP()のscaleと同じ
+        OUTPUT
+            (Cd, Cl, CP)
+        '''
+        if np.ndim(mach) == 0 and np.ndim(AoA) == 0:
+            mach = float(mach)
+            AoA = float(AoA)
+            Cd0 = _interp_scalar(self.__Cd0_x, self.__Cd0_y, mach) * Cd0_scale
+            Clalpha = _interp_scalar(self.__Clalpha_x, self.__Clalpha_y, mach) * Clalpha_scale
+            Cl = Clalpha * 0.5 * math.sin(2*AoA)
+            Cd = Cd0 + self.Cd_amplitude * (math.cos(2*AoA + math.pi) + 1.0)
+
+            xm = self.__CP_mach_x
+            xa = self.__CP_alpha_x
+            mach = min(max(mach, xm[0]), xm[-1])
+            AoA = min(max(AoA, xa[0]), xa[-1])
+            i = min(bisect.bisect_right(xm, mach), len(xm)-1) - 1
+            j = min(bisect.bisect_right(xa, AoA), len(xa)-1) - 1
+            dm = mach - xm[i]
+            da = AoA - xa[j]
+            CP = 0.
+            for c in reversed(self.__CP_poly[i][j]):
+                CP = CP * dm + (c[0] + da*(c[1] + da*(c[2] + da*c[3])))
+            return Cd, Cl, CP * CP_scale
+
+        mach = np.asarray(mach, dtype=float)
+        AoA = np.asarray(AoA, dtype=float)
+        Cd0 = np.interp(mach, self.Cd0_table_mach, self.Cd0_table) * Cd0_scale
+        Clalpha = np.interp(mach, self.Clalpha_table_mach, self.Clalpha_table) * Clalpha_scale
+        Cl = Clalpha * 0.5 * np.sin(2*AoA)
+        Cd = Cd0 + self.Cd_amplitude * (np.cos(2*AoA + np.pi) + 1.0)
+
+        xm = self.CP_breaks_mach
+        xa = self.CP_breaks_alpha
+        mach, AoA = np.broadcast_arrays(np.clip(mach, xm[0], xm[-1]), np.clip(AoA, xa[0], xa[-1]))
+        i = np.clip(np.searchsorted(xm, mach, side='right') - 1, 0, len(xm)-2)
+        j = np.clip(np.searchsorted(xa, AoA, side='right') - 1, 0, len(xa)-2)
+        dm = mach - xm[i]
+        da = AoA - xa[j]
+        c = self.CP_poly[i, j]  # (..., 4, 4)
+        poly_a = c[..., 0] + da[..., np.newaxis]*(c[..., 1] + da[..., np.newaxis]*(c[..., 2] + da[..., np.newaxis]*c[..., 3]))
+        CP = poly_a[..., 0] + dm*(poly_a[..., 1] + dm*(poly_a[..., 2] + dm*poly_a[..., 3]))
+        return Cd, Cl, CP * CP_scale
+
     def CP(self, mach, AoA, scale=1.0):
-        return float(self.CP_vs_MachAlpha(mach, AoA)) * (scale/self.CP_scale_basevalue)
+        return float(self.CP_vs_MachAlpha(mach, AoA)) * scale / self.CP_scale_basevalue
     
     def Clalpha(self, mach, scale=1.0):
         return self.Clalpha_vs_Mach(mach) * (scale/self.Clalpha_scale_basevalue)
@@ -196,4 +332,14 @@ class _StandardAeroCoeff:
         _Cd = Cd0 + self.Cd_amplitude * (np.cos(2*AoA + np.pi) + 1.0)
         return _Cd
 
+def _interp_scalar(xp, fp, x):
+    # np.interpと同じ(範囲外は端の値)スカラ版の線形補間
+    if x <= xp[0]:
+        return fp[0]
+    elif x >= xp[-1]:
+        return fp[-1]
+    i = bisect.bisect_right(xp, x) - 1
+    return fp[i] + (fp[i+1] - fp[i]) * (x - xp[i]) / (xp[i+1] - xp[i])
+
+
 standard_aero_coeff = _StandardAeroCoeff()
\ No newline at end of file
@@ -0,0 +1,94 @@
+# -*- coding:utf-8 -*-
+import numpy as np
+from .attitude import dcm
+
+'''
+シミュレーション結果の弾道履歴から飛行中の諸量の時間履歴を一括で求めるスクリプト
+'''
+
+
+def flight_analytics(rocket, t, x, v, q, omega):
+    '''
+    弾道履歴全体から対気速度, 動圧, マッハ数, 迎角, 加速度, 安定余裕などの時間履歴を
+    配列演算でまとめて求める
+    INPUT
+        rocket: シミュレーションに使用したRocket(風と大気モデル, 重量特性を参照する)
+        t, x, v, q, omega: simulate()の弾道履歴(x, v, omegaは(3, N), qは(4, N))
+    OUTPUT
+        配列のDict(スカラ量は(N,), ベクトル量は(3, N))
+        speed: 対地速度 [m/s]
+        v_air: 機体座標系での相対風ベクトル [m/s]
+        airspeed: 対気速度 [m/s]
+        Q: 動圧(対気速度による) [Pa]
+        mach: マッハ数(対気速度による)
+        alpha: 迎角 [rad]
+        T, p, rho, sound_speed: 大気の温度[K], 圧力[Pa], 密度[kg/m^3], 音速[m/s]
+        acceleration: 地球座標系での加速度(速度の数値微分) [m/s^2]
+        CG, CP: ノーズ先端からの重心, 圧力中心位置 [m]
+        static_margin: 安定余裕 (CP - CG)/機体直径
+    '''
+    t = np.asarray(t, dtype=float)
+    result = air_data(rocket, x, v, q)
+    v_local = np.einsum('nji,jn->in', dcm(np.asarray(q, dtype=float).T), np.asarray(v, dtype=float))
+
+    # 同じ時刻が重複する点(区間の境界)は一つにまとめて微分する
+    acceleration = np.zeros_like(v_local)
+    t_unique, index, inverse = np.unique(t, return_index=True, return_inverse=True)
+    if len(t_unique) > 1:
+        acceleration = np.gradient(v_local[:, index], t_unique, axis=1)[:, inverse]
+
+    _, CG, _, _ = rocket.getMassProperties(t)
+    _, _, CP = rocket.getAeroCoeffs(result['mach'], result['alpha'])
+
+    result.update({
+        'acceleration': acceleration,
+        'CG': CG,
+        'CP': CP,
+        'static_margin': (CP - CG) / rocket.diameter
+    })
+    return result
+
+
+def air_data(rocket, x, v, q):
+    '''
+    弾道履歴全体の対気速度, 動圧, マッハ数, 迎角と大気の状態を配列演算でまとめて求める
+    (simulate()のMaxQ, MaxMach, MaxVの導出にも使用する)
+    INPUT
+        rocket: シミュレーションに使用したRocket(風と大気モデルを参照する)
+        x, v, q: simulate()の弾道履歴(x, vは(3, N), qは(4, N))
+    OUTPUT
+        配列のDict(flight_analytics()のspeed, v_air, airspeed, Q, mach, alpha, T, p, rho, sound_speed)
+    '''
+    x = np.asarray(x, dtype=float)
+    v = np.asarray(v, dtype=float)
+    q = np.asarray(q, dtype=float)
+    h = x[2]
+
+    # 局所座標系→機体座標系の変換行列 (N, 3, 3)
+    Tbl = dcm(q.T)
+    speed = np.linalg.norm(v, axis=0)
+
+    # 風は各点の高度で直接評価する
+    # (べき法則は地表付近の勾配が大きく, 高度テーブルの補間では誤差が大きい)
+    wind = np.asarray(rocket.air.wind.wind(h), dtype=float).T
+    v_air = -v + np.einsum('nij,jn->in', Tbl, wind)
+    airspeed = np.linalg.norm(v_air, axis=0)
+    safe_airspeed = np.where(airspeed == 0, 1.0, airspeed)
+    alpha = np.where(
+                airspeed == 0,
+                0.0,
+                np.arccos(np.clip(np.abs(v_air[0])/safe_airspeed, 0.0, 1.0)))
+
+    T, p, rho, sound_speed = rocket.air.standard_air(h)
+    return {
+        'speed': speed,
+        'v_air': v_air,
+        'airspeed': airspeed,
+        'Q': 0.5 * rho * airspeed**2,
+        'mach': airspeed / sound_speed,
+        'alpha': alpha,
+        'T': T,
+        'p': p,
+        'rho': rho,
+        'sound_speed': sound_speed
+    }
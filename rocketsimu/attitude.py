@@ -0,0 +1,95 @@
+# -*- coding:utf-8 -*-
+import numpy as np
+
+'''
+姿勢(クオータニオン)の運動学をnumpy配列のみで計算する関数をまとめたスクリプト
+
+クオータニオンは [w, x, y, z] の順の配列で表す. 各関数は (4,) の単一のクオータニオンと
+(N, 4) などの配列の両方を受け付ける(末尾の軸が成分)
+'''
+
+# ノルム保存の補正項のゲイン [1/s]
+# dq/dt に NORM_GAIN*(1 - |q|^2)*q を加え, 積分誤差によるノルムのずれを1に引き戻す.
+# 陽的解法の安定性を損なわないよう, 降下中の大きな刻み幅に対しても十分小さい値とする
+NORM_GAIN = 0.1
+
+
+def dcm(q):
+    '''
+    クオータニオンから局所座標系→機体座標系の変換行列Tblを求める
+    (quaternion.as_rotation_matrix(np.conj(q))と等価. qは正規化されていなくてもよい)
+    INPUT
+        q: (4,) または (..., 4)
+    OUTPUT
+        (3, 3) または (..., 3, 3)
+    '''
+    q = np.asarray(q, dtype=float)
+    if q.ndim == 1:
+        # 単一のクオータニオンはfloatのまま計算する(運動方程式の1回の評価で使用)
+        w, x, y, z = q.tolist()
+        s = 2.0 / (w*w + x*x + y*y + z*z)
+        return np.array([
+            [1.0 - s*(y*y + z*z), s*(x*y + w*z), s*(x*z - w*y)],
+            [s*(x*y - w*z), 1.0 - s*(x*x + z*z), s*(y*z + w*x)],
+            [s*(x*z + w*y), s*(y*z - w*x), 1.0 - s*(x*x + y*y)]
+        ])
+
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    s = 2.0 / np.sum(q**2, axis=-1)
+    R = np.empty(q.shape[:-1] + (3, 3))
+    R[..., 0, 0] = 1.0 - s*(y*y + z*z)
+    R[..., 0, 1] = s*(x*y + w*z)
+    R[..., 0, 2] = s*(x*z - w*y)
+    R[..., 1, 0] = s*(x*y - w*z)
+    R[..., 1, 1] = 1.0 - s*(x*x + z*z)
+    R[..., 1, 2] = s*(y*z + w*x)
+    R[..., 2, 0] = s*(x*z + w*y)
+    R[..., 2, 1] = s*(y*z - w*x)
+    R[..., 2, 2] = 1.0 - s*(x*x + y*y)
+    return R
+
+
+def quaternion_derivative(q, omega, gain=NORM_GAIN):
+    '''
+    機体座標系の角速度omegaに対するクオータニオンの時間微分
+        dq/dt = 0.5 * q * (0, omega) + gain * (1 - |q|^2) * q
+    第2項はノルムを1に保つための補正項(|q| = 1のときは0)
+    INPUT
+        q: (4,) または (..., 4)
+        omega: (3,) または (..., 3)
+        gain: 補正項のゲイン [1/s]. 0で補正しない
+    OUTPUT
+        (4,) または (..., 4)
+    '''
+    q = np.asarray(q, dtype=float)
+    omega = np.asarray(omega, dtype=float)
+    if q.ndim == 1 and omega.ndim == 1:
+        w, x, y, z = q.tolist()
+        a, b, c = omega.tolist()
+        k = gain * (1.0 - (w*w + x*x + y*y + z*z))
+        return np.array([
+            0.5*(-x*a - y*b - z*c) + k*w,
+            0.5*(w*a + y*c - z*b) + k*x,
+            0.5*(w*b + z*a - x*c) + k*y,
+            0.5*(w*c + x*b - y*a) + k*z
+        ])
+
+    w, x, y, z = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    a, b, c = omega[..., 0], omega[..., 1], omega[..., 2]
+    k = gain * (1.0 - np.sum(q**2, axis=-1))
+    return np.stack((
+        0.5*(-x*a - y*b - z*c) + k*w,
+        0.5*(w*a + y*c - z*b) + k*x,
+        0.5*(w*b + z*a - x*c) + k*y,
+        0.5*(w*c + x*b - y*a) + k*z
+    ), axis=-1)
+
+
+def normalize(q):
+    '''
+    クオータニオンを単位クオータニオンに射影する
+    INPUT
+        q: (4,) または (..., 4)
+    '''
+    q = np.asarray(q, dtype=float)
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
@@ -0,0 +1,576 @@
+import numpy as np
+import quaternion
+from .rocket import Rocket
+from .air import standard_aero_coeff
+from .attitude import dcm, quaternion_derivative, normalize
+from .wind import wind_altitude_grid
+
+'''
+複数機体(アンサンブル)の弾道を(N, 13)の状態量配列として同時に積分するモジュール
+落下分散解析やモンテカルロ解析で用いる
+'''
+
+# Dormand-Prince 5(4) の係数
+_C = np.array([0., 1./5., 3./10., 4./5., 8./9., 1.])
+_A = [
+    [],
+    [1./5.],
+    [3./40., 9./40.],
+    [44./45., -56./15., 32./9.],
+    [19372./6561., -25360./2187., 64448./6561., -212./729.],
+    [9017./3168., -355./33., 46732./5247., 49./176., -5103./18656.]
+]
+_B = np.array([35./384., 0., 500./1113., 125./192., -2187./6784., 11./84.])
+_E = np.array([
+    71./57600., 0., -71./16695., 71./1920., -17253./339200., 22./525., -1./40.
+])
+
+# イベントの種類(処理順)
+EVENT_LABELS = ('1stlug_off', '2ndlug_off', 'MECO', 'apogee', 'drogue', 'para', 'landing')
+
+
+class BatchTrajectorySolver:
+    '''
+    N機のロケットを(N, 13)の状態量配列で同時に積分するソルバ
+
+    各メンバは基準となるRocketのパラメータを共有し,
+    風モデル, Cd0スケール, 乾燥重量, ランチャ仰角をメンバ毎に指定できる.
+    飛行フェーズはメンバ毎の配列で保持し, 一回のRHS評価で全メンバを進める.
+    時間刻みは全メンバ共通の適応刻み(Dormand-Prince 5(4))とし,
+    フェーズ遷移はステップ内の根探索で求めた時刻でまとめて処理する.
+    '''
+    def __init__(
+            self,
+            rocket:Rocket,
+            n=None,
+            winds=None,
+            Cd0_scale=1.0,
+            mass_dry=None,
+            elev_angle=None,
+            dt=0.05,
+            max_t=1000.0,
+            cons_out=True,
+            rtol=1e-6,
+            atol=1e-8,
+            event_tol=None,
+            wind_dh=20.0,
+            wind_h_max=20000.0,
+            record=False):
+        '''
+        INPUT
+            rocket: 基準となる組み立て済みのRocket
+                (engine, parachute, launcher, enviroment, airが設定されていること)
+            n: メンバ数. 省略時はwinds, 各パラメータ配列の長さから決定
+            winds: メンバ毎のWindインスタンスのリスト. 省略時はrocket.air.windを共有
+            Cd0_scale: Cd0に掛けるスケール(スカラまたは長さNの配列)
+            mass_dry: 乾燥重量[kg](スカラまたは長さNの配列). 省略時はrocket.mass_dry
+            elev_angle: ランチャ仰角[deg](スカラまたは長さNの配列). 省略時はランチャの値
+            dt: 初期時間刻み. dt/10から積分を開始する
+            event_tol: 同時刻とみなして一括処理するイベント時刻の幅[s]. 省略時はdt/10
+            wind_dh, wind_h_max: 風の高度テーブルの刻み(高度1000m以上)と上限高度[m]
+                (風モデルが固有の刻みを持つ場合はそれ以下とする. wind.wind_altitude_gridを参照)
+            record: Trueの場合, 受理したステップ毎の状態量を保持する
+        '''
+        self.rocket = rocket
+        self.dt = dt
+        self.max_t = max_t
+        self.cons = cons_out
+        self.rtol = rtol
+        self.atol = atol
+        self.event_tol = dt/10 if event_tol is None else event_tol
+        self.record = record
+
+        sizes = [np.size(a) for a in (Cd0_scale, mass_dry, elev_angle) if a is not None]
+        if winds is not None:
+            sizes.append(len(winds))
+        if n is None:
+            n = max(sizes + [1])
+        self.n = n
+
+        def broadcast(value, default):
+            if value is None:
+                value = default
+            return np.broadcast_to(np.asarray(value, dtype=float), (n,)).copy()
+
+        launcher = rocket.launcher
+        engine = rocket.engine
+
+        self.Cd0 = rocket.Cd0 * broadcast(Cd0_scale, 1.0)
+        self.mass_dry = broadcast(mass_dry, rocket.mass_dry)
+        self.elevation = np.deg2rad(broadcast(elev_angle, np.rad2deg(launcher.elevation)))
+
+        # 初期姿勢とラグオフ高度(仰角と乾燥重量に依存)
+        mass_prop_init = engine.propProperties(0.0)[0]
+        CG_init = (rocket.CG_dry*self.mass_dry + rocket.CG_prop*mass_prop_init) /\
+                    (self.mass_dry + mass_prop_init)
+        self.height_1stlug_off =\
+            (launcher.length - (CG_init - rocket.lug_1st)) * np.sin(self.elevation)
+        self.height_2ndlug_off =\
+            (launcher.length + (rocket.lug_2nd - CG_init)) * np.sin(self.elevation)
+
+        angle_z = np.pi/2 - launcher.azimuth
+        angle_y = -self.elevation
+        cz, sz = np.cos(angle_z/2.0), np.sin(angle_z/2.0)
+        cy, sy = np.cos(angle_y/2.0), np.sin(angle_y/2.0)
+        self.q0 = np.c_[cz*cy, -sz*sy, cz*sy, sz*cy]
+
+        # パラシュート展開条件
+        self.has_drogue = rocket.hasDroguechute()
+        self.drogue_triggers = rocket.droguechute.getTriggers() if self.has_drogue else None
+        self.para_triggers = rocket.parachute.getTriggers()
+
+        # 風テーブル (N, n_h, 3)
+        # べき法則風は地表付近で勾配が大きいため, 低高度ほど細かい刻みとする
+        self.__wind_h = wind_altitude_grid(
+                            rocket.air.wind if winds is None else winds, wind_dh, wind_h_max)
+        if winds is None:
+            table = np.asarray(rocket.air.wind.wind(self.__wind_h), dtype=float)
+            self.__wind_table = np.broadcast_to(table, (n,) + table.shape)
+        else:
+            cache = {}
+            tables = []
+            for w in winds:
+                if id(w) not in cache:
+                    cache[id(w)] = np.asarray(w.wind(self.__wind_h), dtype=float)
+                tables.append(cache[id(w)])
+            self.__wind_table = np.array(tables)
+
+        self.rocket_xarea = (rocket.diameter/2)**2 * np.pi
+        self.solver_logs = []
+
+    # ----------------------------
+    #    Integration
+    # ----------------------------
+    def solve(self):
+        '''
+        全メンバが着地するかmax_tに達するまで積分する
+        OUTPUT
+            メンバ毎のイベントログ(TrajectorySolver.solver_logと同形式)のリスト
+        '''
+        n = self.n
+        t = 0.0
+        u = np.zeros((n, 13))
+        u[:, 6:10] = self.q0
+        self.phase = np.ones(n)
+        self.t_apogee = np.full(n, np.nan)
+        self.__events = {
+            label: (np.full(n, np.nan), np.full((n, 13), np.nan)) for label in EVENT_LABELS
+        }
+        self.__extrema = {
+            name: {
+                'value': np.full(n, -np.inf), 't': np.zeros(n), 'u': np.zeros((n, 13)), 'airspeed': np.zeros(n)
+            }
+            for name in ('MaxQ', 'MaxMach', 'MaxV')
+        }
+        self.t_history = []
+        self.u_history = []
+
+        h = self.dt / 10
+        f = None
+        self.__apply_immediate_transitions(t, u)
+        while t < self.max_t and not (self.phase == 5).all():
+            if f is None:
+                f = self.__f_main(t, u)
+            h = min(h, self.max_t - t)
+            t_new, u_new, f_new, h_next = self.__step(t, u, f, h)
+
+            t_event, label_members = self.__locate_events(t, u, f, t_new, u_new, f_new)
+            if t_event is None:
+                t, u, f, h = t_new, u_new, f_new, h_next
+                self.__update_extrema(t, u)
+                continue
+
+            # 最も早いイベント時刻まで戻り, 該当メンバの遷移を処理して積分を再開する
+            u_event = _hermite(t, u, f, t_new, u_new, f_new, t_event)
+            for label, members in label_members:
+                self.__handle_event(label, members, t_event, u_event)
+            t, u = t_event, u_event
+            # 積分の再開点でクオータニオンを単位クオータニオンに射影する
+            u[:, 6:10] = normalize(u[:, 6:10])
+            self.__apply_immediate_transitions(t, u)
+            self.__update_extrema(t, u)
+            f = None
+            h = max(h_next, self.dt/10)
+
+        if self.cons:
+            print('------------------')
+            print('batch solve finished at t=', t, '[s]')
+            print('landed:', int((self.phase == 5).sum()), '/', n)
+
+        self.u_final = u
+        self.solver_logs = self.__build_logs()
+        return self.solver_logs
+
+    def __step(self, t, u, f, h):
+        active = self.phase != 5
+        while True:
+            k = [f]
+            for i in range(1, 6):
+                du = sum(a * k_j for a, k_j in zip(_A[i], k))
+                k.append(self.__f_main(t + _C[i]*h, u + h*du))
+            u_new = u + h * sum(b * k_j for b, k_j in zip(_B, k))
+            f_new = self.__f_main(t + h, u_new)
+            k.append(f_new)
+
+            err = h * sum(e * k_j for e, k_j in zip(_E, k))
+            scale = self.atol + self.rtol * np.maximum(np.abs(u), np.abs(u_new))
+            err_member = np.sqrt(np.mean((err/scale)**2, axis=1))
+            err_norm = np.max(err_member[active]) if active.any() else 0.0
+
+            if err_norm <= 1.0:
+                factor = 10.0 if err_norm == 0.0 else min(10.0, 0.9 * err_norm**(-0.2))
+                return t + h, u_new, f_new, h * factor
+            h *= max(0.2, 0.9 * err_norm**(-0.2))
+
+    # ----------------------------
+    #    Events
+    # ----------------------------
+    def __event_values(self, t, u):
+        '''
+        各イベントの判定関数値(正で成立)を返す. 無効なメンバは-inf
+        tはスカラまたは長さNの配列
+        '''
+        phase = self.phase
+        z = u[:, 2]
+        t = np.broadcast_to(t, z.shape)
+        apogee_reached = ~np.isnan(self.t_apogee)
+        cutoff_time = self.rocket.engine.thrust_cutoff_time
+        startup_time = self.rocket.engine.thrust_startup_time
+
+        inactive = np.full(z.shape, -np.inf)
+        values = {}
+        values['1stlug_off'] = np.where(phase == 1, z - self.height_1stlug_off, inactive)
+        values['2ndlug_off'] = np.where(phase == 1.1, z - self.height_2ndlug_off, inactive)
+        values['MECO'] = np.where(phase <= 2, t - cutoff_time, inactive)
+
+        Tbl = dcm(u[:, 6:10])
+        vz = np.einsum('nji,nj->ni', Tbl, u[:, 3:6])[:, 2]
+        values['apogee'] = np.where(~apogee_reached & (phase < 5), -vz, inactive)
+
+        if self.has_drogue:
+            values['drogue'] = np.where(
+                phase == 3, self.__trigger_value(self.drogue_triggers, t, z), inactive)
+            para_active = (phase == 3.5)
+        else:
+            values['drogue'] = inactive
+            para_active = (phase == 3)
+        values['para'] = np.where(
+            para_active, self.__trigger_value(self.para_triggers, t, z), inactive)
+
+        values['landing'] = np.where(
+            (phase > 1) & (phase < 5) & (t > startup_time), -z, inactive)
+        return values
+
+    def __trigger_value(self, triggers, t, z):
+        t_flight, t_falling, alt = triggers
+        value = np.full(z.shape, -np.inf)
+        apogee_reached = ~np.isnan(self.t_apogee)
+        if t_flight is not None:
+            value = np.maximum(value, t - t_flight)
+        if t_falling is not None:
+            value = np.maximum(value, np.where(
+                apogee_reached, t - self.t_apogee - t_falling, -np.inf))
+        if alt is not None:
+            value = np.maximum(value, np.where(apogee_reached, alt - z, -np.inf))
+        return value
+
+    def __locate_events(self, t0, u0, f0, t1, u1, f1):
+        g0 = self.__event_values(t0, u0)
+        g1 = self.__event_values(t1, u1)
+
+        roots = {}
+        for label in EVENT_LABELS:
+            crossed = (g0[label] <= 0.0) & (g1[label] > 0.0)
+            if crossed.any():
+                roots[label] = (crossed, self.__find_root(
+                    label, crossed, t0, u0, f0, t1, u1, f1, g0[label], g1[label]))
+        if len(roots) == 0:
+            return None, None
+
+        t_min = min(np.min(r[crossed]) for crossed, r in roots.values())
+        t_window = t_min + self.event_tol
+        t_event = max(np.max(r[crossed & (r <= t_window)], initial=t_min) for crossed, r in roots.values())
+
+        label_members = []
+        for label in EVENT_LABELS:
+            if label in roots:
+                crossed, r = roots[label]
+                members = crossed & (r <= t_window)
+                if members.any():
+                    label_members.append((label, members))
+        return t_event, label_members
+
+    def __find_root(self, label, crossed, t0, u0, f0, t1, u1, f1, g0, g1, n_iter=8):
+        # 密出力(エルミート補間)上でのはさみうち法(Illinois法)
+        a = np.full(self.n, t0)
+        b = np.full(self.n, t1)
+        ga = np.where(crossed, g0, -1.0)
+        gb = np.where(crossed, g1, 1.0)
+        side = np.zeros(self.n)
+        for _ in range(n_iter):
+            tm = np.clip((a*gb - b*ga) / (gb - ga), a, b)
+            um = _hermite(t0, u0, f0, t1, u1, f1, tm)
+            gm = self.__event_values(tm, um)[label]
+            right = crossed & (gm > 0.0)
+            left = crossed & ~right
+            # 同じ側の端点が続けて残った場合は反対側の関数値を半分にする
+            ga = np.where(right & (side > 0), ga/2, ga)
+            gb = np.where(left & (side < 0), gb/2, gb)
+            b = np.where(right, tm, b)
+            gb = np.where(right, gm, gb)
+            a = np.where(left, tm, a)
+            ga = np.where(left, gm, ga)
+            side = np.where(right, 1.0, np.where(left, -1.0, side))
+        return np.clip((a*gb - b*ga) / (gb - ga), a, b)
+
+    def __handle_event(self, label, members, t, u):
+        t_log, u_log = self.__events[label]
+        t_log[members] = t
+        u_log[members] = u[members]
+
+        if label == '1stlug_off':
+            self.phase[members] = 1.1
+        elif label == '2ndlug_off':
+            self.phase[members] = 2
+        elif label == 'MECO':
+            self.phase[members] = 3
+        elif label == 'apogee':
+            self.t_apogee[members] = t
+        elif label == 'drogue':
+            self.phase[members] = 3.5
+        elif label == 'para':
+            self.phase[members] = 4
+        elif label == 'landing':
+            self.phase[members] = 5
+
+    def __apply_immediate_transitions(self, t, u):
+        # 遷移点で既に成立している条件を順に処理する
+        changed = True
+        while changed:
+            changed = False
+            values = self.__event_values(t, u)
+            for label in EVENT_LABELS:
+                if label == 'MECO':
+                    members = values[label] >= 0.0
+                else:
+                    members = values[label] > 0.0
+                if members.any():
+                    self.__handle_event(label, members, t, u)
+                    changed = True
+                    break
+
+    def __update_extrema(self, t, u):
+        if self.record:
+            self.t_history.append(t)
+            self.u_history.append(u.copy())
+
+        active = self.phase != 5
+        # 極値は対気速度から求める(simulate()と同じ)
+        v_air = -u[:, 3:6] + np.einsum('nij,nj->ni', dcm(u[:, 6:10]), self.__wind(u[:, 2]))
+        airspeed = np.linalg.norm(v_air, axis=1)
+        T, p, rho, a = self.rocket.air.standard_air(u[:, 2])
+        values = {
+            'MaxQ': 0.5 * rho * airspeed**2,
+            'MaxMach': airspeed / a,
+            'MaxV': airspeed
+        }
+        for name, value in values.items():
+            ext = self.__extrema[name]
+            update = active & (value > ext['value'])
+            ext['value'][update] = value[update]
+            ext['t'][update] = t
+            ext['u'][update] = u[update]
+            ext['airspeed'][update] = airspeed[update]
+
+    def __build_logs(self):
+        logs = []
+        for i in range(self.n):
+            log = {}
+            for label in EVENT_LABELS:
+                t_log, u_log = self.__events[label]
+                if not np.isnan(t_log[i]):
+                    log[label] = _state_dict(t_log[i], u_log[i])
+
+            for name, ext in self.__extrema.items():
+                t = ext['t'][i]
+                u = ext['u'][i]
+                T, p, rho, a = self.rocket.air.standard_air(u[2])
+                airspeed = ext['airspeed'][i]
+                log[name] = {
+                    'Q': 0.5 * rho * airspeed**2,
+                    't': t,
+                    'p': p,
+                    'T': T,
+                    'mach': airspeed / a
+                }
+                if name == 'MaxV':
+                    log[name]['speed'] = airspeed
+                    log[name]['ground_speed'] = np.linalg.norm(u[3:6])
+            logs.append(log)
+        return logs
+
+    # ----------------------------
+    #    Dynamics
+    # ----------------------------
+    def __wind(self, h):
+        wind_h = self.__wind_h
+        h = np.clip(h, wind_h[0], wind_h[-1])
+        idx = np.clip(np.searchsorted(wind_h, h, side='right') - 1, 0, len(wind_h) - 2)
+        frac = ((h - wind_h[idx]) / (wind_h[idx + 1] - wind_h[idx]))[:, np.newaxis]
+        members = np.arange(self.n)
+        w0 = self.__wind_table[members, idx]
+        w1 = self.__wind_table[members, idx + 1]
+        return w0 + (w1 - w0) * frac
+
+    def __mass_properties(self, t):
+        '''
+        メンバ毎の乾燥重量に対する重量・重心・慣性モーメントとその時間微分
+        (Rocket.getMassPropertiesと同じ計算)
+        '''
+        rocket = self.rocket
+        prop = rocket.engine.propProperties(t)
+        mass_prop = prop[0]
+        MOI_prop = prop[1:4]
+        dmass_prop = prop[4]
+        dMOI_prop = prop[5:8]
+
+        mass = self.mass_dry + mass_prop
+        CG = (rocket.CG_dry*self.mass_dry + rocket.CG_prop*mass_prop) / mass
+        dCG = dmass_prop * (rocket.CG_prop - CG) / mass
+
+        yz_unit = np.array([0, 1.0, 1.0])
+        d_dry = (CG - rocket.CG_dry)[:, np.newaxis]
+        d_prop = (CG - rocket.CG_prop)[:, np.newaxis]
+        dCG = dCG[:, np.newaxis]
+        MOI = rocket.MOI_dry + self.mass_dry[:, np.newaxis]*d_dry**2 * yz_unit +\
+                MOI_prop + mass_prop*d_prop**2 * yz_unit
+        dMOI_dt = 2*self.mass_dry[:, np.newaxis]*d_dry*dCG * yz_unit +\
+                dMOI_prop + (dmass_prop*d_prop**2 + 2*mass_prop*d_prop*dCG) * yz_unit
+        return mass, CG, MOI, dMOI_dt
+
+    def __f_main(self, t, u):
+        rocket = self.rocket
+        env = rocket.enviroment
+        phase = self.phase
+
+        x = u[:, 0:3]
+        v = u[:, 3:6]
+        q = u[:, 6:10]
+        omega = u[:, 10:13]
+
+        Tbl = dcm(q)
+        dx_dt = np.einsum('nji,nj->ni', Tbl, v)
+
+        mass, CG, MOI, dMOI_dt = self.__mass_properties(t)
+
+        v_air = -v + np.einsum('nij,nj->ni', Tbl, self.__wind(x[:, 2]))
+        v_air_norm = np.linalg.norm(v_air, axis=1)
+        safe_norm = np.where(v_air_norm == 0, 1.0, v_air_norm)
+        alpha = np.where(v_air_norm == 0, 0.0, np.arccos(np.clip(np.abs(v_air[:, 0])/safe_norm, 0.0, 1.0)))
+        phi = np.arctan2(-v_air[:, 1], -v_air[:, 2])
+        _, _, rho, sound_speed = self.rocket.air.standard_air(x[:, 2])
+        mach = v_air_norm / sound_speed
+
+        # 係数テーブルの範囲外は端の値となる(刻み幅の試行中に範囲外を参照してもよい)
+        Cd, Cl, CP = standard_aero_coeff.coefficients(mach, alpha, self.Cd0, rocket.Clalpha, rocket.CP)
+
+        cosa = np.cos(alpha)
+        sina = np.sin(alpha)
+        air_coeff = np.stack((
+            -Cl*sina + Cd*cosa,
+            (Cl*cosa + Cd*sina)*np.sin(phi),
+            (Cl*cosa + Cd*sina)*np.cos(phi)
+        ), axis=1)
+        dynamic_force = 0.5 * rho * v_air_norm**2.0 * self.rocket_xarea
+        air_force = -dynamic_force[:, np.newaxis] * air_coeff
+
+        arm = np.zeros_like(x)
+        arm[:, 0] = CG - CP
+        air_moment = _cross(arm, air_force)
+        l = np.array([rocket.diameter, rocket.height, rocket.height])
+        air_moment += (0.25 * rho * v_air_norm * self.rocket_xarea)[:, np.newaxis] *\
+                        rocket.Cm * (l**2) * omega
+
+        g_body = np.einsum('nij,j->ni', Tbl, env.g(0.0))
+        omega_earth_body = np.einsum('nij,j->ni', Tbl, env.omega_earth_local)
+        coriolis = -2.0 * _cross(omega_earth_body, v)
+
+        thrust = np.zeros_like(x)
+        thrust[:, 0] = rocket.engine.thrust(t)
+        inv_mass = (1.0/mass)[:, np.newaxis]
+
+        # 推力飛行/慣性飛行
+        omega_cross_v = _cross(omega, v)
+        # (MECO以降はthrust=0)
+        dv_dt = -omega_cross_v + g_body + coriolis + (air_force + thrust)*inv_mass
+
+        # ランチャ拘束中: 機軸方向(正方向)のみ
+        rail = phase <= 1.1
+        if rail.any():
+            dv_rail = -omega_cross_v + g_body + (air_force + thrust)*inv_mass
+            dv_rail[:, 1:] = 0.
+            dv_rail[:, 0] = np.maximum(dv_rail[:, 0], 0.0)
+            dv_dt = np.where(rail[:, np.newaxis], dv_rail, dv_dt)
+
+        # パラシュート展開時
+        if self.has_drogue:
+            drogue = (phase == 3.5)[:, np.newaxis]
+            dv_drogue = g_body + coriolis + rocket.droguechute.DragForce(v_air, rho)*inv_mass
+            dv_dt = np.where(drogue, dv_drogue, dv_dt)
+        para = (phase == 4)[:, np.newaxis]
+        dv_para = g_body + coriolis + rocket.parachute.DragForce(v_air, rho)*inv_mass
+        dv_dt = np.where(para, dv_para, dv_dt)
+
+        # 姿勢 (パラシュート展開時は回転を無視)
+        deployed = (phase == 3.5) | (phase == 4)
+        omega_q = np.where(deployed[:, np.newaxis], 0.0, omega)
+        dq_dt = quaternion_derivative(q, omega_q)
+
+        # 角速度
+        lug = phase == 1.1
+        if lug.any():
+            lug2CG = np.zeros_like(x)
+            lug2CG[:, 0] = rocket.lug_2nd - CG
+            air_moment_2ndlug = air_moment + _cross(lug2CG, air_force)
+            grav_moment_2ndlug = _cross(lug2CG, mass[:, np.newaxis] * g_body)
+            air_moment = np.where(lug[:, np.newaxis], air_moment_2ndlug + grav_moment_2ndlug, air_moment)
+            MOI_lug = MOI + (mass * (rocket.lug_2nd - CG)**2)[:, np.newaxis] * np.array([0., 1., 1.])
+            MOI = np.where(lug[:, np.newaxis], MOI_lug, MOI)
+
+        domega_dt = (-_cross(omega, MOI*omega) - dMOI_dt*omega + air_moment) / (MOI + 1e-10)
+        fixed = (phase == 1) | deployed
+        domega_dt[fixed] = 0.0
+
+        du_dt = np.concatenate((dx_dt, dv_dt, dq_dt, domega_dt), axis=1)
+        du_dt[phase == 5] = 0.0
+        return du_dt
+
+
+def _cross(a, b):
+    # np.crossより軽量な(N, 3)配列同士の外積
+    return np.stack((
+        a[:, 1]*b[:, 2] - a[:, 2]*b[:, 1],
+        a[:, 2]*b[:, 0] - a[:, 0]*b[:, 2],
+        a[:, 0]*b[:, 1] - a[:, 1]*b[:, 0]
+    ), axis=1)
+
+
+def _hermite(t0, u0, f0, t1, u1, f1, t):
+    # 3次エルミート補間による密出力. tはスカラまたは長さNの配列
+    h = t1 - t0
+    theta = np.reshape((np.asarray(t) - t0) / h, (-1, 1))
+    h00 = (1 + 2*theta) * (1 - theta)**2
+    h10 = theta * (1 - theta)**2
+    h01 = theta**2 * (3 - 2*theta)
+    h11 = theta**2 * (theta - 1)
+    return h00*u0 + h10*h*f0 + h01*u1 + h11*h*f1
+
+
+def _state_dict(t, u):
+    return {
+        't': t,
+        'x': u[0:3].copy(),
+        'v': u[3:6].copy(),
+        'q': quaternion.as_quat_array(u[6:10].copy()),
+        'omega': u[10:13].copy()
+    }
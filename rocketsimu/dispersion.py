@@ -0,0 +1,197 @@
+# -*- coding:utf-8 -*-
+import os
+import functools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . import simulator
+from .vehicle import compile_parameters
+
+'''
+複数条件のシミュレーション(落下分散など)をプロセスプールで実行する関数をまとめたスクリプト
+
+基準パラメータはcompile_parameters()で一度だけ前処理(推力履歴の読み込みとフィルタ処理,
+重量特性テーブルの作成)し, 各ワーカープロセスには起動時に一度だけ渡す.
+各条件については基準パラメータから変更するキーのみ(case)をプロセス間で受け渡す.
+executor='thread'の場合は同じプロセス内のスレッドプールで計算し, 前処理結果をコピーせずに共有する.
+'''
+
+# イベントログから取り出す代表的な出力 (名前: ログから値を取り出す関数)
+# イベントが記録されていない場合(t_maxまでに着地しないなど)はKeyErrorとなり, log_outputsではNaNとする
+OUTPUTS = {
+    'landing_x': lambda log: log['landing']['x'][0],
+    'landing_y': lambda log: log['landing']['x'][1],
+    'apogee': lambda log: log['apogee']['x'][2],
+    'max_q': lambda log: log['MaxQ']['Q'],
+    'launch_clear_velocity': lambda log: np.linalg.norm(log['2ndlug_off']['v'])
+}
+
+# ワーカープロセス内で共有する前処理済みの基準機体
+_worker_vehicle = None
+
+
+def iter_dispersion(
+        parameters,
+        cases,
+        n_workers=None,
+        chunksize=1,
+        backend='python',
+        trajectory=True,
+        progress=None,
+        executor='process'):
+    '''
+    基準パラメータに条件ごとの変更(case)を適用したシミュレーションをプロセスプールで実行し,
+    終了した条件から順に結果を返すジェネレータ
+    INPUT
+        parameters: 基準となるロケットのパラメータ(Dict, ファイル名またはPreparedVehicle)
+        cases: 基準パラメータから変更するキーと値のDictの列(ジェネレータでもよい)
+            Dictはトップレベルのキーで上書きされる(wind_parametersなどは全体を指定する)
+        n_workers: ワーカープロセス数. 省略時はCPU数. 1の場合はプロセスプールを使わず同じプロセスで計算する
+        chunksize: 一度にワーカーへ渡す条件数
+        backend: 運動方程式の計算方法 'python' or 'numba' (TrajectorySolverを参照)
+        trajectory: Falseの場合は弾道履歴を返さずイベントログのみを返す
+        progress: 進捗の通知先. Trueの場合は標準出力に表示し,
+            関数の場合は progress(完了した条件数, 条件の総数 or None) を呼ぶ
+        executor: 'process'(プロセスプール) or 'thread'(スレッドプール).
+            スレッドでは積分器のPython部分がGILを保持するため, 並列化の効果は主に
+            numba backendの運動方程式(GILを解放する)の評価部分に限られる
+    OUTPUT
+        (case_id, result) を終了した順に返す. case_idはcasesでの順番(0始まり)
+        result: trajectory=Trueの場合は simulate() と同じタプル(t, x, v, q, omega, log),
+            Falseの場合はlogのみ
+    '''
+    if executor not in ('process', 'thread'):
+        raise ValueError('Invalid executor "'+str(executor)+'" was indicated.')
+    vehicle = compile_parameters(parameters)
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    n_total = len(cases) if hasattr(cases, '__len__') else None
+    if progress is True:
+        progress = _print_progress
+
+    n_done = 0
+    if n_workers == 1:
+        # プロセスの起動と(numba backendの)ワーカーでのコンパイルを省く
+        for case_id, case in enumerate(cases):
+            result = _run_case(vehicle, case, backend, trajectory)
+            n_done += 1
+            if progress:
+                progress(n_done, n_total)
+            yield case_id, result
+        return
+
+    chunks = _chunked(enumerate(cases), chunksize)
+    if executor == 'thread':
+        # スレッドは前処理済みの機体を直接参照する
+        pool = ThreadPoolExecutor(max_workers=n_workers)
+        run_chunk = functools.partial(_run_chunk, backend=backend, trajectory=trajectory, vehicle=vehicle)
+    else:
+        pool = ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(vehicle,))
+        run_chunk = functools.partial(_run_chunk, backend=backend, trajectory=trajectory)
+    with pool:
+        # 未処理の条件を一度に全て投入せず, ワーカー数の2倍程度のチャンクを保持する
+        pending = set()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < 2*n_workers:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    pending.add(pool.submit(run_chunk, chunk))
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for case_id, result in future.result():
+                    n_done += 1
+                    if progress:
+                        progress(n_done, n_total)
+                    yield case_id, result
+
+
+def run_dispersion(parameters, cases, **kwargs):
+    '''
+    iter_dispersionの結果をcasesの順に並べたリストで返す
+    (引数はiter_dispersionと同じ)
+    '''
+    results = dict(iter_dispersion(parameters, cases, **kwargs))
+    return [results[i] for i in range(len(results))]
+
+
+def wind_cases(parameters, speed_array, azimuth_array):
+    '''
+    風速と風向の全組み合わせのcaseを作成する(風速ごとに風向を回す順)
+    INPUT
+        parameters: 基準となるロケットのパラメータ(Dict, ファイル名またはPreparedVehicle)
+        speed_array: 基準高度での風速[m/s]の配列
+        azimuth_array: 風向[rad]の配列(北から時計回り, 風が吹いてくる方向)
+    OUTPUT
+        caseのリスト
+    '''
+    params = simulator._load_parameters(parameters)
+    cases = []
+    for speed in speed_array:
+        for azimuth in azimuth_array:
+            wind_parameters = dict(params['wind_parameters'])
+            wind_parameters['wind_std'] = [-speed * np.sin(azimuth), -speed * np.cos(azimuth), 0]
+            cases.append({'wind_parameters': wind_parameters})
+    return cases
+
+
+def log_outputs(logs, names):
+    '''
+    イベントログの列から出力を取り出す
+    INPUT
+        logs: イベントログのリスト
+        names: 出力の名前(OUTPUTSのキー)のリスト
+    OUTPUT
+        (ログの数, 出力の数). 記録されていないイベントの出力はNaN
+    '''
+    for name in names:
+        if name not in OUTPUTS:
+            raise ValueError('Invalid output "'+str(name)+'" was indicated.')
+    values = np.full((len(logs), len(names)), np.nan)
+    for i, log in enumerate(logs):
+        for j, name in enumerate(names):
+            try:
+                values[i, j] = OUTPUTS[name](log)
+            except KeyError:
+                pass
+    return values
+
+
+def _init_worker(vehicle):
+    global _worker_vehicle
+    _worker_vehicle = vehicle
+
+
+def _run_chunk(chunk, backend, trajectory, vehicle=None):
+    if vehicle is None:
+        vehicle = _worker_vehicle
+    return [(case_id, _run_case(vehicle, case, backend, trajectory)) for case_id, case in chunk]
+
+
+def _run_case(base_vehicle, case, backend, trajectory):
+    # 推力/重量特性に関係しないcaseでは前処理結果を共有する
+    vehicle = base_vehicle.replace(case)
+    result = simulator.simulate(vehicle, cons_out=False, backend=backend)
+    return result if trajectory else result[-1]
+
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _print_progress(n_done, n_total):
+    if n_total is None:
+        print('[dispersion] {} cases done'.format(n_done))
+    else:
+        print('[dispersion] {}/{} cases done'.format(n_done, n_total))
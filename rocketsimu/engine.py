@@ -5,11 +5,28 @@ __status__ = 'debug'
 __version__ = '0.0.1'
 __date__ = '09 Feb 2019'
 
+import os
+import io
+import re
+import hashlib
 import pandas as pd
 import numpy as np
 import json
+import bisect
 from .lpf import LPF
-from scipy.interpolate import interp1d
+
+# 推力ファイルの内容のハッシュ値のキャッシュ ((path, mtime, size) -> hash)
+_file_hash_cache = {}
+# 推力の前処理結果のキャッシュ (キー -> 配列のタプル)
+_thrust_cache = {}
+# 前処理結果をバイナリで保存するディレクトリ
+THRUST_CACHE_DIR = os.environ.get(
+    'ROCKETSIMU_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'rocketsimu'))
+# 前処理の内容を変更した場合は更新する(古いキャッシュを使用しないため)
+THRUST_CACHE_VERSION = 2
+# キャッシュに保存する配列(_preprocessThrustの戻り値の順)
+THRUST_CACHE_ARRAYS = ('thrust_time_array', 'thrust_array', 'impulse_array', 'sample_dt_array')
 
 class RocketEngine:
     '''
@@ -36,77 +53,207 @@ class RocketEngine:
         self.__MOI_init = self.__params['MOI_prop']
         self.__mass_init = self.__params['mass_prop']
 
-    def loadThrust(self, thrust_filename, thrust_dt, cutoff_freq=10.):
-        input_data = np.loadtxt(thrust_filename, comments=['$', '#', '%'], delimiter=',')
-        thrust_raw = input_data[:, 1]
+    def loadThrust(
+            self,
+            thrust_filename,
+            thrust_dt,
+            cutoff_freq=10.,
+            lpf_method='fft',
+            resample_tol=None,
+            resample_max_interval=1.0,
+            cache=True):
+        '''
+        推力履歴ファイルを読み込み, フィルタ処理と立ち上がり/カットオフの切り出しを行う
+        INPUT
+            thrust_filename: 時刻, 推力の2列のCSVファイル
+            thrust_dt: 推力データのサンプリング間隔 [s]
+            cutoff_freq: LPFのカットオフ周波数 [Hz]. 0以下の場合はフィルタ処理しない
+            lpf_method: LPFの方法 'fft' or 'sosfiltfilt' (lpf.LPFを参照)
+            resample_tol: 推力の折れ線近似の相対許容誤差. 指定した場合は推力の変化が大きい時刻に
+                点を集めて間引く(getResampleIndicesを参照). Noneの場合は全点を使用する
+            resample_max_interval: 間引く場合の点の間隔の最大値 [s]
+            cache: Trueの場合, 前処理結果(切り出し/間引き後の推力と力積)を
+                ファイルの内容, thrust_dt, cutoff_freq, lpf_method, 間引きの設定をキーとしてプロセス内と
+                THRUST_CACHE_DIRにバイナリ(npz)で保存し, 次回以降はそれを使用する
+        '''
         self.thrust_dt = thrust_dt
-        self.thrust_time_array = input_data[:, 0]
-
-        if cutoff_freq > 0:
-            # --------------------
-            #  LPF Filtering
-            # --------------------
-            # TODO: LPF処理を別ファイルにしているが
-            # 見やすさのためにここに直書きしたほうがいい
+        key = hashlib.sha1(json.dumps([
+                THRUST_CACHE_VERSION,
+                getFileHash(thrust_filename),
+                float(thrust_dt),
+                float(cutoff_freq),
+                lpf_method,
+                None if resample_tol is None else [float(resample_tol), float(resample_max_interval)]
+                ]).encode()).hexdigest()
 
-            # LPFメソッド: FFT -> cutoff -> IFFT
-            self.thrust_array = LPF(thrust_raw, self.thrust_dt, cutoff_freq)
-        else:
-            self.thrust_array = thrust_raw
-        self.thrust_array[self.thrust_array < 0.0] = 0.0
-
-        self.max_thrust = np.max(self.thrust_array)
-        
-        '''
-        self.thrust_startup_time = np.min(self.thrust_time_array[self.thrust_array >= self.max_thrust*0.01])
-        self.thrust_cutoff_time = np.max(self.thrust_time_array[self.thrust_array >= self.max_thrust*0.01])\
-                                    - self.thrust_startup_time
+        loaded = _thrust_cache.get(key) if cache else None
+        cache_filename = os.path.join(THRUST_CACHE_DIR, 'thrust_' + key + '.npz')
+        if loaded is None and cache and os.path.exists(cache_filename):
+            try:
+                with np.load(cache_filename) as npz:
+                    loaded = tuple(npz[name] for name in THRUST_CACHE_ARRAYS)
+            except Exception:
+                # 壊れたキャッシュは無視して読み込み直す
+                loaded = None
+            if loaded is not None:
+                _thrust_cache[key] = loaded
 
-        self.thrust_array = self.thrust_array[self.thrust_time_array >= self.thrust_startup_time]
-        self.thrust_time_array = self.thrust_time_array[self.thrust_time_array >= self.thrust_startup_time]
-        self.thrust_time_array -= self.thrust_time_array[0]
-        '''
+        if loaded is None:
+            loaded = _preprocessThrust(
+                thrust_filename, thrust_dt, cutoff_freq, lpf_method,
+                resample_tol, resample_max_interval)
+            if cache:
+                _thrust_cache[key] = loaded
+                try:
+                    os.makedirs(THRUST_CACHE_DIR, exist_ok=True)
+                    # 複数のプロセスが同時に書き込んでも壊れないよう一時ファイルから置き換える
+                    tmp_filename = cache_filename[:-len('.npz')] + '.' + str(os.getpid()) + '.tmp.npz'
+                    np.savez(tmp_filename, **dict(zip(THRUST_CACHE_ARRAYS, loaded)))
+                    os.replace(tmp_filename, cache_filename)
+                except OSError:
+                    # キャッシュを書き込めない場合は保存しない
+                    pass
 
-        self.thrust_time_array, self.thrust_array = trimThrust(self.thrust_array, self.thrust_time_array, threshold_rate=0.01)
+        # キャッシュの配列を変更しないようコピーを保持する
+        self.thrust_time_array = np.array(loaded[0])
+        thrust_array, impulse_array, sample_dt = loaded[1:]
+        self.thrust_n_samples = len(self.thrust_time_array)
+        self.max_thrust = np.max(thrust_array)
         self.thrust_startup_time = self.thrust_time_array[0]
         self.thrust_cutoff_time = self.thrust_time_array[-1]
-        
-        self.thrust_n_samples = len(self.thrust_array)
+        self.impulse_total = impulse_array[-1]
+        prop_remaining_rate = 1.0 - (impulse_array / self.impulse_total)
 
-        self.impulse_array = getImpulseArray(self.thrust_array, self.thrust_dt)
-        self.impulse_total = self.impulse_array[-1]
-        self.prop_remaining_rate_array = 1.0 - (self.impulse_array / self.impulse_total)
-        self.mass_prop_array = self.__mass_init * self.prop_remaining_rate_array
-        self.MOI_prop_array = self.__MOI_init * np.resize(self.prop_remaining_rate_array, (self.thrust_n_samples, 3))
+        # 推力, 力積, 推進剤の重量, 慣性モーメントをまとめたテーブル
+        # columns: thrust, impulse, mass, MOI(3)
+        # 時刻の探索を一度で済ませるため, 各量は同じ行の列として補間する
+        self.thrust_table = np.empty((self.thrust_n_samples, 6))
+        self.thrust_table[:, 0] = thrust_array
+        self.thrust_table[:, 1] = impulse_array
+        self.thrust_table[:, 2] = self.__mass_init * prop_remaining_rate
+        self.thrust_table[:, 3:6] = np.outer(prop_remaining_rate, self.__MOI_init)
+        self.thrust_array = self.thrust_table[:, 0]
+        self.impulse_array = self.thrust_table[:, 1]
+        self.mass_prop_array = self.thrust_table[:, 2]
+        self.MOI_prop_array = self.thrust_table[:, 3:6]
 
-        self.thrust_f = interp1d(self.thrust_time_array, self.thrust_array)
-        self.impulse_f = interp1d(self.thrust_time_array, self.impulse_array)
-        self.mass_prop_f = interp1d(self.thrust_time_array, self.mass_prop_array)
-        self.MOI_prop_f = interp1d(self.thrust_time_array, self.MOI_prop_array, axis=0)
+        # 推進剤の重量, 慣性モーメントとその時間微分をまとめたテーブル
+        # columns: mass, MOI(3), dmass/dt, dMOI/dt(3)
+        # 推進剤の減少率は推力に比例する: d(rate)/dt = -thrust / impulse_total
+        # impulse_arrayはthrust_dt刻みで積算しているので,
+        # 推力データの実際の時刻間隔(間引く前の間隔)で換算して上の補間テーブルの傾きと合わせる
+        dratio_dt = -thrust_array * self.thrust_dt / (self.impulse_total * sample_dt)
+        self.prop_table = np.empty((self.thrust_n_samples, 8))
+        self.prop_table[:, 0:4] = self.thrust_table[:, 2:6]
+        self.prop_table[:, 4] = self.__mass_init * dratio_dt
+        self.prop_table[:, 5:8] = np.outer(dratio_dt, self.__MOI_init)
+        self.__time_list = self.thrust_time_array.tolist()
 
     def thrust(self, t):
-        if t >= self.thrust_cutoff_time:
-            return 0.0
-        else:
-            return self.thrust_f(t)
+        return self.__interpColumn(t, 0, 0.0)
 
     def impulse(self, t):
-        if t >= self.thrust_cutoff_time:
-            return self.impulse_total
-        else:
-            return self.impulse_f(t)
+        return self.__interpColumn(t, 1, self.impulse_total)
 
     def propMass(self, t):
-        if t >= self.thrust_cutoff_time:
-            return 0.0
-        else:
-            return self.mass_prop_f(t)
+        return self.__interpColumn(t, 2, 0.0)
 
     def propMOI(self, t):
+        if np.ndim(t) > 0:
+            rows = interpTable(self.thrust_time_array, self.thrust_table[:, 3:6], t)
+            rows[np.asarray(t) >= self.thrust_cutoff_time] = 0.0
+            return rows
         if t >= self.thrust_cutoff_time:
             return np.zeros((3))
+        i, frac = tableIndex(self.__time_list, t)
+        row = self.thrust_table[i, 3:6]
+        return row + (self.thrust_table[i+1, 3:6] - row) * frac
+
+    def __interpColumn(self, t, column, value_after_cutoff):
+        # tが配列の場合はsearchsortedで一括して補間する
+        if np.ndim(t) > 0:
+            values = interpTable(self.thrust_time_array, self.thrust_table[:, column], t)
+            values[np.asarray(t) >= self.thrust_cutoff_time] = value_after_cutoff
+            return values
+        if t >= self.thrust_cutoff_time:
+            return value_after_cutoff
+        i, frac = tableIndex(self.__time_list, t)
+        table = self.thrust_table
+        return table[i, column] + (table[i+1, column] - table[i, column]) * frac
+
+    def propProperties(self, t):
+        '''
+        推進剤の重量, 慣性モーメントと時間微分を一度の補間で求める
+        OUTPUT
+            ndarray(8): mass, MOI(3), dmass/dt, dMOI/dt(3)
+        '''
+        if t >= self.thrust_cutoff_time:
+            return np.zeros(8)
         else:
-            return self.MOI_prop_f(t)
+            return interpRows(self.__time_list, self.prop_table, t)
+
+
+def _preprocessThrust(
+        thrust_filename, thrust_dt, cutoff_freq, lpf_method,
+        resample_tol=None, resample_max_interval=None):
+    '''
+    推力履歴ファイルの読み込み, フィルタ処理, 切り出し, 力積の計算と間引き
+    OUTPUT
+        (thrust_time_array, thrust_array, impulse_array, sample_dt_array)
+        sample_dt_array: 間引く前の推力データの各点での時刻間隔
+    '''
+    input_data = readThrustCSV(thrust_filename)
+    thrust_raw = input_data[:, 1]
+    time_array = input_data[:, 0]
+
+    if cutoff_freq > 0:
+        # LPFメソッド: lpf.LPFを参照(位相遅れなし)
+        thrust_array = LPF(thrust_raw, thrust_dt, cutoff_freq, method=lpf_method)
+    else:
+        thrust_array = thrust_raw.copy()
+    thrust_array[thrust_array < 0.0] = 0.0
+
+    time_array, thrust_array = trimThrust(thrust_array, time_array, threshold_rate=0.01)
+    impulse_array = getImpulseArray(thrust_array, thrust_dt)
+    sample_dt_array = np.gradient(time_array)
+    if resample_tol is not None:
+        # 点は元の時刻列から選ぶので, 各点での値は間引く前と一致する
+        index = getResampleIndices(time_array, thrust_array, resample_tol, resample_max_interval)
+        return time_array[index], thrust_array[index], impulse_array[index], sample_dt_array[index]
+    return time_array, thrust_array, impulse_array, sample_dt_array
+
+
+def readThrustCSV(thrust_filename):
+    '''
+    時刻, 推力のCSVファイルを読み込む. '$', '#', '%'以降はコメントとして無視する
+    OUTPUT
+        ndarray (n, 2)
+    '''
+    with open(thrust_filename, 'r') as f:
+        text = f.read()
+    if any(c in text for c in '#$%'):
+        text = re.sub(r'[#$%].*', '', text)
+    return pd.read_csv(io.StringIO(text), header=None, engine='c').to_numpy(dtype=float)
+
+
+def getFileHash(path):
+    '''
+    ファイルの内容のハッシュ値. 更新時刻とサイズが同じ間は再計算しない
+    '''
+    stat = os.stat(path)
+    file_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if file_key not in _file_hash_cache:
+        with open(path, 'rb') as f:
+            _file_hash_cache[file_key] = hashlib.sha1(f.read()).hexdigest()
+    return _file_hash_cache[file_key]
+
+
+def clearThrustCache():
+    '''
+    プロセス内のキャッシュ(推力の前処理結果とファイルのハッシュ値)を消去する
+    '''
+    _thrust_cache.clear()
+    _file_hash_cache.clear()
 
 
 def trimThrust(thrust_array, time_array, threshold_rate=0.01):
@@ -136,4 +283,118 @@ def getThrustEffectiveTimeBoundary(thrust_array, time_array, threshold_rate=0.01
 
 def getImpulseArray(thrust_array, dt):
     impulse_array = np.cumsum(thrust_array * dt)
-    return impulse_array
\ No newline at end of file
+    return impulse_array
+
+
+def interpRows(time_list, table, t):
+    '''
+    時刻列time_list(昇順のlist)に対応するテーブルの行を線形補間する
+    範囲外は端の行を返す
+    INPUT
+        time_list: list of float (len n)
+        table: ndarray (n, m)
+        t: 時刻(スカラ)
+    OUTPUT
+        ndarray (m)
+    '''
+    if t <= time_list[0]:
+        return table[0].copy()
+    elif t >= time_list[-1]:
+        return table[-1].copy()
+    i = bisect.bisect_right(time_list, t) - 1
+    frac = (t - time_list[i]) / (time_list[i+1] - time_list[i])
+    return table[i] + (table[i+1] - table[i]) * frac
+
+
+def tableIndex(time_list, t):
+    '''
+    時刻列time_list(昇順のlist)でtを挟む区間の番号と内分比
+    範囲外は端の点(内分比0または1)とする
+    OUTPUT
+        (i, frac): time_list[i] <= t <= time_list[i+1] の i と (t - time_list[i]) / 区間の長さ
+    '''
+    if t <= time_list[0]:
+        return 0, 0.0
+    elif t >= time_list[-1]:
+        return len(time_list) - 2, 1.0
+    i = bisect.bisect_right(time_list, t) - 1
+    return i, (t - time_list[i]) / (time_list[i+1] - time_list[i])
+
+
+def interpTable(time_array, table, t):
+    '''
+    時刻の配列tに対してテーブルの行を線形補間する(全ての列で一度のsearchsortedを共有する)
+    範囲外は端の行とする
+    INPUT
+        time_array: ndarray (n) 昇順の時刻
+        table: ndarray (n) or (n, m)
+        t: 時刻の配列 (N)
+    OUTPUT
+        ndarray (N) or (N, m)
+    '''
+    t = np.clip(np.asarray(t, dtype=float), time_array[0], time_array[-1])
+    i = np.clip(np.searchsorted(time_array, t, side='right') - 1, 0, len(time_array) - 2)
+    frac = (t - time_array[i]) / (time_array[i+1] - time_array[i])
+    if table.ndim > 1:
+        frac = frac[:, np.newaxis]
+    return table[i] + (table[i+1] - table[i]) * frac
+
+
+def getResampleIndices(time_array, thrust_array, tol, max_interval=None):
+    '''
+    推力を折れ線で近似する点(元の時刻列の番号)を選ぶ
+    推力の変化が大きい時刻ほど点が多くなる(Douglas-Peucker法)
+    次を満たすまで, 近似誤差が最大となる点で区間を分割する
+        各点での推力の誤差 <= tol * 最大推力
+        各点での力積(推進剤の減少量)の補間誤差 <= tol * 全力積
+        各区間での折れ線の推力の積分の誤差 <= tol * 全力積 * 区間の長さ / 燃焼時間
+        (よって折れ線の推力による全力積の誤差 <= tol * 全力積)
+        区間の長さ <= max_interval
+    INPUT
+        time_array: 昇順の時刻 (n)
+        thrust_array: 推力 (n)
+        tol: 相対許容誤差
+        max_interval: 点の間隔の最大値 [s]. 指定した場合は超える区間を分割する
+            (重心や慣性モーメントは推進剤重量の非線形な関数なので, 推力が一定でも間隔を制限する)
+    OUTPUT
+        ndarray(int): 両端を含む昇順の点の番号
+    '''
+    n = len(time_array)
+    if n <= 2:
+        return np.arange(n)
+    # 元の点列の台形積分による力積
+    impulse = np.r_[0.0, np.cumsum(0.5 * (thrust_array[1:] + thrust_array[:-1]) * np.diff(time_array))]
+    thrust_tol = tol * np.max(thrust_array)
+    impulse_tol = tol * impulse[-1]
+    impulse_tol_rate = impulse_tol / (time_array[-1] - time_array[0])
+
+    selected = np.zeros(n, dtype=bool)
+    selected[[0, n-1]] = True
+    stack = [(0, n-1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        t = time_array[i:j+1]
+        duration = t[-1] - t[0]
+        error = np.abs(_linearError(t, thrust_array[i:j+1])[1:-1])
+        impulse_error = np.abs(_linearError(t, impulse[i:j+1])[1:-1])
+        area_error = abs(0.5 * (thrust_array[i] + thrust_array[j]) * duration - (impulse[j] - impulse[i]))
+        if np.max(error) > thrust_tol:
+            k = int(np.argmax(error)) + 1
+        elif np.max(impulse_error) > impulse_tol or area_error > impulse_tol_rate * duration:
+            k = int(np.argmax(impulse_error)) + 1
+        elif max_interval is not None and duration > max_interval:
+            # 誤差が許容範囲内で長すぎる区間は中央で分割する
+            k = min(max(int(np.searchsorted(t, t[0] + 0.5 * duration)), 1), len(t) - 2)
+        else:
+            continue
+        selected[i+k] = True
+        stack.append((i, i+k))
+        stack.append((i+k, j))
+    return np.flatnonzero(selected)
+
+
+def _linearError(t, y):
+    # 両端を結ぶ直線からの差
+    return y - (y[0] + (y[-1] - y[0]) * (t - t[0]) / (t[-1] - t[0]))
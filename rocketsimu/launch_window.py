@@ -0,0 +1,219 @@
+# -*- coding:utf-8 -*-
+import os
+import json
+import copy
+import hashlib
+import numpy as np
+from . import dispersion
+from .vehicle import compile_parameters
+from .wind import WindForecast
+
+'''
+打ち上げ時刻の候補(打ち上げウィンドウ)ごとに予報風と風の摂動の全組み合わせを計算し,
+時刻ごとの落下分散楕円を求めるスクリプト
+
+前処理済みの機体(PreparedVehicle)を全条件で共有し, 全時刻の条件をまとめて並列に計算する.
+結果は打ち上げ時刻ごとに(機体, その時刻の予報風のプロファイル, 摂動)をキーとしてキャッシュするので,
+新しい予報で一部の時刻のみ予報が変わった場合はその時刻のみ計算し直す.
+'''
+
+DEFAULT_OUTPUTS = ('landing_x', 'landing_y', 'apogee')
+# キャッシュの内容を変更した場合は更新する(古いキャッシュを使用しないため)
+CACHE_VERSION = 1
+# 打ち上げ時刻ごとの結果を保存するディレクトリ
+CACHE_DIR = os.path.join(
+                os.environ.get(
+                    'ROCKETSIMU_CACHE_DIR',
+                    os.path.join(os.path.expanduser('~'), '.cache', 'rocketsimu')),
+                'launch_window')
+
+# 打ち上げ時刻ごとの計算結果 (キー -> 出力の配列)
+_slot_cache = {}
+
+
+def launch_window_sweep(
+        parameters,
+        forecast_filename,
+        launch_times,
+        perturbations=({},),
+        outputs=DEFAULT_OUTPUTS,
+        confidence=0.95,
+        n_workers=None,
+        backend='python',
+        cache=True,
+        progress=None):
+    '''
+    打ち上げ時刻と風の摂動の全組み合わせを計算し, 打ち上げ時刻ごとの落下分散楕円を求める
+    INPUT
+        parameters: 基準となるロケットのパラメータ(Dict, ファイル名またはPreparedVehicle)
+        forecast_filename: 予報風ファイル名(WindForecastを参照)
+        launch_times: 打ち上げ時刻(予報時刻[h])のリスト
+        perturbations: 風の摂動のリスト(turbulence_perturbations()を参照). 要素はDictで
+            'turbulence': 予報風に加える乱流のWindTurbulenceのパラメータ(省略時は予報風のみ)
+            その他のキー: 基準パラメータを上書きする値(dispersionのcaseと同じ)
+        outputs: 出力の名前(dispersion.OUTPUTSのキー)のリスト. 落下分散楕円のため
+            'landing_x', 'landing_y'は常に含める
+        confidence: 落下分散楕円の信頼度
+        n_workers: ワーカープロセス数. 省略時はCPU数
+        backend: 運動方程式の計算方法 'python' or 'numba' (simulate()と同じく省略時は'python')
+        cache: Trueの場合, 打ち上げ時刻ごとの結果をプロセス内とCACHE_DIRに保存し, 次回以降はそれを使用する
+        progress: dispersion.iter_dispersionを参照
+    OUTPUT
+        打ち上げ時刻ごとのDictのリスト
+            time: 打ち上げ時刻 [h]
+            outputs: 出力の名前のリスト
+            values: 各摂動の出力 (摂動の数, 出力の数)
+            landing: 各摂動の落下地点 (摂動の数, 2)
+            ellipse: 落下分散楕円(landing_ellipse()を参照)
+            cached: キャッシュした結果を使用したか
+    '''
+    vehicle = compile_parameters(parameters)
+    outputs = list(outputs)
+    for name in ('landing_y', 'landing_x'):
+        if name not in outputs:
+            outputs.insert(0, name)
+    perturbations = [dict(p) for p in perturbations]
+    forecast_filename = os.path.abspath(forecast_filename)
+    forecast = WindForecast(forecast_filename, cache=cache)
+
+    keys = [
+        _slot_key(vehicle, forecast.at(t), perturbations, outputs, backend)
+        for t in launch_times
+    ]
+    values = [_load_slot(key) if cache else None for key in keys]
+
+    # キャッシュにない時刻の条件をまとめて計算する
+    missing = [i for i, v in enumerate(values) if v is None]
+    cases = [
+        _perturbed_case(forecast_filename, launch_times[i], perturbation)
+        for i in missing
+        for perturbation in perturbations
+    ]
+    if cases:
+        logs = dispersion.run_dispersion(
+                    vehicle, cases, n_workers=n_workers, backend=backend,
+                    trajectory=False, progress=progress)
+        Y = dispersion.log_outputs(logs, outputs).reshape(len(missing), len(perturbations), len(outputs))
+        for i, Y_i in zip(missing, Y):
+            values[i] = Y_i
+            if cache:
+                _store_slot(keys[i], Y_i)
+
+    i_x = outputs.index('landing_x')
+    i_y = outputs.index('landing_y')
+    results = []
+    for i, t in enumerate(launch_times):
+        landing = values[i][:, [i_x, i_y]]
+        results.append({
+            'time': t,
+            'outputs': outputs,
+            'values': values[i],
+            'landing': landing,
+            'ellipse': landing_ellipse(landing, confidence),
+            'cached': i not in missing
+        })
+    return results
+
+
+def turbulence_perturbations(n, sigma=1.0, length_scale=300., spectrum='dryden', seed=0):
+    '''
+    予報風に乱流の実現値(0, 1, ..., n-1番)を加えるn個の摂動
+    '''
+    return [
+        {'turbulence': {
+            'sigma': sigma,
+            'length_scale': length_scale,
+            'spectrum': spectrum,
+            'seed': seed,
+            'realization': i}}
+        for i in range(n)
+    ]
+
+
+def landing_ellipse(landing, confidence=0.95):
+    '''
+    落下地点の分布を2次元正規分布とみなした分散楕円
+    INPUT
+        landing: 落下地点 (N, 2). NaNを含む点(t_maxまでに着地しなかった条件)は除く
+        confidence: 楕円内に入る確率
+    OUTPUT
+        Dict
+            center: 平均 (2,)
+            covariance: 共分散行列 (2, 2)
+            semi_major, semi_minor: 長半径, 短半径 [m]
+            angle: 長軸のx軸から反時計回りの角度 [deg]
+    '''
+    landing = np.asarray(landing, dtype=float)
+    landing = landing[np.isfinite(landing).all(axis=1)]
+    center = np.mean(landing, axis=0)
+    if len(landing) < 2:
+        covariance = np.zeros((2, 2))
+    else:
+        covariance = np.cov(landing, rowvar=False)
+    eig, vec = np.linalg.eigh(covariance)
+    # 2自由度のカイ二乗分布のconfidence点
+    scale = np.sqrt(-2.0 * np.log(1.0 - confidence))
+    semi_minor, semi_major = scale * np.sqrt(np.maximum(eig, 0.0))
+    return {
+        'center': center,
+        'covariance': covariance,
+        'semi_major': semi_major,
+        'semi_minor': semi_minor,
+        'angle': np.rad2deg(np.arctan2(vec[1, 1], vec[0, 1])) % 180.0
+    }
+
+
+def clear_cache():
+    '''
+    プロセス内のキャッシュを消去する(CACHE_DIRのファイルは削除しない)
+    '''
+    _slot_cache.clear()
+
+
+def _perturbed_case(forecast_filename, time, perturbation):
+    case = copy.deepcopy(perturbation)
+    turbulence = case.pop('turbulence', None)
+    wind = {'wind_model': 'forecast', 'wind_parameters': {'filename': forecast_filename, 'time': time}}
+    if turbulence is not None:
+        wind = {'wind_model': 'turbulence', 'wind_parameters': dict(turbulence, base=wind)}
+    case.update(wind)
+    return case
+
+
+def _slot_key(vehicle, forecast, perturbations, outputs, backend):
+    # 予報ファイル名ではなくその時刻のプロファイルの内容をキーとする
+    h = hashlib.sha1(json.dumps(
+            [CACHE_VERSION, vehicle.key, perturbations, outputs, backend],
+            sort_keys=True).encode())
+    h.update(np.ascontiguousarray(forecast.alt_axis, dtype=float).tobytes())
+    h.update(np.ascontiguousarray(forecast.wind_vec_array, dtype=float).tobytes())
+    return h.hexdigest()
+
+
+def _load_slot(key):
+    if key in _slot_cache:
+        return _slot_cache[key]
+    filename = os.path.join(CACHE_DIR, 'slot_' + key + '.npy')
+    if not os.path.exists(filename):
+        return None
+    try:
+        values = np.load(filename)
+    except Exception:
+        # 壊れたキャッシュは無視して計算し直す
+        return None
+    _slot_cache[key] = values
+    return values
+
+
+def _store_slot(key, values):
+    _slot_cache[key] = values
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # 複数のプロセスが同時に書き込んでも壊れないよう一時ファイルから置き換える
+        filename = os.path.join(CACHE_DIR, 'slot_' + key + '.npy')
+        tmp_filename = filename[:-len('.npy')] + '.' + str(os.getpid()) + '.tmp.npy'
+        np.save(tmp_filename, values)
+        os.replace(tmp_filename, filename)
+    except OSError:
+        # キャッシュを書き込めない場合は保存しない
+        pass
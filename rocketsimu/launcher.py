@@ -34,20 +34,32 @@ class Launcher:
         self.rocket.omega = np.zeros((3))
         self.rocket.q = q0
     
-    def is1stlugOff(self):
-        if self.rocket is None:
-            raise AttributeError('Class valiable "rocket" must be assigned.')
-        
-        if self.rocket.x[2] > self.height_1stlug_off:
+    def is1stlugOff(self, x=None):
+        '''
+        INPUT
+            x: 局所座標系での位置ベクトル [m]. 省略時はrocket.xを参照する
+        '''
+        if x is None:
+            if self.rocket is None:
+                raise AttributeError('Class valiable "rocket" must be assigned.')
+            x = self.rocket.x
+
+        if x[2] > self.height_1stlug_off:
             return True
         else:
             return False
     
-    def is2ndlugOff(self):
-        if self.rocket is None:
-            raise AttributeError('Class valiable "rocket" must be assigned.')
-        
-        if self.rocket.x[2] > self.height_2ndlug_off:
+    def is2ndlugOff(self, x=None):
+        '''
+        INPUT
+            x: 局所座標系での位置ベクトル [m]. 省略時はrocket.xを参照する
+        '''
+        if x is None:
+            if self.rocket is None:
+                raise AttributeError('Class valiable "rocket" must be assigned.')
+            x = self.rocket.x
+
+        if x[2] > self.height_2ndlug_off:
             return True
         else:
             return False
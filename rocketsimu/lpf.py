@@ -1,11 +1,40 @@
 import numpy as np
-from scipy.signal import firwin, lfilter
-from scipy import fftpack
+from scipy import fft
+from scipy.signal import butter, sosfiltfilt
 
-def LPF(x, dt, f_cutoff):
-    tf = fftpack.fft(x)
-    f = fftpack.fftfreq(len(x), dt)
-    tf2 = np.copy(tf)
-    tf2[np.abs(f) >= f_cutoff] = 0.
-    y = np.real(fftpack.ifft(tf2))
-    return y
+# この点数を超える信号はFFTの高速な長さまで延長してからフィルタをかける
+PAD_MIN_LENGTH = 65536
+
+def LPF(x, dt, f_cutoff, method='fft', order=4):
+    '''
+    等間隔の信号のローパスフィルタ(いずれも位相遅れなし)
+    INPUT
+        x: 刻みdtの信号
+        dt: サンプリング間隔 [s]
+        f_cutoff: カットオフ周波数 [Hz]
+        method: 'fft': 実数FFT(rfft)でカットオフ周波数以上の成分を0にする
+                    (PAD_MIN_LENGTH点を超える信号は末尾を折り返して高速な長さまで延長する)
+                'sosfiltfilt': order次のButterworthフィルタを前後方向にかける
+                    (急峻なカットオフによるリンギングが出ない)
+        order: sosfiltfiltのフィルタ次数
+    '''
+    x = np.asarray(x, dtype=float)
+    if method == 'fft':
+        # 大きな素因数を持つ長さのFFTは遅いため, 長い信号は高速な長さまで延長する
+        # (延長すると元の長さのスペクトルではカットオフ以上の成分が厳密には0にならないため,
+        # 短い信号はそのままの長さで計算する)
+        n = len(x)
+        n_fft = fft.next_fast_len(n, real=True) if n > PAD_MIN_LENGTH else n
+        if n_fft > n:
+            x = np.pad(x, (0, n_fft - n), mode='reflect')
+        tf = fft.rfft(x)
+        f = fft.rfftfreq(n_fft, dt)
+        tf[f >= f_cutoff] = 0.
+        return fft.irfft(tf, n=n_fft)[:n]
+    elif method == 'sosfiltfilt':
+        fs = 1.0 / dt
+        if f_cutoff >= 0.5 * fs:
+            return x.copy()
+        sos = butter(order, f_cutoff, fs=fs, output='sos')
+        return sosfiltfilt(sos, x)
+    raise ValueError('Invalid LPF method "'+str(method)+'" was indicated.')
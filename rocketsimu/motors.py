@@ -0,0 +1,286 @@
+# -*- coding:utf-8 -*-
+import os
+import json
+import math
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from . import engine
+from .engine import readThrustCSV, getThrustEffectiveTimeBoundary
+
+'''
+多数のモータの推力履歴とその諸元(全力積, 燃焼時間, 推進剤重量など)をまとめて扱うモータライブラリ
+
+ライブラリは次のいずれか
+    ディレクトリ: 推力履歴のCSVファイルと, 諸元をまとめた索引ファイル(INDEX_FILENAME)
+    単一ファイル(.npz): 索引と全モータの推力履歴をまとめたもの(MotorLibrary.exportで作成. 読み込み専用)
+開くときは索引のみを読み込み, 推力履歴は参照されたときに読み込んでキャッシュする.
+parameters()はシミュレーションのパラメータ(thrust_curve_csvなど)を返すので,
+dispersion.run_dispersionのcaseとして使用でき, フィルタ処理などの前処理はengineのキャッシュで共有される.
+'''
+
+INDEX_FILENAME = 'index.json'
+INDEX_VERSION = 1
+# 推力履歴のキャッシュの大きさ(モータ数)
+CURVE_CACHE_SIZE = 64
+# 全力積の等級 'A'の上限 [N s]. 以降1文字ごとに2倍
+IMPULSE_CLASS_A = 2.5
+
+
+class MotorLibrary:
+    '''
+    モータライブラリ
+
+    使用例
+        library = MotorLibrary('motors')
+        library.add('J350', 'J350.csv', thrust_dt=0.01, mass_prop=0.4)
+        names = library.select(impulse_class='J', max_burn_time=3.0)
+        cases = library.cases(names)  # dispersion.run_dispersionのcase
+    '''
+    def __init__(self, path):
+        '''
+        INPUT
+            path: ライブラリのディレクトリ(存在しなければ作成する)または.npzファイル
+        '''
+        self.path = os.path.abspath(path)
+        self.is_bundle = os.path.isfile(self.path)
+        if self.is_bundle:
+            with np.load(self.path) as npz:
+                index = json.loads(str(npz['index']))
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            index_filename = os.path.join(self.path, INDEX_FILENAME)
+            if os.path.exists(index_filename):
+                with open(index_filename, 'r') as f:
+                    index = json.load(f)
+            else:
+                index = {'version': INDEX_VERSION, 'motors': {}}
+        self.__motors = index['motors']
+        self.__curves = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__motors)
+
+    def __contains__(self, name):
+        return name in self.__motors
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def names(self):
+        return sorted(self.__motors)
+
+    def metadata(self, name):
+        '''
+        モータの諸元のDict
+            total_impulse: 全力積 [N s]
+            burn_time: 燃焼時間(推力が最大推力の1%以上の時間) [s]
+            max_thrust, average_thrust: 最大推力, 平均推力(全力積/燃焼時間) [N]
+            impulse_class: 全力積の等級('A', 'B', ...)
+            thrust_dt, mass_prop, MOI_prop: シミュレーションのパラメータ
+            その他add()で指定した項目
+        '''
+        return dict(self.__motors[name])
+
+    def table(self):
+        '''
+        全モータの諸元のDataFrame(モータ名をindexとする)
+        '''
+        return pd.DataFrame.from_dict(self.__motors, orient='index').sort_index()
+
+    def select(
+            self,
+            impulse_class=None,
+            min_impulse=None,
+            max_impulse=None,
+            min_burn_time=None,
+            max_burn_time=None):
+        '''
+        条件に合うモータ名のリストを全力積の小さい順に返す
+        INPUT
+            impulse_class: 全力積の等級(文字またはそのリスト)
+            min_impulse, max_impulse: 全力積の範囲 [N s]
+            min_burn_time, max_burn_time: 燃焼時間の範囲 [s]
+        '''
+        if isinstance(impulse_class, str):
+            impulse_class = [impulse_class]
+        names = []
+        for name, motor in self.__motors.items():
+            if impulse_class is not None and motor['impulse_class'] not in impulse_class:
+                continue
+            if not _in_range(motor['total_impulse'], min_impulse, max_impulse):
+                continue
+            if not _in_range(motor['burn_time'], min_burn_time, max_burn_time):
+                continue
+            names.append(name)
+        return sorted(names, key=lambda name: (self.__motors[name]['total_impulse'], name))
+
+    def curve(self, name):
+        '''
+        推力履歴を読み込む(読み込み結果はキャッシュする)
+        OUTPUT
+            (time_array, thrust_array) 読み込み専用のndarray
+        '''
+        with self.__lock:
+            if name in self.__curves:
+                self.__curves.move_to_end(name)
+                return self.__curves[name]
+        motor = self.__motors[name]
+        if self.is_bundle:
+            with np.load(self.path) as npz:
+                data = npz[motor['member']]
+        else:
+            data = readThrustCSV(os.path.join(self.path, motor['file']))
+        curve = (_readonly(data[:, 0]), _readonly(data[:, 1]))
+        with self.__lock:
+            self.__curves[name] = curve
+            while len(self.__curves) > CURVE_CACHE_SIZE:
+                self.__curves.popitem(last=False)
+        return curve
+
+    def parameters(self, name):
+        '''
+        モータのシミュレーションのパラメータ(基準パラメータを上書きするDict)
+            thrust_curve_csv, thrust_dt, mass_prop (, MOI_prop)
+        単一ファイルのライブラリの場合, 推力履歴はengine.THRUST_CACHE_DIRにCSVとして書き出す
+        '''
+        motor = self.__motors[name]
+        if self.is_bundle:
+            thrust_curve_csv = self.__extract(name)
+        else:
+            thrust_curve_csv = os.path.join(self.path, motor['file'])
+        params = {
+            'thrust_curve_csv': thrust_curve_csv,
+            'thrust_dt': motor['thrust_dt'],
+            'mass_prop': motor['mass_prop']
+        }
+        if motor.get('MOI_prop') is not None:
+            params['MOI_prop'] = list(motor['MOI_prop'])
+        return params
+
+    def cases(self, names=None):
+        '''
+        モータを入れ替える条件(dispersion.run_dispersionのcase)のリスト
+        INPUT
+            names: モータ名のリスト. 省略時は全モータ
+        '''
+        return [self.parameters(name) for name in (self.names() if names is None else names)]
+
+    def add(self, name, thrust_curve_csv, thrust_dt, mass_prop, MOI_prop=None, **metadata):
+        '''
+        モータを追加し(同名のモータは置き換える), 索引ファイルを更新する(ディレクトリのライブラリのみ)
+        INPUT
+            name: モータ名
+            thrust_curve_csv: 時刻, 推力のCSVファイル. ライブラリのディレクトリにコピーする
+            thrust_dt, mass_prop, MOI_prop: シミュレーションのパラメータ
+            metadata: 索引に追加する項目(メーカ名など)
+        '''
+        if self.is_bundle:
+            raise ValueError('Motors cannot be added to a single-file library "'+self.path+'".')
+        # 記号を置き換えたファイル名が他のモータと重なる場合は番号を付ける
+        used = set(motor['file'] for key, motor in self.__motors.items() if key != name)
+        filename = _safe_filename(name) + '.csv'
+        i = 1
+        while filename in used:
+            filename = _safe_filename(name) + '_' + str(i) + '.csv'
+            i += 1
+        dst = os.path.join(self.path, filename)
+        if os.path.abspath(thrust_curve_csv) != dst:
+            shutil.copyfile(thrust_curve_csv, dst)
+        data = readThrustCSV(dst)
+
+        motor = dict(metadata)
+        motor.update(curve_metadata(data[:, 0], data[:, 1]))
+        motor.update({
+            'file': filename,
+            'thrust_dt': float(thrust_dt),
+            'mass_prop': float(mass_prop),
+            'MOI_prop': None if MOI_prop is None else [float(v) for v in MOI_prop]
+        })
+        with self.__lock:
+            self.__motors[name] = motor
+            self.__curves.pop(name, None)
+        self.__save_index()
+        return self.metadata(name)
+
+    def export(self, filename):
+        '''
+        索引と全モータの推力履歴を単一の.npzファイルにまとめる
+        '''
+        motors = {}
+        arrays = {}
+        for i, name in enumerate(self.names()):
+            member = 'curve_' + str(i)
+            motor = dict(self.__motors[name])
+            motor.pop('file', None)
+            motor['member'] = member
+            motors[name] = motor
+            arrays[member] = np.c_[self.curve(name)]
+        index = {'version': INDEX_VERSION, 'motors': motors}
+        np.savez(filename, index=np.array(json.dumps(index)), **arrays)
+
+    def __save_index(self):
+        index_filename = os.path.join(self.path, INDEX_FILENAME)
+        tmp_filename = index_filename + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'motors': self.__motors}, f, indent=2, sort_keys=True)
+        os.replace(tmp_filename, index_filename)
+
+    def __extract(self, name):
+        # 推力履歴の内容ごとに一度だけ書き出す
+        time_array, thrust_array = self.curve(name)
+        data = np.c_[time_array, thrust_array]
+        directory = os.path.join(engine.THRUST_CACHE_DIR, 'motors')
+        filename = os.path.join(directory, hashlib.sha1(data.tobytes()).hexdigest() + '.csv')
+        if not os.path.exists(filename):
+            os.makedirs(directory, exist_ok=True)
+            tmp_filename = filename[:-len('.csv')] + '.' + str(os.getpid()) + '.tmp'
+            np.savetxt(tmp_filename, data, delimiter=',', fmt='%.17g')
+            os.replace(tmp_filename, filename)
+        return filename
+
+
+def curve_metadata(time_array, thrust_array):
+    '''
+    推力履歴の諸元
+    OUTPUT
+        Dict: total_impulse, burn_time, max_thrust, average_thrust, impulse_class
+    '''
+    thrust_array = np.maximum(thrust_array, 0.0)
+    total_impulse = float(np.sum(0.5 * (thrust_array[1:] + thrust_array[:-1]) * np.diff(time_array)))
+    t_startup, t_cutoff = getThrustEffectiveTimeBoundary(thrust_array, time_array)
+    burn_time = float(t_cutoff - t_startup)
+    return {
+        'total_impulse': total_impulse,
+        'burn_time': burn_time,
+        'max_thrust': float(np.max(thrust_array)),
+        'average_thrust': total_impulse / burn_time if burn_time > 0 else 0.0,
+        'impulse_class': impulse_class(total_impulse)
+    }
+
+
+def impulse_class(total_impulse):
+    '''
+    全力積 [N s] の等級. 'A'(2.5N s以下), 'B'(5N s以下), ... と1文字ごとに上限が2倍になる
+    '''
+    if total_impulse <= IMPULSE_CLASS_A:
+        return 'A'
+    return chr(ord('A') + int(math.ceil(math.log2(total_impulse / IMPULSE_CLASS_A) - 1e-12)))
+
+
+def _in_range(value, lower, upper):
+    return (lower is None or value >= lower) and (upper is None or value <= upper)
+
+
+def _safe_filename(name):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+
+def _readonly(array):
+    array = np.array(array, dtype=float)
+    array.flags.writeable = False
+    return array
@@ -34,17 +34,61 @@ class Parachute:
         self.__t_deploy = t_flight
     
     def isDeploy(self):
+        return self.checkDeploy(self.rocket.t, self.rocket.x, self.rocket.t_apogee)
+
+    def checkDeploy(self, t, x, t_apogee):
+        '''
+        Returns whether the deployment condition is satisfied.
+        INPUT
+            t: flight time [s]
+            x: position vector in local coord. [m]
+            t_apogee: time of apogee [s]. None if not reached yet.
+        '''
         if self.__t_deploy is not None:
-            if self.rocket.t > self.__t_deploy:
+            if t > self.__t_deploy:
                 return True
-        if self.__t_deploy_falling is not None and self.rocket.t_apogee is not None:
-            if self.rocket.t - self.rocket.t_apogee > self.__t_deploy_falling:
+        if self.__t_deploy_falling is not None and t_apogee is not None:
+            if t - t_apogee > self.__t_deploy_falling:
                 return True
-        if self.__alt_deploy is not None and self.rocket.t_apogee is not None:
-            if self.rocket.x[2] < self.__alt_deploy:
+        if self.__alt_deploy is not None and t_apogee is not None:
+            if x[2] < self.__alt_deploy:
                 return True
         return False
+
+    def deployEvents(self, t_apogee):
+        '''
+        Returns event functions g(t, u) of the deployment triggers
+        for event-driven integration (zero crossing = deployment).
+        INPUT
+            t_apogee: time of apogee [s]. None if not reached yet.
+        OUTPUT
+            list of (function, direction)
+        '''
+        events = []
+        if self.__t_deploy is not None:
+            t_deploy = self.__t_deploy
+            events.append((lambda t, u: t - t_deploy, 1.))
+        if self.__t_deploy_falling is not None and t_apogee is not None:
+            t_deploy_falling = t_apogee + self.__t_deploy_falling
+            events.append((lambda t, u: t - t_deploy_falling, 1.))
+        if self.__alt_deploy is not None and t_apogee is not None:
+            alt_deploy = self.__alt_deploy
+            events.append((lambda t, u: u[2] - alt_deploy, -1.))
+        return events
     
+    def getTriggers(self):
+        '''
+        Returns deployment triggers as a tuple
+        (flight_time, fall_time, altitude). Unset triggers are None.
+        '''
+        return self.__t_deploy, self.__t_deploy_falling, self.__alt_deploy
+
+    def getCdS(self):
+        '''
+        抗力係数と面積の積Cd*S [m^2]
+        '''
+        return self.__Cd * self.__S
+
     def joinRocket(self, rocket):
         self.rocket = rocket
     
@@ -61,6 +105,9 @@ class Parachute:
             parachute drag force vector in body coord.
         '''
         
-        parachute_drag = 0.5 * rho * LA.norm(v_air) * v_air * self.__S * self.__Cd
+        # v_air, rhoは(N, 3), (N,)の配列も受け付ける
+        v_air_norm = LA.norm(v_air, axis=-1)[..., np.newaxis]
+        rho = np.asarray(rho)[..., np.newaxis]
+        parachute_drag = 0.5 * rho * v_air_norm * v_air * self.__S * self.__Cd
 
         return parachute_drag
\ No newline at end of file
@@ -0,0 +1,137 @@
+# -*- coding:utf-8 -*-
+from collections import namedtuple
+import numpy as np
+from .attitude import dcm
+
+'''
+TrajectorySolverの飛行フェーズの状態遷移を (t, u, phase) の純粋な関数としてまとめたスクリプト
+
+飛行フェーズはFlightPhaseとして明示的に受け渡し, Rocketやその部品(ランチャ, パラシュート)には
+書き込まない. そのため同じRocketを複数のソルバで同時に(スレッドで並行に)使用できる.
+
+state
+    1: 2つのラグがランチャーに拘束されている
+    1.1: 2ndラグのみランチャーに拘束されている
+    2: 推力飛行
+    3: 慣性飛行
+    3.5: ドローグシュート展開
+    4: メインパラシュート展開
+    5: 着地
+'''
+
+# 飛行フェーズ
+#   state: 上記の状態番号
+#   t_apogee: 頂点到達時刻 [s]. 頂点に到達していなければNone
+FlightPhase = namedtuple('FlightPhase', ['state', 't_apogee'])
+
+INITIAL_PHASE = FlightPhase(1, None)
+
+# イベントのラベルと遷移後のstate(apogeeはstateを変えずt_apogeeを記録する)
+NEXT_STATE = {
+    '1stlug_off': 1.1,
+    '2ndlug_off': 2,
+    'MECO': 3,
+    'drogue': 3.5,
+    'para': 4,
+    'landing': 5
+}
+
+# イベントのラベルと表示するメッセージ
+EVENT_MESSAGES = {
+    '1stlug_off': '1stlug off',
+    '2ndlug_off': '2ndlug off',
+    'MECO': 'MECO',
+    'drogue': 'drogue chute deployed',
+    'para': 'main parachute deployed',
+    'landing': 'landing',
+    'apogee': 'apogee'
+}
+
+
+def advance(phase, label, t):
+    '''
+    イベントlabelが時刻tに発生した後の飛行フェーズを返す
+    '''
+    if label == 'apogee':
+        return phase._replace(t_apogee=t)
+    return phase._replace(state=NEXT_STATE[label])
+
+
+def vertical_speed(t, u):
+    '''
+    局所座標系での鉛直方向の速度 [m/s] (頂点のイベント関数)
+    '''
+    return np.dot(dcm(u[6:10])[:, 2], u[3:6])
+
+
+def immediate_transition(rocket, t, u, phase):
+    '''
+    (t, u)で既に満たされている飛行フェーズの遷移条件のラベルを返す. なければNone
+    (頂点はイベント関数の根としてのみ検出するため含めない)
+    '''
+    state = phase.state
+    x = u[0:3]
+    if state == 1 and rocket.launcher.is1stlugOff(x):
+        return '1stlug_off'
+    elif state == 1.1 and rocket.launcher.is2ndlugOff(x):
+        return '2ndlug_off'
+    elif state <= 2 and t >= rocket.engine.thrust_cutoff_time:
+        return 'MECO'
+    elif state == 3 and rocket.hasDroguechute() and\
+            rocket.droguechute.checkDeploy(t, x, phase.t_apogee):
+        return 'drogue'
+    elif (state == 3 and not rocket.hasDroguechute() or state == 3.5) and\
+            rocket.parachute.checkDeploy(t, x, phase.t_apogee):
+        return 'para'
+    elif state > 1 and state < 5 and x[2] < 0.0 and t > rocket.engine.thrust_startup_time:
+        return 'landing'
+    return None
+
+
+def phase_events(rocket, phase):
+    '''
+    飛行フェーズphaseの区間を積分する際のsolve_ivpの終端イベント関数とそのラベルのリストを返す
+    OUTPUT
+        (events, labels)
+    '''
+    launcher = rocket.launcher
+    cutoff_time = rocket.engine.thrust_cutoff_time
+    state = phase.state
+
+    events = []
+    labels = []
+
+    def add_event(label, func, direction):
+        func.terminal = True
+        func.direction = direction
+        events.append(func)
+        labels.append(label)
+
+    if state == 1:
+        h = launcher.height_1stlug_off
+        add_event('1stlug_off', lambda t, u: u[2] - h, 1.)
+    elif state == 1.1:
+        h = launcher.height_2ndlug_off
+        add_event('2ndlug_off', lambda t, u: u[2] - h, 1.)
+
+    if state <= 2:
+        add_event('MECO', lambda t, u: t - cutoff_time, 1.)
+
+    if state == 3:
+        if rocket.hasDroguechute():
+            for f, direction in rocket.droguechute.deployEvents(phase.t_apogee):
+                add_event('drogue', f, direction)
+        else:
+            for f, direction in rocket.parachute.deployEvents(phase.t_apogee):
+                add_event('para', f, direction)
+    elif state == 3.5:
+        for f, direction in rocket.parachute.deployEvents(phase.t_apogee):
+            add_event('para', f, direction)
+
+    if state > 1:
+        add_event('landing', lambda t, u: u[2], -1.)
+
+    if phase.t_apogee is None:
+        add_event('apogee', lambda t, u: vertical_speed(t, u), -1.)
+
+    return events, labels
@@ -0,0 +1,110 @@
+# -*- coding:utf-8 -*-
+import time
+import numpy as np
+
+'''
+TrajectorySolverの計測用(profile=True)のクラス
+
+運動方程式と各要素(空力係数, 大気, 風, 重量特性)の関数を計測用のラッパで包んで
+呼び出し回数と実行時間を集計する. ラッパはその積分の運動方程式にのみ渡し,
+Rocketなどの(スレッド間で共有される)オブジェクトは書き換えない.
+計測しない場合の運動方程式には一切手を加えない
+'''
+
+# (要素名, 関数を持つオブジェクトを返す関数, 属性名)
+COMPONENTS = (
+    ('aero', lambda rocket: rocket, 'getAeroCoeffs'),
+    ('atmosphere', lambda rocket: rocket.air, 'standard_air'),
+    ('wind', lambda rocket: rocket.air.wind, 'wind'),
+    ('mass', lambda rocket: rocket, 'getMassProperties')
+)
+
+
+class SolverProfiler:
+    '''
+    飛行フェーズごとの運動方程式の評価回数と実行時間, 積分器の刻み幅,
+    要素ごとの実行時間を集計する
+    '''
+    def __init__(self):
+        self.rhs_count = {}
+        self.rhs_time = {}
+        self.step_sizes = {}
+        self.component_count = {name: 0 for name, _, _ in COMPONENTS}
+        self.component_time = {name: 0.0 for name, _, _ in COMPONENTS}
+        self.wall_time = 0.0
+
+    def wrap_rhs(self, rhs):
+        '''
+        運動方程式 rhs(t, u, state) を飛行フェーズごとに計測するラッパを返す
+        '''
+        rhs_count = self.rhs_count
+        rhs_time = self.rhs_time
+        clock = time.perf_counter
+
+        def timed_rhs(t, u, state):
+            start = clock()
+            du_dt = rhs(t, u, state)
+            rhs_time[state] = rhs_time.get(state, 0.0) + clock() - start
+            rhs_count[state] = rhs_count.get(state, 0) + 1
+            return du_dt
+        return timed_rhs
+
+    def wrap_components(self, rocket):
+        '''
+        rocketの各要素の関数を計測用のラッパで包んだものを返す(rocketは変更しない)
+        OUTPUT
+            COMPONENTSの順の関数のタプル (aero, atmosphere, wind, mass)
+        '''
+        return tuple(
+            self.__wrap_component(name, getattr(owner(rocket), attr))
+            for name, owner, attr in COMPONENTS
+        )
+
+    def add_steps(self, state, t_steps):
+        '''
+        積分器が進んだ時刻の列t_stepsから刻み幅を記録する
+        '''
+        steps = np.diff(np.asarray(t_steps, dtype=float))
+        if len(steps) > 0:
+            self.step_sizes.setdefault(state, []).append(steps)
+
+    def report(self):
+        '''
+        集計結果のDict
+            wall_time: 積分器(solve_ivp, odeint)の実行時間の合計 [s]
+            rhs_count, rhs_time: 飛行フェーズごとの運動方程式の評価回数と実行時間 [s]
+            step_size: 飛行フェーズごとの積分器の刻み幅の統計(n, min, max, mean)と刻み幅の配列(steps)
+            component_count, component_time: 要素ごとの呼び出し回数と実行時間 [s]
+                (numba backendでは運動方程式内の要素は計測されない)
+        '''
+        step_size = {}
+        for state, steps_list in self.step_sizes.items():
+            steps = np.concatenate(steps_list)
+            step_size[state] = {
+                'n': len(steps),
+                'min': float(np.min(steps)),
+                'max': float(np.max(steps)),
+                'mean': float(np.mean(steps)),
+                'steps': steps
+            }
+        return {
+            'wall_time': self.wall_time,
+            'rhs_count': dict(self.rhs_count),
+            'rhs_time': dict(self.rhs_time),
+            'step_size': step_size,
+            'component_count': dict(self.component_count),
+            'component_time': dict(self.component_time)
+        }
+
+    def __wrap_component(self, name, func):
+        component_count = self.component_count
+        component_time = self.component_time
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            result = func(*args, **kwargs)
+            component_time[name] += clock() - start
+            component_count[name] += 1
+            return result
+        return timed
@@ -0,0 +1,253 @@
+# -*- coding:utf-8 -*-
+import os
+import shutil
+import tempfile
+import zipfile
+import numpy as np
+import quaternion
+
+'''
+複数条件のシミュレーション結果を一つの列指向ファイル(非圧縮のnpz)にまとめて保存/読み込みする
+
+ファイルの構成(npz内の配列名)
+    case_id: (n_cases,) 条件番号(昇順)
+    offset, length: (n_cases,) 各条件の弾道履歴の開始位置と長さ
+    t: (n_samples,), x, v, omega: (n_samples, 3), q: (n_samples, 4)
+        全条件の弾道履歴を条件番号順に連結したもの
+    log/<イベント名>/<項目名>: (n_cases, ...) イベントログ(simulate()のlog)の各項目.
+        条件によって存在しないイベントはNaN. 数値でない項目, ネストしたDict,
+        LOG_FIELD_MAX_SIZEより大きい配列(log['analytics']の時間履歴など),
+        条件によって形状が異なる項目は保存しない
+
+読み込み時は各配列をnpz内から直接メモリマップするため, 必要な列だけを読み出せる
+'''
+
+TRAJECTORY_COLUMNS = (('t', 1), ('x', 3), ('v', 3), ('q', 4), ('omega', 3))
+# イベントログの項目として保存する配列の最大要素数(スカラ, 位置ベクトル, クオータニオンなど)
+LOG_FIELD_MAX_SIZE = 16
+
+
+class ResultStoreWriter:
+    '''
+    条件ごとの結果を追記し, close()で一つのnpzファイルにまとめる
+    弾道履歴は追記中は列ごとの一時ファイルに書き出すため, メモリ上には保持しない
+    イベントログは小さいのでメモリ上に保持する
+    '''
+    def __init__(self, path):
+        '''
+        INPUT
+            path: 出力ファイル名(.npz)
+        '''
+        self.path = path
+        self.__spill_dir = tempfile.mkdtemp(
+                            prefix='.result_store_',
+                            dir=os.path.dirname(os.path.abspath(path)))
+        self.__spill_files = {
+            name: open(os.path.join(self.__spill_dir, name), 'wb')
+            for name, _ in TRAJECTORY_COLUMNS
+        }
+        self.__cases = []  # (case_id, 一時ファイル上の開始位置, 長さ)
+        self.__logs = {}
+        self.__log_shapes = {}  # 項目名 -> 形状 (条件によって形状が異なる項目はNone)
+        self.__n_samples = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def append(self, case_id, log, t=None, x=None, v=None, q=None, omega=None):
+        '''
+        一つの条件の結果を追記する
+        INPUT
+            case_id: 条件番号(int)
+            log: simulate()のイベントログ
+            t, x, v, q, omega: simulate()の弾道履歴(x, v, omegaは(3, N), qは(4, N)).
+                省略した場合はイベントログのみ保存する
+        '''
+        length = 0
+        if t is not None:
+            length = len(t)
+            columns = {'t': t, 'x': x, 'v': v, 'q': q, 'omega': omega}
+            for name, width in TRAJECTORY_COLUMNS:
+                value = np.asarray(columns[name], dtype=float).reshape(width, length) if width > 1 \
+                    else np.asarray(columns[name], dtype=float)
+                np.ascontiguousarray(value.T).tofile(self.__spill_files[name])
+        self.__cases.append((int(case_id), self.__n_samples, length))
+        self.__n_samples += length
+
+        for name, item in log.items():
+            if not isinstance(item, dict):
+                continue
+            for field, value in item.items():
+                if isinstance(value, quaternion.quaternion):
+                    value = quaternion.as_float_array(value)
+                # 数値でない項目やネストしたDict(log['profile']の集計結果など)は保存しない
+                if isinstance(value, dict):
+                    continue
+                try:
+                    value = np.asarray(value, dtype=float)
+                except (TypeError, ValueError):
+                    continue
+                # 時間履歴(log['analytics']など)は弾道履歴と同じ長さになるため保存しない
+                if value.size > LOG_FIELD_MAX_SIZE:
+                    continue
+                key = 'log/' + name + '/' + field
+                shape = self.__log_shapes.setdefault(key, value.shape)
+                if shape is None:
+                    continue
+                if shape != value.shape:
+                    # 条件によって形状が異なる項目は保存しない
+                    self.__log_shapes[key] = None
+                    self.__logs.pop(key, None)
+                    continue
+                self.__logs.setdefault(key, {})[int(case_id)] = value
+
+    def close(self):
+        '''
+        一時ファイルをまとめてnpzファイルを作成する
+        '''
+        for f in self.__spill_files.values():
+            f.close()
+
+        cases = sorted(self.__cases)
+        case_id = np.array([c[0] for c in cases], dtype=np.int64)
+        if len(np.unique(case_id)) != len(case_id):
+            self.discard()
+            raise ValueError('Duplicated case_id was appended.')
+        length = np.array([c[2] for c in cases], dtype=np.int64)
+        offset = np.r_[0, np.cumsum(length)[:-1]].astype(np.int64)
+        spill_offset = np.array([c[1] for c in cases], dtype=np.int64)
+
+        # 書き込みに失敗した場合に作りかけのファイルを残さないよう一時ファイルから置き換える
+        tmp_path = self.path + '.' + str(os.getpid()) + '.tmp'
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+                _write_member(zf, 'case_id', case_id)
+                _write_member(zf, 'offset', offset)
+                _write_member(zf, 'length', length)
+                for name, width in TRAJECTORY_COLUMNS:
+                    shape = (self.__n_samples,) if width == 1 else (self.__n_samples, width)
+                    spill = None
+                    if self.__n_samples > 0:
+                        spill = np.memmap(os.path.join(self.__spill_dir, name), dtype=float, mode='r', shape=shape)
+                    # 一時ファイルから条件番号順に少しずつ書き出す
+                    with zf.open(name + '.npy', 'w', force_zip64=True) as f:
+                        np.lib.format.write_array_header_1_0(f, {
+                            'descr': np.lib.format.dtype_to_descr(np.dtype(float)),
+                            'fortran_order': False,
+                            'shape': shape
+                        })
+                        for start, n in zip(spill_offset, length):
+                            if n > 0:
+                                f.write(np.ascontiguousarray(spill[start:start+n]).tobytes())
+                    del spill
+
+                for key, values in self.__logs.items():
+                    sample = next(iter(values.values()))
+                    column = np.full((len(case_id),) + sample.shape, np.nan)
+                    for i, c in enumerate(case_id):
+                        if c in values:
+                            column[i] = values[c]
+                    _write_member(zf, key, column)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            self.discard()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        shutil.rmtree(self.__spill_dir, ignore_errors=True)
+
+    def discard(self):
+        '''
+        書き込みを中止し一時ファイルを削除する
+        '''
+        for f in self.__spill_files.values():
+            f.close()
+        shutil.rmtree(self.__spill_dir, ignore_errors=True)
+
+
+class ResultStore:
+    '''
+    ResultStoreWriterで作成したファイルの読み込み
+    各列はファイルからメモリマップされ, アクセスした部分のみが読み込まれる
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.__members = _npz_members(path)
+        self.case_id = self.column('case_id')
+        self.offset = self.column('offset')
+        self.length = self.column('length')
+        self.__index = {int(c): i for i, c in enumerate(self.case_id)}
+
+    def __len__(self):
+        return len(self.case_id)
+
+    def keys(self):
+        return list(self.__members.keys())
+
+    def column(self, name):
+        '''
+        配列名nameの列をメモリマップして返す
+        '''
+        if name not in self.__members:
+            raise KeyError('Column "'+name+'" was not found in '+self.path)
+        dtype, shape, order, data_offset = self.__members[name]
+        if np.prod(shape) == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=data_offset, shape=shape, order=order)
+
+    def log(self, name, field):
+        '''
+        イベントログの項目を全条件分返す (条件番号順)
+        例: store.log('landing', 'x') -> (n_cases, 3)
+        '''
+        return self.column('log/' + name + '/' + field)
+
+    def events(self):
+        '''
+        保存されているイベント名のリスト
+        '''
+        return sorted({key.split('/')[1] for key in self.__members if key.startswith('log/')})
+
+    def trajectory(self, case_id):
+        '''
+        条件番号case_idの弾道履歴をsimulate()と同じ形式(t, x, v, q, omega)で返す
+        '''
+        i = self.__index[int(case_id)]
+        s = slice(int(self.offset[i]), int(self.offset[i] + self.length[i]))
+        t = np.asarray(self.column('t')[s])
+        return (t,) + tuple(np.asarray(self.column(name)[s]).T for name, _ in TRAJECTORY_COLUMNS[1:])
+
+
+def _write_member(zf, name, array):
+    with zf.open(name + '.npy', 'w', force_zip64=True) as f:
+        np.lib.format.write_array(f, np.asanyarray(array), allow_pickle=False)
+
+
+def _npz_members(path):
+    '''
+    非圧縮npz内の各配列のdtype, shape, order, ファイル先頭からのデータ位置を求める
+    '''
+    members = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('Compressed member '+info.filename+' cannot be memory-mapped.')
+            # ローカルファイルヘッダ(30byte + ファイル名 + 拡張フィールド)の後にデータが続く
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = np.frombuffer(f.read(4), dtype='<u2')
+            f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')]
+            members[name] = (dtype, shape, 'F' if fortran_order else 'C', f.tell())
+    return members
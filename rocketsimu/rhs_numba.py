@@ -0,0 +1,350 @@
+import numpy as np
+from numba import njit
+from .air import standard_aero_coeff
+from .wind import wind_altitude_grid
+from .attitude import NORM_GAIN
+
+
+class NumbaRHS:
+    '''
+    TrajectorySolverの運動方程式(右辺)をnumbaでコンパイルして評価するクラス
+
+    ロケット, エンジン, 空力係数, 風, 環境のパラメータを平坦な配列にまとめ,
+    TrajectorySolver.__f_dynamicsと同じ物理を@njit関数_f_dynamicsで計算する.
+    風は高度方向にテーブル化して線形補間する(wind.wind_altitude_gridの格子)
+    '''
+    def __init__(self, rocket, wind_dh=20., wind_h_max=20000.):
+        '''
+        INPUT
+            rocket: 発射台に設置済みのRocket
+                (engine, parachute, launcher, enviroment, airが設定されていること)
+            wind_dh: 1000m以上での風テーブルの高度刻み[m]
+                (風モデルが固有の刻みを持つ場合はそれ以下とする. wind.wind_altitude_gridを参照)
+            wind_h_max: 風テーブルの最大高度[m] (以上は最大高度の値)
+        '''
+        engine = rocket.engine
+        env = rocket.enviroment
+        air = rocket.air
+        coeff = standard_aero_coeff
+
+        # 推力
+        self.thrust_t = np.ascontiguousarray(engine.thrust_time_array, dtype=float)
+        self.thrust = np.ascontiguousarray(engine.thrust_array, dtype=float)
+
+        # 重量特性 (Rocket.getMassPropertiesのテーブル)
+        self.mass_table = np.ascontiguousarray(rocket.mass_table)
+        self.mass_table_dry = np.ascontiguousarray(rocket.mass_table_dry, dtype=float)
+
+        # 空力係数 (_StandardAeroCoeff.coefficientsのテーブル)
+        self.Cd0_mach = coeff.Cd0_table_mach
+        self.Cd0_table = coeff.Cd0_table * rocket.Cd0
+        self.Clalpha_mach = coeff.Clalpha_table_mach
+        self.Clalpha_table = coeff.Clalpha_table * rocket.Clalpha
+        self.CP_breaks_mach = coeff.CP_breaks_mach
+        self.CP_breaks_alpha = coeff.CP_breaks_alpha
+        self.CP_poly = np.ascontiguousarray(coeff.CP_poly * rocket.CP)
+
+        # 風
+        self.wind_h = wind_altitude_grid(air.wind, wind_dh, wind_h_max)
+        self.wind_table = np.ascontiguousarray(air.wind.wind(self.wind_h), dtype=float)
+
+        # 標準大気の各層
+        self.layer_top = np.asarray(air.LAYER_TOP, dtype=float)
+        self.layer_base = np.c_[air.layer_base_h, air.layer_base_T, air.layer_base_p, air.layer_gamma]
+
+        # 機体/環境のスカラパラメータ
+        # 重力は現在高度に依存しないので地表の値を使う
+        self.scalars = np.r_[
+            engine.thrust_cutoff_time,  # 0
+            rocket.diameter,  # 1
+            rocket.height,  # 2
+            rocket.lug_2nd,  # 3
+            standard_aero_coeff.Cd_amplitude,  # 4
+            rocket.droguechute.getCdS() if rocket.hasDroguechute() else 0.0,  # 5
+            rocket.parachute.getCdS() if rocket.hasParachute() else 0.0,  # 6
+            air.R,  # 7
+            air.g  # 8
+        ]
+        self.vectors = np.array([
+            rocket.Cm,
+            env.g(0.0),
+            env.omega_earth_local
+        ], dtype=float)
+
+    def __call__(self, t, u, state):
+        return _f_dynamics(
+            float(t), u, float(state),
+            self.scalars, self.vectors,
+            self.thrust_t, self.thrust,
+            self.mass_table, self.mass_table_dry,
+            self.Cd0_mach, self.Cd0_table,
+            self.Clalpha_mach, self.Clalpha_table,
+            self.CP_breaks_mach, self.CP_breaks_alpha, self.CP_poly,
+            self.wind_h, self.wind_table,
+            self.layer_top, self.layer_base
+            )
+
+    def descent(self, t, y, state):
+        '''
+        パラシュート展開後の3自由度降下モデルの時間微分 (TrajectorySolver.__f_descentと同じ計算)
+        '''
+        return _f_descent(
+            float(t), y, float(state),
+            self.scalars, self.vectors,
+            self.thrust_t,
+            self.mass_table, self.mass_table_dry,
+            self.wind_h, self.wind_table,
+            self.layer_top, self.layer_base
+            )
+
+
+@njit(cache=True)
+def _interp_index(xp, x):
+    # xpの区間番号と区間内の割合. 範囲外は端の区間に丸める
+    n = len(xp)
+    if x <= xp[0]:
+        return 0, 0.0
+    elif x >= xp[n-1]:
+        return n-2, 1.0
+    i = np.searchsorted(xp, x, side='right') - 1
+    return i, (x - xp[i]) / (xp[i+1] - xp[i])
+
+
+@njit(cache=True)
+def _interp(xp, fp, x):
+    i, frac = _interp_index(xp, x)
+    return fp[i] + (fp[i+1] - fp[i]) * frac
+
+
+@njit(cache=True)
+def _cross(a, b):
+    return np.array([
+        a[1]*b[2] - a[2]*b[1],
+        a[2]*b[0] - a[0]*b[2],
+        a[0]*b[1] - a[1]*b[0]
+    ])
+
+
+@njit(cache=True)
+def _dcm(q):
+    # 局所座標系→機体座標系の変換行列Tbl (quaternion.as_rotation_matrix(np.conj(q))と等価)
+    w, x, y, z = q[0], q[1], q[2], q[3]
+    s = 2.0 / (w*w + x*x + y*y + z*z)
+    R = np.empty((3, 3))
+    R[0, 0] = 1.0 - s*(y*y + z*z)
+    R[0, 1] = s*(x*y + w*z)
+    R[0, 2] = s*(x*z - w*y)
+    R[1, 0] = s*(x*y - w*z)
+    R[1, 1] = 1.0 - s*(x*x + z*z)
+    R[1, 2] = s*(y*z + w*x)
+    R[2, 0] = s*(x*z + w*y)
+    R[2, 1] = s*(y*z - w*x)
+    R[2, 2] = 1.0 - s*(x*x + y*y)
+    return R
+
+
+@njit(cache=True)
+def _standard_air(h, layer_top, layer_base, R, g):
+    # Air.standard_airと同じ計算 (rho, 音速のみ)
+    i = np.searchsorted(layer_top, h, side='left')
+    h_b = layer_base[i, 0]
+    T_b = layer_base[i, 1]
+    p_b = layer_base[i, 2]
+    gamma = layer_base[i, 3]
+    if i == len(layer_top):
+        T = T_b
+        p = p_b
+    elif gamma == 0.:
+        T = T_b
+        p = p_b * np.exp((-g/(R*T_b)) * (h - h_b))
+    else:
+        T = T_b + gamma * (h - h_b)
+        p = p_b * (T / T_b)**(-g / (gamma*R))
+    return p/(R*T), np.sqrt(1.4*R*T)
+
+
+@njit(cache=True, nogil=True)
+def _f_dynamics(
+        t, u, state,
+        scalars, vectors,
+        thrust_t, thrust,
+        mass_table, mass_table_dry,
+        Cd0_mach, Cd0_table,
+        Clalpha_mach, Clalpha_table,
+        CP_breaks_mach, CP_breaks_alpha, CP_poly,
+        wind_h, wind_table,
+        layer_top, layer_base):
+    '''
+    飛行フェーズstateを固定したときの状態量の時間微分du/dt
+    (TrajectorySolver.__f_dynamicsと同じ計算)
+    '''
+    cutoff_time = scalars[0]
+    diameter = scalars[1]
+    height = scalars[2]
+    lug_2nd = scalars[3]
+    Cd_amplitude = scalars[4]
+    CdS_drogue = scalars[5]
+    CdS_para = scalars[6]
+    Cm = vectors[0]
+    g = vectors[1]
+    omega_earth_local = vectors[2]
+
+    x = u[0:3]
+    v = u[3:6]
+    q = u[6:10]
+    omega = u[10:13].copy()
+
+    Tbl = _dcm(q)
+    dx_dt = Tbl.T @ v
+
+    # 重量・重心・慣性モーメントとその微分
+    if t >= cutoff_time:
+        row = mass_table_dry.copy()
+    else:
+        i, frac = _interp_index(thrust_t, t)
+        row = mass_table[i] + (mass_table[i+1] - mass_table[i]) * frac
+    mass = row[0]
+    CG = row[1]
+    MOI = row[2:5].copy()
+    dMOI_dt = row[5:8]
+
+    # 機体座標系での相対風ベクトル
+    i, frac = _interp_index(wind_h, x[2])
+    wind = wind_table[i] + (wind_table[i+1] - wind_table[i]) * frac
+    v_air = -v + Tbl @ wind
+    v_air_norm = np.sqrt(v_air[0]**2 + v_air[1]**2 + v_air[2]**2)
+    if v_air_norm == 0:
+        alpha = 0.
+    else:
+        alpha = np.arccos(min(abs(v_air[0])/v_air_norm, 1.0))
+
+    phi = np.arctan2(-v_air[1], -v_air[2])
+    rho, sound_speed = _standard_air(x[2], layer_top, layer_base, scalars[7], scalars[8])
+    mach = v_air_norm / sound_speed
+
+    # 空力係数
+    Cd = _interp(Cd0_mach, Cd0_table, mach) + Cd_amplitude * (np.cos(2*alpha + np.pi) + 1.0)
+    Cl = _interp(Clalpha_mach, Clalpha_table, mach) * 0.5 * np.sin(2*alpha)
+    mach_c = min(max(mach, CP_breaks_mach[0]), CP_breaks_mach[-1])
+    alpha_c = min(max(alpha, CP_breaks_alpha[0]), CP_breaks_alpha[-1])
+    i, _ = _interp_index(CP_breaks_mach, mach_c)
+    j, _ = _interp_index(CP_breaks_alpha, alpha_c)
+    dm = mach_c - CP_breaks_mach[i]
+    da = alpha_c - CP_breaks_alpha[j]
+    CP = 0.
+    for k in range(3, -1, -1):
+        c = CP_poly[i, j, k]
+        CP = CP * dm + (c[0] + da*(c[1] + da*(c[2] + da*c[3])))
+
+    cosa = np.cos(alpha)
+    sina = np.sin(alpha)
+    air_coeff = np.array([
+        -Cl*sina + Cd*cosa,
+        (Cl*cosa + Cd*sina)*np.sin(phi),
+        (Cl*cosa + Cd*sina)*np.cos(phi)
+    ])
+    rocket_xarea = (diameter/2)**2 * np.pi
+    air_force = 0.5 * rho * v_air_norm**2.0 * rocket_xarea * (-1 * air_coeff)
+
+    air_moment_CG = _cross(np.array([CG - CP, 0.0, 0.0]), air_force)
+    l = np.array([diameter, height, height])
+    air_moment_damping = 0.25 * rho * v_air_norm * Cm * (l**2) * rocket_xarea * omega
+    air_moment = air_moment_CG + air_moment_damping
+
+    g_body = Tbl @ g
+    coriolis = -2.0*_cross(Tbl @ omega_earth_local, v)
+
+    if state <= 2 and t < cutoff_time:
+        thrust_now = _interp(thrust_t, thrust, t)
+    else:
+        thrust_now = 0.0
+
+    if state <= 1.1:
+        # ラグがランチャーに拘束されている時. 機軸方向の正の加速度のみ
+        F_body = air_force.copy()
+        F_body[0] += thrust_now
+        dv_dt = -_cross(omega, v) + g_body + F_body/mass
+        dv_dt[1] = 0.
+        dv_dt[2] = 0.
+        if dv_dt[0] < 0.0:
+            dv_dt[0] = 0.0
+    elif state == 2:
+        F_body = air_force.copy()
+        F_body[0] += thrust_now
+        dv_dt = -_cross(omega, v) + g_body + coriolis + F_body/mass
+    elif state == 3.5 or state == 4:
+        # パラシュート展開時
+        CdS = CdS_drogue if state == 3.5 else CdS_para
+        dv_dt = g_body + coriolis + 0.5 * rho * v_air_norm * v_air * CdS / mass
+    else:
+        # 慣性飛行時orランディング
+        dv_dt = -_cross(omega, v) + g_body + coriolis + air_force/mass
+
+    # 姿勢: dq/dt = 0.5 * q * (0, omega) + ノルム保存の補正項 (attitude.quaternion_derivativeと同じ)
+    # パラシュート展開時は回転を無視
+    if state == 3.5 or state == 4:
+        omega[:] = 0.
+    w, qx, qy, qz = q[0], q[1], q[2], q[3]
+    a, b, c = omega[0], omega[1], omega[2]
+    k = NORM_GAIN * (1.0 - (w*w + qx*qx + qy*qy + qz*qz))
+    dq_dt = np.array([
+        0.5*(-qx*a - qy*b - qz*c) + k*w,
+        0.5*(w*a + qy*c - qz*b) + k*qx,
+        0.5*(w*b - qx*c + qz*a) + k*qy,
+        0.5*(w*c + qx*b - qy*a) + k*qz
+    ])
+
+    # 角速度
+    if state == 1 or state == 3.5 or state == 4:
+        domega_dt = np.zeros(3)
+    else:
+        if state == 1.1:
+            # 2ndラグ周りの回転
+            lug2CG = np.array([lug_2nd - CG, 0., 0.])
+            air_moment = air_moment + _cross(lug2CG, air_force) + _cross(lug2CG, mass * g_body)
+            MOI[1] += mass * (lug_2nd - CG)**2
+            MOI[2] += mass * (lug_2nd - CG)**2
+        domega_dt = (-_cross(omega, MOI*omega) - dMOI_dt*omega + air_moment) / (MOI + 1e-10)
+
+    du_dt = np.empty(13)
+    du_dt[0:3] = dx_dt
+    du_dt[3:6] = dv_dt
+    du_dt[6:10] = dq_dt
+    du_dt[10:13] = domega_dt
+    return du_dt
+
+
+@njit(cache=True, nogil=True)
+def _f_descent(
+        t, y, state,
+        scalars, vectors,
+        thrust_t,
+        mass_table, mass_table_dry,
+        wind_h, wind_table,
+        layer_top, layer_base):
+    '''
+    パラシュート展開後(state 3.5, 4)の局所座標系での位置と速度(6)の時間微分
+    '''
+    cutoff_time = scalars[0]
+    CdS = scalars[5] if state == 3.5 else scalars[6]
+    g = vectors[1]
+    omega_earth_local = vectors[2]
+
+    x = y[0:3]
+    v = y[3:6]
+    if t >= cutoff_time:
+        mass = mass_table_dry[0]
+    else:
+        i, frac = _interp_index(thrust_t, t)
+        mass = mass_table[i, 0] + (mass_table[i+1, 0] - mass_table[i, 0]) * frac
+
+    i, frac = _interp_index(wind_h, x[2])
+    wind = wind_table[i] + (wind_table[i+1] - wind_table[i]) * frac
+    v_air = wind - v
+    v_air_norm = np.sqrt(v_air[0]**2 + v_air[1]**2 + v_air[2]**2)
+    rho, _ = _standard_air(x[2], layer_top, layer_base, scalars[7], scalars[8])
+
+    dy_dt = np.empty(6)
+    dy_dt[0:3] = v
+    dy_dt[3:6] = g - 2.0*_cross(omega_earth_local, v) + 0.5 * rho * v_air_norm * v_air * CdS / mass
+    return dy_dt
@@ -10,7 +10,7 @@ import quaternion
 import json
 import pandas as pd
 import os
-from .engine import RocketEngine
+from .engine import RocketEngine, interpRows
 from .air import standard_aero_coeff
 
 class Rocket:
@@ -62,6 +62,8 @@ class Rocket:
     def overwrite_parameters(self, params):
         self.__params.update(params)
         self.__syncParamWithDict()
+        if hasattr(self.engine, 'prop_table'):
+            self.__buildMassTable()
     
     def getCG(self, t=None):
         if t is None:
@@ -86,6 +88,59 @@ class Rocket:
         MOI_body = self.MOI_dry + self.mass_dry*(CG - self.CG_dry)**2 * yz_unit
         MOI_prop = self.engine.propMOI(t) + self.engine.propMass(t)*(CG - self.CG_prop)**2 * yz_unit
         return (MOI_body + MOI_prop)
+
+    def getMassProperties(self, t=None):
+        '''
+        重量・重心・慣性モーメントと慣性モーメントの時間微分を
+        joinEngine時に作成したテーブルから一度の補間で求める
+        INPUT
+            t: 時刻(スカラまたは配列)
+        OUTPUT
+            (mass, CG, MOI(3), dMOI_dt(3))
+            tが配列(長さN)の場合は (mass(N), CG(N), MOI(N, 3), dMOI_dt(N, 3))
+        '''
+        if t is None:
+            t = self.t
+        if np.ndim(t) > 0:
+            t = np.asarray(t, dtype=float)
+            time_array = self.engine.thrust_time_array
+            rows = np.stack([np.interp(t, time_array, col) for col in self.mass_table.T], axis=1)
+            rows[t >= self.engine.thrust_cutoff_time] = self.mass_table_dry
+            return rows[:, 0], rows[:, 1], rows[:, 2:5], rows[:, 5:8]
+        if t >= self.engine.thrust_cutoff_time:
+            row = self.mass_table_dry.copy()
+        else:
+            row = interpRows(self.__mass_time_list, self.mass_table, t)
+        return row[0], row[1], row[2:5], row[5:8]
+
+    def __buildMassTable(self):
+        '''
+        推力の時刻列上で重量, 重心, 慣性モーメント, 慣性モーメントの時間微分を計算する
+        columns: mass, CG, MOI(3), dMOI/dt(3)
+        '''
+        prop = self.engine.prop_table
+        mass_prop = prop[:, 0]
+        MOI_prop = prop[:, 1:4]
+        dmass_prop = prop[:, 4]
+        dMOI_prop = prop[:, 5:8]
+
+        mass = self.mass_dry + mass_prop
+        CG = (self.CG_dry*self.mass_dry + self.CG_prop*mass_prop) / mass
+        dCG = dmass_prop * (self.CG_prop - CG) / mass
+
+        # 平衡軸の定理(getMOIと同じ)とその時間微分
+        yz_unit = np.array([0, 1.0, 1.0])
+        d_dry = (CG - self.CG_dry)[:, np.newaxis]
+        d_prop = (CG - self.CG_prop)[:, np.newaxis]
+        MOI = self.MOI_dry + self.mass_dry*d_dry**2 * yz_unit +\
+                MOI_prop + mass_prop[:, np.newaxis]*d_prop**2 * yz_unit
+        dMOI = 2*self.mass_dry*d_dry*dCG[:, np.newaxis] * yz_unit +\
+                dMOI_prop + (dmass_prop[:, np.newaxis]*d_prop**2 +
+                            2*mass_prop[:, np.newaxis]*d_prop*dCG[:, np.newaxis]) * yz_unit
+
+        self.mass_table = np.c_[mass, CG, MOI, dMOI]
+        self.mass_table_dry = np.r_[self.mass_dry, self.CG_dry, self.MOI_dry, np.zeros(3)]
+        self.__mass_time_list = self.engine.thrust_time_array.tolist()
     
     def isOverApogee(self):
         return self.t_apogee != None
@@ -93,10 +148,21 @@ class Rocket:
     def setRocketOnLauncher(self):
         self.launcher.setRocket(self)
 
-    def joinEngine(self, engine, position):
+    def joinEngine(self, engine, position, mass_tables=None):
+        '''
+        INPUT
+            engine: 推力履歴を読み込み済みのRocketEngine
+            position: 推進剤重心のノーズ先端からの位置 [m]
+            mass_tables: 作成済みの(mass_table, mass_table_dry). 省略時は作成する
+        '''
         self.engine = engine
         self.CG_prop = position
         self.CG_rocket_init = self.getCG(0)
+        if mass_tables is None:
+            self.__buildMassTable()
+        else:
+            self.mass_table, self.mass_table_dry = mass_tables
+            self.__mass_time_list = engine.thrust_time_array.tolist()
     
     def joinDroguechute(self, droguechute):
         self.droguechute = droguechute
@@ -126,6 +192,14 @@ class Rocket:
     
     def getCd(self, mach, alpha):
         return standard_aero_coeff.Cd(mach, alpha, self.Cd0)
+
+    def getAeroCoeffs(self, mach, alpha):
+        '''
+        getCd, getCl, getCPをまとめて高速に求める
+        OUTPUT
+            (Cd, Cl, CP)
+        '''
+        return standard_aero_coeff.coefficients(mach, alpha, self.Cd0, self.Clalpha, self.CP)
     
     def __syncParamWithDict(self):
         self.height = self.__params['height']
@@ -0,0 +1,106 @@
+# -*- coding:utf-8 -*-
+import copy
+import numpy as np
+from . import dispersion
+from .vehicle import compile_parameters
+
+'''
+落下地点, 最高高度などの出力のパラメータに対する感度(ヤコビ行列)を求めるスクリプト
+
+基準パラメータと各パラメータを摂動させた条件をまとめて一つの条件列とし,
+dispersion.run_dispersionで並列に計算して差分をとる(推力/重量特性の前処理結果は共有される).
+'''
+
+DEFAULT_OUTPUTS = ('landing_x', 'landing_y', 'apogee', 'max_q', 'launch_clear_velocity')
+
+
+def sensitivity(
+        parameters,
+        names,
+        outputs=DEFAULT_OUTPUTS,
+        steps=None,
+        rel_step=1e-2,
+        scheme='central',
+        n_workers=None,
+        backend='python'):
+    '''
+    出力のパラメータに対するヤコビ行列を差分で求める
+    INPUT
+        parameters: 基準となるロケットのパラメータ(Dict, ファイル名またはPreparedVehicle)
+        names: 感度を求めるパラメータのリスト. ネストしたパラメータやリストの要素は'.'区切りで指定する
+            例: 'Cd0', 'CP', 'mass_dry', 'MOI_dry.1', 'wind_parameters.wind_std.0'
+        outputs: 出力の名前(dispersion.OUTPUTSのキー)のリスト
+        steps: パラメータごとの差分の刻み幅のDict(省略したパラメータはrel_stepから決める)
+        rel_step: 相対刻み幅. 刻み幅は rel_step * |基準値| (基準値が0の場合はrel_step)
+            積分器の刻み幅の選択による出力の揺らぎを拾わないよう, 小さすぎない値とする
+        scheme: 'central'(中心差分, 2N+1回の計算) or 'forward'(前進差分, N+1回の計算)
+        n_workers: ワーカープロセス数. 省略時はCPU数
+        backend: 運動方程式の計算方法 'python' or 'numba' (simulate()と同じく省略時は'python')
+    OUTPUT
+        Dict
+        names, outputs: パラメータと出力の名前のリスト
+        values: パラメータの基準値 (N,)
+        steps: 差分の刻み幅 (N,)
+        nominal: 基準パラメータでの出力 (出力の数,)
+        jacobian: d出力/dパラメータ (出力の数, N)
+    '''
+    if scheme not in ('central', 'forward'):
+        raise ValueError('Invalid difference scheme "'+str(scheme)+'" was indicated.')
+    vehicle = compile_parameters(parameters)
+    params = vehicle.params
+    names = list(names)
+    outputs = list(outputs)
+    steps = {} if steps is None else steps
+
+    values = np.array([_get_value(params, name) for name in names], dtype=float)
+    h = np.array([
+        steps[name] if name in steps else (rel_step * abs(value) if value != 0 else rel_step)
+        for name, value in zip(names, values)
+    ])
+
+    # 基準条件, 各パラメータの+h (, -h) の順に並べた条件列
+    signs = (1.0, -1.0) if scheme == 'central' else (1.0,)
+    cases = [{}]
+    for name, value, h_i in zip(names, values, h):
+        for sign in signs:
+            cases.append(_perturbed_case(params, name, value + sign*h_i))
+
+    logs = dispersion.run_dispersion(vehicle, cases, n_workers=n_workers, backend=backend, trajectory=False)
+    Y = dispersion.log_outputs(logs, outputs)
+    nominal = Y[0]
+    if scheme == 'central':
+        jacobian = (Y[1::2] - Y[2::2]).T / (2.0 * h)
+    else:
+        jacobian = (Y[1:] - nominal).T / h
+
+    return {
+        'names': names,
+        'outputs': outputs,
+        'values': values,
+        'steps': h,
+        'nominal': nominal,
+        'jacobian': jacobian
+    }
+
+
+def _split(name):
+    return [int(key) if key.isdigit() else key for key in name.split('.')]
+
+
+def _get_value(params, name):
+    value = params
+    for key in _split(name):
+        value = value[key]
+    return value
+
+
+def _perturbed_case(params, name, value):
+    # トップレベルのキーで上書きするcaseを作る(ネストしたパラメータはトップレベルの値ごと置き換える)
+    keys = _split(name)
+    top = copy.deepcopy(params[keys[0]]) if len(keys) > 1 else value
+    if len(keys) > 1:
+        target = top
+        for key in keys[1:-1]:
+            target = target[key]
+        target[keys[-1]] = value
+    return {keys[0]: top}
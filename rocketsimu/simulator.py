@@ -9,6 +9,9 @@ from .air import Air
 from .wind import createWind
 from .parachute import Parachute
 from .solver import TrajectorySolver
+from .batch import BatchTrajectorySolver
+from .vehicle import PreparedVehicle, compile_parameters
+from .analytics import flight_analytics, air_data as flight_air_data
 
 __author__ = 'Yusuke YAMAMOTO <motsulab@gmail.com>'
 __status__ = 'debug'
@@ -19,12 +22,20 @@ __date__ = '8 Apl 2019'
 シミュレーションインターフェース関数をまとめたスクリプト
 '''
 
-def simulate(parameters, cons_out=True):
+def simulate(parameters, cons_out=True, backend='python', engine=None, analytics=False, profile=False):
     '''
     INPUT
-        parameters: ロケットのパラメータが格納されているDictまたはファイル名
+        parameters: ロケットのパラメータが格納されているDictまたはファイル名,
+            またはcompile_parameters()で前処理済みのPreparedVehicle
+        backend: 運動方程式の計算方法 'python' or 'numba' (TrajectorySolverを参照)
+        engine: 推力履歴を読み込み済みのRocketEngine. 省略時はparametersから読み込む
+            (同じエンジンで多数の条件を計算する場合に推力の読み込み/フィルタ処理を省略できる)
+        analytics: Trueの場合, 対気速度・動圧・迎角・安定余裕などの時間履歴(flight_analytics()を参照)を
+            log['analytics']に格納する(時間履歴のためResultStoreWriterには保存されない). MaxQ, MaxMach, MaxVなどの極値はanalyticsによらず対気速度から求める
+            (MaxVのspeedは対気速度, ground_speedは対地速度)
+        profile: Trueの場合, 積分の計測結果をlog['profile']に格納する(TrajectorySolverを参照)
     OUTPUT
-        タプル(t, x, v, q, omega)
+        タプル(t, x, v, q, omega, log)
         t: time arrray
         x: 各時刻におけるランチャからの位置ベクトル
         v: 各時刻における地球から見た機体座標系での速度ベクトル
@@ -32,57 +43,20 @@ def simulate(parameters, cons_out=True):
         omega: 各時刻における機体座標系各軸周りの各速度ベクトル
     '''
 
-    if type(parameters) is str:
-        with open(parameters, 'r') as f:
-            params = json.load(f)
-    elif type(parameters) is dict:
-        params = parameters
-    
-    rocket = Rocket(params)
-    engine = RocketEngine(params)
-    engine.loadThrust(params['thrust_curve_csv'], params['thrust_dt'])
-
-    if params['is_drogue'] is True:
-        drogue = Parachute(params['Cd_drogue'], params['S_drogue'])
-    para = Parachute(params['Cd_para'], params['S_para'])
+    params, rocket = _prepare_rocket(parameters, engine)
 
-    # set trigger of the droguechute's deployment
-    if params['is_drogue'] is True:
-        drogue_triggers_dict = params['drogue_trigger']
-        if 'flight_time' in drogue_triggers_dict:
-            drogue.setFlightTimeTrigger(drogue_triggers_dict['flight_time'])
-        if 'fall_time' in drogue_triggers_dict:
-            drogue.setFallTimeTrigger(drogue_triggers_dict['fall_time'])
-        if 'altitude' in drogue_triggers_dict:
-            drogue.setAltitudeTrigger(drogue_triggers_dict['altitude'])
-
-    # set trigger of the parachute's deployment
-    para_triggers_dict = params['para_trigger']
-    if 'flight_time' in para_triggers_dict:
-        para.setFlightTimeTrigger(para_triggers_dict['flight_time'])
-    if 'fall_time' in para_triggers_dict:
-        para.setFallTimeTrigger(para_triggers_dict['fall_time'])
-    if 'altitude' in para_triggers_dict:
-        para.setAltitudeTrigger(para_triggers_dict['altitude'])
-
-    if params['is_drogue'] is True:
-        rocket.joinDroguechute(drogue)
-    rocket.joinParachute(para)
-    rocket.joinEngine(engine, position=params['CG_prop'])
-
-    wind = createWind(params['wind_model'], params['wind_parameters'])
-    rocket.air = Air(wind)
-    rocket.launcher = Launcher(params['rail_length'], params['azimuth'], params['elev_angle'])
-    rocket.enviroment = Enviroment(params['latitude'], params['longitude'], params['alt_launcher'])
-
-    rocket.setRocketOnLauncher()
-
-    solver = TrajectorySolver(rocket, dt=params['dt'], max_t=params['t_max'], cons_out=cons_out)
+    solver = TrajectorySolver(
+                rocket,
+                dt=params['dt'],
+                max_t=params['t_max'],
+                cons_out=cons_out,
+                backend=backend,
+                profile=profile)
     
     solution = solver.solve().T
 
-    # landingまでの時刻を切り出し
-    t_landing = solver.solver_log['landing']['t']
+    # landingまでの時刻を切り出し (t_maxまでに着地しない場合は全時刻)
+    t_landing = solver.solver_log['landing']['t'] if 'landing' in solver.solver_log else np.inf
     t_valid = solver.t[solver.t < t_landing]
 
     # landingまでに切り出し
@@ -91,17 +65,12 @@ def simulate(parameters, cons_out=True):
     q_sol = solution[6:10].T[solver.t < t_landing].T
     omega_sol = solution[10:].T[solver.t < t_landing].T
 
-    # MaxQ, MaxMach, MaxVなどの導出
-    speed = np.linalg.norm(v_sol, axis=0)
-    a_speed = np.zeros((len(t_valid)))
-    rho = np.zeros((len(t_valid)))
-    p = np.zeros((len(t_valid)))
-    T = np.zeros((len(t_valid)))
-    for i, alt in enumerate(x_sol[2]):
-        T[i], p[i], rho[i], a_speed[i] = rocket.air.standard_air(alt)
-    mach = speed / a_speed
-
-    Q = 0.5 * rho * speed**2
+    # MaxQ, MaxMach, MaxVなどの導出(対気速度による)
+    air_data = flight_air_data(rocket, x_sol, v_sol, q_sol)
+    speed = air_data['airspeed']
+    T, p = air_data['T'], air_data['p']
+    mach = air_data['mach']
+    Q = air_data['Q']
     Q_max_idx = np.argmax(Q)
     Mach_max_idx = np.argmax(mach)
     v_max_idx = np.argmax(speed)
@@ -131,7 +100,131 @@ def simulate(parameters, cons_out=True):
         'p': p[v_max_idx],
         'T': T[v_max_idx],
         'speed': speed[v_max_idx],
+        'ground_speed': air_data['speed'][v_max_idx],
         'mach': mach[v_max_idx]
     }
 
-    return t_valid, x_sol, v_sol, q_sol, omega_sol, solver.solver_log
\ No newline at end of file
+    if analytics:
+        solver.solver_log['analytics'] = flight_analytics(rocket, t_valid, x_sol, v_sol, q_sol, omega_sol)
+
+    return t_valid, x_sol, v_sol, q_sol, omega_sol, solver.solver_log
+
+
+def simulate_batch(parameters, winds=None, Cd0_scale=1.0, mass_dry=None, elev_angle=None, cons_out=True):
+    '''
+    パラメータの一部をメンバ毎に変えた複数条件のシミュレーションを一括で行う
+    INPUT
+        parameters: ロケットのパラメータが格納されているDictまたはファイル名,
+            またはcompile_parameters()で前処理済みのPreparedVehicle
+        winds: メンバ毎の風モデルのリスト. 要素はWindインスタンスまたは
+            {"wind_model": ..., "wind_parameters": {...}} 形式のDict
+        Cd0_scale: Cd0に掛けるスケール(スカラまたはメンバ毎の配列)
+        mass_dry: 乾燥重量[kg](スカラまたはメンバ毎の配列)
+        elev_angle: ランチャ仰角[deg](スカラまたはメンバ毎の配列)
+    OUTPUT
+        メンバ毎のイベントログ(simulate()のlogと同形式)のリスト
+    '''
+    params, rocket = _prepare_rocket(parameters)
+
+    if winds is not None:
+        winds = [
+            createWind(w['wind_model'], w['wind_parameters']) if type(w) is dict else w
+            for w in winds
+        ]
+
+    solver = BatchTrajectorySolver(
+                rocket,
+                winds=winds,
+                Cd0_scale=Cd0_scale,
+                mass_dry=mass_dry,
+                elev_angle=elev_angle,
+                dt=params['dt'],
+                max_t=params['t_max'],
+                cons_out=cons_out
+                )
+    return solver.solve()
+
+
+def _prepare_rocket(parameters, engine=None):
+    '''
+    パラメータ(DictまたはPreparedVehicle)からパラメータDictと組み立て済みのRocketを返す
+    '''
+    if isinstance(parameters, PreparedVehicle):
+        params = parameters.params
+        rocket = _build_rocket(
+                    params,
+                    parameters.engine,
+                    (parameters.mass_table, parameters.mass_table_dry)
+                    )
+    else:
+        params = _load_parameters(parameters)
+        rocket = _build_rocket(params, engine)
+    return params, rocket
+
+
+def _load_parameters(parameters):
+    if isinstance(parameters, PreparedVehicle):
+        return parameters.params
+    if type(parameters) is str:
+        with open(parameters, 'r') as f:
+            params = json.load(f)
+    elif type(parameters) is dict:
+        params = parameters
+    return params
+
+
+def _build_rocket(params, engine=None, mass_tables=None):
+    '''
+    パラメータDictからランチャ上に設置済みのRocketを組み立てる
+    engineを指定した場合は推力を読み込まずにそのエンジンを使用する
+    mass_tablesを指定した場合は重量特性テーブルを作成せずに使用する(Rocket.joinEngine)
+    '''
+    rocket = Rocket(params)
+    if engine is None:
+        engine = _load_engine(params)
+
+    if params['is_drogue'] is True:
+        drogue = Parachute(params['Cd_drogue'], params['S_drogue'])
+    para = Parachute(params['Cd_para'], params['S_para'])
+
+    # set trigger of the droguechute's deployment
+    if params['is_drogue'] is True:
+        drogue_triggers_dict = params['drogue_trigger']
+        if 'flight_time' in drogue_triggers_dict:
+            drogue.setFlightTimeTrigger(drogue_triggers_dict['flight_time'])
+        if 'fall_time' in drogue_triggers_dict:
+            drogue.setFallTimeTrigger(drogue_triggers_dict['fall_time'])
+        if 'altitude' in drogue_triggers_dict:
+            drogue.setAltitudeTrigger(drogue_triggers_dict['altitude'])
+
+    # set trigger of the parachute's deployment
+    para_triggers_dict = params['para_trigger']
+    if 'flight_time' in para_triggers_dict:
+        para.setFlightTimeTrigger(para_triggers_dict['flight_time'])
+    if 'fall_time' in para_triggers_dict:
+        para.setFallTimeTrigger(para_triggers_dict['fall_time'])
+    if 'altitude' in para_triggers_dict:
+        para.setAltitudeTrigger(para_triggers_dict['altitude'])
+
+    if params['is_drogue'] is True:
+        rocket.joinDroguechute(drogue)
+    rocket.joinParachute(para)
+    rocket.joinEngine(engine, position=params['CG_prop'], mass_tables=mass_tables)
+
+    wind = createWind(params['wind_model'], params['wind_parameters'])
+    rocket.air = Air(wind)
+    rocket.launcher = Launcher(params['rail_length'], params['azimuth'], params['elev_angle'])
+    rocket.enviroment = Enviroment(params['latitude'], params['longitude'], params['alt_launcher'])
+
+    rocket.setRocketOnLauncher()
+    return rocket
+
+
+def _load_engine(params):
+    engine = RocketEngine(params)
+    engine.loadThrust(
+        params['thrust_curve_csv'],
+        params['thrust_dt'],
+        lpf_method=params.get('thrust_lpf_method', 'fft'),
+        resample_tol=params.get('thrust_resample_tol'))
+    return engine
@@ -1,29 +1,144 @@
+import time
+import functools
+import threading
 import numpy as np
 import quaternion
-from scipy.integrate import odeint
+from scipy.integrate import odeint, solve_ivp
 from .enviroment import Enviroment
 from .rocket import Rocket
+from .profiler import SolverProfiler
+from .attitude import dcm, quaternion_derivative, normalize
+from .phase import INITIAL_PHASE, EVENT_MESSAGES, advance, immediate_transition, phase_events, vertical_speed
+
+# odeint(ODEPACK)は内部状態をグローバルに持ち再入可能でないため, スレッド間で排他する
+_odeint_lock = threading.Lock()
 
 class TrajectorySolver:
+    '''
+    6自由度弾道を積分するソルバ
+
+    mode
+        'event': solve_ivpによるイベント駆動型の適応刻み積分(デフォルト)
+            飛行フェーズ毎に積分を区切り, ラグオフ/MECO/パラシュート展開/着地
+            などの遷移時刻をイベント関数の根として求める. 着地で積分を終了する
+        'odeint': 固定グリッド上でodeintを用いる従来の積分
+
+    backend
+        'python': 運動方程式をnumpy/quaternionで評価する(デフォルト)
+        'numba': numbaでコンパイルした運動方程式(rhs_numba.NumbaRHS)を使用する.
+            風は高度方向のテーブルから補間する
+
+    output (出力する状態量の選び方)
+        'grid': 時刻グリッドself.t上の状態量(デフォルト).
+            output_dtを指定した場合はその刻みの等間隔グリッドとする.
+            eventモードでは着地以降の時刻は出力しない
+        'steps': 積分器の刻みoutput_every回ごとの状態量と各イベント時の状態量
+            (odeintモードではグリッドのoutput_every点ごと)
+        'events': 初期状態と各イベント時の状態量のみ
+
+    callback
+        callback(t, u)を指定した場合, 状態量は生成され次第(eventモードでは飛行フェーズの
+        区間ごとに)callbackに渡され, solve()は状態量を保持しない.
+        iter_solve()で状態量を順に受け取ることもできる
+
+    profile
+        Trueの場合, 飛行フェーズごとの運動方程式の評価回数と実行時間, 積分器の刻み幅,
+        要素(空力係数, 大気, 風, 重量特性)ごとの実行時間を計測し solver_log['profile'] に格納する
+        (profiler.SolverProfiler.reportを参照). Falseの場合は計測用の処理を一切行わない
+
+    descent (eventモードでのパラシュート展開後(state 3.5, 4)の積分方法)
+        '3dof': 局所座標系での位置と速度のみの質点モデル(6次元)で積分する(デフォルト).
+            展開中は回転を無視する(omega=0)ため姿勢は一定であり, 全自由度モデルと同じ運動方程式となる.
+            出力する状態量の姿勢と角速度は展開時の値のまま, 速度は機体座標系に戻す.
+            着地位置は全自由度モデルと積分誤差(rtol, atol)の範囲で一致する
+        '6dof': 全自由度モデル(13次元)のまま積分する
+
+    飛行フェーズ(phase.FlightPhase)は積分ごとに明示的に受け渡し, Rocketには書き込まない.
+    そのため同じRocketを複数のTrajectorySolverで共有し, スレッドで並行に積分できる
+    (ただし odeintモードの積分はスレッド間で排他されるため並行には実行されない).
+    積分後の飛行フェーズはself.phaseに格納される
+    '''
     def __init__(
             self,
             rocket:Rocket,
             dt=0.05,
             max_t=1000.0,
-            cons_out=True):
-        self.state = 1
-        self.apogee_flag = False
+            cons_out=True,
+            mode='event',
+            method='RK45',
+            rtol=1e-6,
+            atol=1e-8,
+            backend='python',
+            output='grid',
+            output_every=1,
+            output_dt=None,
+            callback=None,
+            profile=False,
+            descent='3dof'):
+        if mode not in ('event', 'odeint'):
+            raise ValueError('Invalid solver mode "'+str(mode)+'" was indicated.')
+        if backend not in ('python', 'numba'):
+            raise ValueError('Invalid solver backend "'+str(backend)+'" was indicated.')
+        if output not in ('grid', 'steps', 'events'):
+            raise ValueError('Invalid output policy "'+str(output)+'" was indicated.')
+        if descent not in ('3dof', '6dof'):
+            raise ValueError('Invalid descent model "'+str(descent)+'" was indicated.')
+        if int(output_every) < 1:
+            raise ValueError('output_every must be a positive integer.')
+
+        self.phase = INITIAL_PHASE
         self.rocket = rocket
         self.dt = dt
         self.max_t = max_t
         self.cons = cons_out
+        self.mode = mode
+        self.method = method
+        self.rtol = rtol
+        self.atol = atol
+        self.backend = backend
+        self.output = output
+        self.output_every = int(output_every)
+        self.callback = callback
+        self.profile = profile
+        self.descent = descent
+        self.profiler = None
         self.solver_log = {}
-        self.t = np.r_[
-                        np.arange(0.0,3.,self.dt/10),
-                        np.arange(3., self.max_t, self.dt)
-                        ]
-    
+        if output_dt is None:
+            self.t_grid = np.r_[
+                            np.arange(0.0,3.,self.dt/10),
+                            np.arange(3., self.max_t, self.dt)
+                            ]
+        else:
+            self.t_grid = np.arange(0.0, self.max_t, output_dt)
+        # 出力された状態量の時刻 (solve()後に更新される)
+        self.t = self.t_grid
+        self.solution = None
+
     def solve(self):
+        '''
+        弾道を積分し, 出力方針(output)に従って選んだ状態量の配列(n, 13)を返す
+        callbackを指定した場合は状態量をcallbackに渡してNoneを返す
+        '''
+        if self.callback is not None:
+            for t, u in self.iter_solve():
+                self.callback(t, u)
+            self.t = None
+            self.solution = None
+            return None
+
+        t_list = []
+        u_list = []
+        for t, u in self.iter_solve():
+            t_list.append(t)
+            u_list.append(u)
+        self.t = np.array(t_list)
+        self.solution = np.array(u_list).reshape((len(t_list), 13))
+        return self.solution
+
+    def iter_solve(self):
+        '''
+        弾道を積分し, 出力方針(output)に従って選んだ状態量(t, u)を順に返すジェネレータ
+        '''
         u0 = np.r_[
             self.rocket.x,
             self.rocket.v,
@@ -31,151 +146,276 @@ class TrajectorySolver:
             self.rocket.omega
         ]
 
-        self.solver_log = {}
-        self.solution = odeint(self.__f_main, u0, self.t)
-        return self.solution
-    
+        if self.backend == 'numba':
+            # numbaはnumba backendを使用するときのみ必要
+            from .rhs_numba import NumbaRHS
+            rhs = NumbaRHS(self.rocket)
+            descent_rhs = rhs.descent
+        else:
+            rhs = self.__f_dynamics
+            descent_rhs = self.__f_descent
+
+        # 計測時は運動方程式と各要素を計測用のラッパで包む
+        # (要素のラッパはこの積分の運動方程式にのみ渡し, 共有されるRocketは変更しない)
+        profiler = SolverProfiler() if self.profile else None
+        if profiler is not None:
+            if self.backend != 'numba':
+                components = profiler.wrap_components(self.rocket)
+                rhs = functools.partial(rhs, components=components)
+                descent_rhs = functools.partial(descent_rhs, components=components)
+            rhs = profiler.wrap_rhs(rhs)
+            descent_rhs = profiler.wrap_rhs(descent_rhs)
+
+        run = _SolverRun(rhs, descent_rhs, profiler)
+        self.solver_log = run.log
+        self.profiler = profiler
+        try:
+            if self.mode == 'odeint':
+                yield from self.__iter_odeint(run, u0)
+            else:
+                yield from self.__iter_event(run, u0)
+        finally:
+            self.phase = run.phase
+            if profiler is not None:
+                run.log['profile'] = profiler.report()
+
     def add_solver_log(self, name:str, **kwargs):
         self.solver_log[name] = kwargs
-    
-    def __f_main(self, u, t):
+
+    def __log_event(self, run, name, message, t, u):
+        x = np.copy(u[0:3])
+        if self.cons:
+            print('------------------')
+            print(message, 'at t=', t, '[s]')
+            if name == 'landing':
+                print('x:', x)
+            else:
+                print('altitude:', x[2], '[m]')
+
+        run.log[name] = dict(
+            t=t,
+            x=x,
+            v=np.copy(u[3:6]),
+            q=quaternion.as_quat_array(np.copy(u[6:10])),
+            omega=np.copy(u[10:])
+            )
+
+    # ----------------------------
+    #    Event-driven integration
+    # ----------------------------
+    def __iter_event(self, run, u0):
+        t = 0.0
+        u = np.array(u0, dtype=float)
+        if self.output != 'grid':
+            yield t, u.copy()
+
+        while t < self.max_t:
+            # 区間の始点でクオータニオンを単位クオータニオンに射影する
+            u[6:10] = normalize(u[6:10])
+            self.__apply_immediate_transitions(run, t, u)
+            if run.phase.state == 5:
+                break
+
+            events, labels = phase_events(self.rocket, run.phase)
+            state = run.phase.state
+            # パラシュート展開後は(頂点検出後であれば)3自由度モデルで積分する
+            reduced = self.descent == '3dof' and (state == 3.5 or state == 4) and run.phase.t_apogee is not None
+            if reduced:
+                Tbl = dcm(u[6:10])
+                fun = lambda _t, _y: run.descent_rhs(_t, _y, state)
+                y0 = np.r_[u[0:3], np.dot(Tbl.T, u[3:6])]
+            else:
+                fun = lambda _t, _u: run.rhs(_t, _u, state)
+                y0 = u
+            if run.profiler is not None:
+                t_integration = time.perf_counter()
+            sol = solve_ivp(
+                fun,
+                (t, self.max_t),
+                y0,
+                method=self.method,
+                events=events,
+                dense_output=True,
+                rtol=self.rtol,
+                atol=self.atol
+                )
+            if run.profiler is not None:
+                run.profiler.wall_time += time.perf_counter() - t_integration
+                run.profiler.add_steps(state, sol.t)
+            if sol.status == -1:
+                raise RuntimeError('Integration failed at t='+str(t)+': '+sol.message)
+            if reduced:
+                sol = _DescentSolution(sol, Tbl, u[6:10], u[10:13])
+
+            t_start = t
+            t = sol.t[-1]
+            u = sol.y[:, -1].copy()
+
+            if sol.status == 1:
+                # 終端イベントのうち最も早く発生したものを処理する
+                fired = [
+                    i for i, t_ev in enumerate(sol.t_events)
+                    if len(t_ev) > 0 and t_ev[0] <= t
+                ]
+                i_event = min(fired, key=lambda i: sol.t_events[i][0])
+                self.__handle_event(run, labels[i_event], t, u)
+
+            yield from self.__segment_output(run, t_start, sol)
+
+    def __segment_output(self, run, t_start, sol):
+        # 1つの飛行フェーズ区間[t_start, t_end]の出力
+        t_end = sol.t[-1]
+        if self.output == 'grid':
+            # 区間ごとの密出力から出力グリッド上の状態量を求める(区間の終端は次の区間に含める)
+            t_grid = self.t_grid[(self.t_grid >= t_start) & (self.t_grid < t_end)]
+            if len(t_grid) > 0:
+                yield from zip(t_grid, sol.sol(t_grid).T)
+        elif self.output == 'steps':
+            # 積分器の刻み(sol.t[1:])のoutput_every回ごと, 及び区間の終端
+            for i in range(1, len(sol.t)):
+                run.n_step += 1
+                if run.n_step % self.output_every == 0 or i == len(sol.t) - 1:
+                    yield sol.t[i], sol.y[:, i].copy()
+        else:
+            yield t_end, sol.y[:, -1].copy()
+
+    # ----------------------------
+    #    Fixed-grid integration (odeint)
+    # ----------------------------
+    def __iter_odeint(self, run, u0):
+        f_main = lambda u, t: self.__f_main(run, u, t)
+        if run.profiler is None:
+            with _odeint_lock:
+                solution = odeint(f_main, u0, self.t_grid)
+        else:
+            t_integration = time.perf_counter()
+            with _odeint_lock:
+                solution, info = odeint(f_main, u0, self.t_grid, full_output=True)
+            run.profiler.wall_time += time.perf_counter() - t_integration
+            # odeintでは出力グリッドの各区間で最後に使用した刻み幅のみ得られる.
+            # 飛行フェーズは区別できないため'all'にまとめる
+            run.profiler.step_sizes['all'] = [info['hu']]
+        if self.output == 'grid':
+            yield from zip(self.t_grid, solution)
+        elif self.output == 'steps':
+            for i in range(0, len(self.t_grid), self.output_every):
+                yield self.t_grid[i], solution[i]
+        else:
+            # odeintではイベントはグリッド上で検出されるのでログから状態量を取り出す
+            yield self.t_grid[0], solution[0]
+            for item in sorted(run.log.values(), key=lambda item: item['t']):
+                yield item['t'], np.r_[
+                    item['x'], item['v'], quaternion.as_float_array(item['q']), item['omega']
+                    ]
+
+    def __handle_event(self, run, label, t, u):
+        self.__log_event(run, label, EVENT_MESSAGES[label], t, u)
+        run.phase = advance(run.phase, label, t)
+
+    def __apply_immediate_transitions(self, run, t, u):
+        # イベント発生点で既に満たされている遷移条件を処理する
+        # (例: 頂点到達時点で既に展開高度を下回っている場合)
+        while True:
+            label = immediate_transition(self.rocket, t, u, run.phase)
+            if label is None:
+                break
+            self.__handle_event(run, label, t, u)
+
+    # odeint用の右辺(フェーズ遷移の判定を含む)
+    def __f_main(self, run, u, t):
+        if run.phase.state == 5:
+            return u*0.
+
+        label = immediate_transition(self.rocket, t, u, run.phase)
+        if label is not None:
+            self.__handle_event(run, label, t, u)
+            if label == 'landing':
+                return u*0
+
+        if run.phase.t_apogee is None and vertical_speed(t, u) < 0.0:
+            self.__handle_event(run, 'apogee', t, u)
+
+        return run.rhs(t, u, run.phase.state)
+
+    def __f_descent(self, t, y, state, components=None):
+        '''
+        パラシュート展開後(state 3.5, 4)の3自由度(質点)降下モデルの時間微分dy/dt
+        y: 局所座標系での位置と速度 (6)
+        components: 計測用のラッパ(__f_dynamicsを参照)
+        '''
         rocket = self.rocket
         env = rocket.enviroment
         air = rocket.air
-        launcher = rocket.launcher
+        if components is None:
+            standard_air, wind, getMassProperties = air.standard_air, air.wind, rocket.getMassProperties
+        else:
+            _, standard_air, wind, getMassProperties = components
+        x = y[0:3]
+        v = y[3:6]
 
-        if self.state == 5:
-            return u*0.
+        mass, _, _, _ = getMassProperties(t)
+        # 局所座標系での相対風ベクトル
+        v_air = wind(x[2]) - v
+        _, _, rho, _ = standard_air(x[2])
+        chute = rocket.droguechute if state == 3.5 else rocket.parachute
+        dv_dt = env.g(x[2]) - 2.0*np.cross(env.omega_earth_local, v) + chute.DragForce(v_air, rho)/mass
+        return np.concatenate((v, dv_dt))
+
+    def __f_dynamics(self, t, u, state, components=None):
+        '''
+        飛行フェーズstateを固定したときの状態量の時間微分du/dt
+        components: 計測用に包んだ要素の関数(profiler.SolverProfiler.wrap_componentsを参照).
+            省略時はRocketの関数をそのまま使用する
+        '''
+        rocket = self.rocket
+        env = rocket.enviroment
+        air = rocket.air
+        if components is None:
+            getAeroCoeffs, standard_air, wind, getMassProperties =\
+                rocket.getAeroCoeffs, air.standard_air, air.wind, rocket.getMassProperties
+        else:
+            getAeroCoeffs, standard_air, wind, getMassProperties = components
 
         # --------------------------
         #   extract vectors
         # --------------------------
         x = u[0:3]
         v = u[3:6]
-        q = quaternion.as_quat_array(u[6:10])
+        q = u[6:10]
         omega = u[10:]
 
-        rocket.t = t
-        rocket.x = x
-        rocket.v = v
-        rocket.q = q
-        rocket.omega = omega
-
         # ----------------------------
         #    Direction Cosine Matrix for input q
         # ----------------------------
         # Tbl = transform from local(fixed) coordinate to body coord.
-        #     note: as_rotation_matrix is for vector rotation
-        #         -> for coordinate rotation, input conj(q)
-        Tbl = quaternion.as_rotation_matrix(np.conj(q))
-
-        if self.state == 1 and launcher.is1stlugOff():
-            if self.cons:
-                print('------------------')
-                print('1stlug off at t=', t, '[s]')
-                print('altitude:', x[2], '[m]')
-
-            self.add_solver_log('1stlug_off', t=t, x=x, v=v, q=q, omega=omega)
-            self.state = 1.1
-        elif self.state == 1.1 and launcher.is2ndlugOff():
-            if self.cons:
-                print('------------------')
-                print('2ndlug off at t=', t, '[s]')
-                print('altitude:', x[2], '[m]')
-
-            self.add_solver_log('2ndlug_off', t=t, x=x, v=v, q=q, omega=omega)
-            self.state = 2
-        elif self.state <= 2 and t >= rocket.engine.thrust_cutoff_time:
-            if self.cons:
-                print('------------------')
-                print('MECO at t=', t, '[s]')
-                print('altitude:', x[2], '[m]')
-
-            self.add_solver_log('MECO', t=t, x=x, v=v, q=q, omega=omega)
-            self.state = 3
-        elif self.state == 3:
-            if rocket.hasDroguechute():
-                if rocket.isDroguechuteDeployed():
-                    if self.cons:
-                        print('------------------')
-                        print('drogue chute deployed at t=', t, '[s]')
-                        print('altitude:', x[2], '[m]')
-
-                    self.add_solver_log('drogue', t=t, x=x, v=v, q=q, omega=omega)
-                    self.state = 3.5 # ドローグ展開
-            else:
-                if rocket.isParachuteDeployed():
-                    if self.cons:
-                        print('------------------')
-                        print('main parachute deployed at t=', t, '[s]')
-                        print('altitude:', x[2], '[m]')
-
-                    self.add_solver_log('para', t=t, x=x, v=v, q=q, omega=omega)
-                    self.state = 4
-        elif self.state == 3.5 and rocket.isParachuteDeployed():
-            if self.cons:
-                print('------------------')
-                print('main parachute deployed at t=', t, '[s]')
-                print('altitude:', x[2], '[m]')
-
-            self.add_solver_log('para', t=t, x=x, v=v, q=q, omega=omega)
-            self.state = 4
-        elif self.state > 1 and self.state < 5 and x[2] < 0.0 and t > rocket.engine.thrust_startup_time:
-            if self.cons:
-                print('------------------')
-                print('landing at t=', t, '[s]')
-                print('x:', x)
-
-            self.add_solver_log('landing', t=t, x=x, v=v, q=q, omega=omega)
-            self.state = 5
-            return u*0
+        #     (quaternion.as_rotation_matrix(np.conj(q))と等価)
+        Tbl = dcm(q)
 
         # dx_dt:地球座標系での地球から見たロケットの速度
         # v:機体座標系なので地球座標系に変換
         dx_dt = np.dot(Tbl.T, v)
 
-        if self.apogee_flag is False and dx_dt[2] < 0.0:
-            if self.cons:
-                print('------------------')
-                print('apogee at t=', t, '[s]')
-                print('altitude:', x[2], '[m]')
-            rocket.t_apogee = t
-
-            self.add_solver_log('apogee', t=t, x=x, v=v, q=q, omega=omega)
-            self.apogee_flag = True
-        
-        # 重量・重心・慣性モーメント計算
-        mass = rocket.getMass(t)
-        CG = rocket.getCG(t)
-        MOI = rocket.getMOI(t)
-
-        # 慣性モーメントの微分
-        # 現在は次の推力サンプル点でのモーメントとの平均変化率で近似している
-        # (モーメントの変化は推力サンプル間隔)
-        dt = 1.0e-3
-        MOI_next = rocket.getMOI(t + dt)
-        dMOI_dt = (MOI_next - MOI)/dt
+        # 重量・重心・慣性モーメントとその微分(テーブルから補間)
+        mass, CG, MOI, dMOI_dt = getMassProperties(t)
 
         # v_air: 機体座標系での相対風ベクトル
-        v_air = -v + np.dot(Tbl, air.wind(x[2]))
+        v_air = -v + np.dot(Tbl, wind(x[2]))
         v_air_norm = np.linalg.norm(v_air)
         if v_air_norm == 0:
             alpha = 0.
         else:
             # v_air[0]: 地球から見た機体座標系での機軸方向速度
             alpha = np.arccos(np.abs(v_air[0])/v_air_norm)
-        
+
         # ロール方向の風向
         phi = np.arctan2(-v_air[1], -v_air[2])
-        _, _, rho, sound_speed = air.standard_air(x[2])
+        _, _, rho, sound_speed = standard_air(x[2])
         mach = v_air_norm / sound_speed
 
         #Cd = air.getCd(mach, alpha)
         #Cl = air.getCl(mach, alpha)
         #CP = air.getCP(mach, alpha)
-        Cd = rocket.getCd(mach, alpha)
-        Cl = rocket.getCl(mach, alpha)
-        CP = rocket.getCP(mach, alpha)
+        Cd, Cl, CP = getAeroCoeffs(mach, alpha)
 
         cosa = np.cos(alpha)
         sina = np.sin(alpha)
@@ -191,15 +431,15 @@ class TrajectorySolver:
         l = np.array([rocket.diameter, rocket.height, rocket.height])
         air_moment_damping = 0.25 * rho * v_air_norm * rocket.Cm * (l**2) * rocket_xarea * omega
         air_moment = air_moment_CG + air_moment_damping
-        
+
         # 重力加速度
         g = env.g(x[2])
         #print('F_coriolis', env.Coriolis(v, Tbl))
 
-        if self.state <= 1.1:
+        if state <= 1.1:
             # state <= 1.1: ラグがランチャーに拘束されている時
-            # 運動方向は機体x方向(機軸方向)のみ
-            
+            # 運動方向は機体x方向(機軸方向)のみ
+
             # 並進力のうち機体座標系で表現されているもの
             # TODO: 振動friction()関数の実装
             thrust_vec = np.array([rocket.engine.thrust(t), 0.0, 0.0])
@@ -213,21 +453,21 @@ class TrajectorySolver:
             if dv_dt[0] < 0.0:
                 dv_dt[0] = 0.0
 
-        elif self.state == 2:
+        elif state == 2:
             # ラグが2つともランチャーから離れており推力飛行をしている場合
             thrust_vec = np.array([rocket.engine.thrust(t), 0.0, 0.0])
             dv_dt = -np.cross(omega, v) + np.dot(Tbl, g) +\
                 env.Coriolis(v, Tbl) + (air_force + thrust_vec)/mass
 
-        elif self.state == 3 or self.state == 5:
+        elif state == 3 or state == 5:
             # 慣性飛行時orランディング
             dv_dt = -np.cross(omega, v) + np.dot(Tbl, g) +\
                 env.Coriolis(v, Tbl) + air_force/mass
-        elif self.state == 3.5:
+        elif state == 3.5:
             # ドローグシュート展開時
             dv_dt = np.dot(Tbl, g) + env.Coriolis(v, Tbl) +\
                 rocket.droguechute.DragForce(v_air, rho)/mass
-        elif self.state == 4:
+        elif state == 4:
             # メインパラシュート展開時
             dv_dt = np.dot(Tbl, g) + env.Coriolis(v, Tbl) +\
                 rocket.parachute.DragForce(v_air, rho)/mass
@@ -236,19 +476,18 @@ class TrajectorySolver:
         #    3. Atitude
         # ----------------------------
         # パラシュート展開時は回転を無視
-        if self.state == 3.5 or self.state == 4:
-            omega *= 0.
-        q_omega = quaternion.as_quat_array(np.r_[0.0, omega])
-        dq_dt = quaternion.as_float_array(0.5*q*q_omega)
+        if state == 3.5 or state == 4:
+            omega = np.zeros(3)
+        dq_dt = quaternion_derivative(q, omega)
 
         # ----------------------------
         #    4. Angular velocity
         # ----------------------------
-        if self.state == 1 or self.state == 3.5 or self.state == 4:
+        if state == 1 or state == 3.5 or state == 4:
             # both lug on the rail /parachute deployed -> no angular velocity change
             domega_dt = np.zeros(3)
         else:
-            if self.state == 1.1:
+            if state == 1.1:
                 # 2nd lug on the rail. rotate around this point. Add addtitonal moment
                 lug2CG = np.array([rocket.lug_2nd - CG, 0., 0.])
                 # aerodynamic moment correction: move center of rotation from CG > 2nd lug (currently ignore damping correction)
@@ -266,5 +505,49 @@ class TrajectorySolver:
         # END IF
 
         du_dt = np.r_[dx_dt, dv_dt, dq_dt, domega_dt]
-        
-        return du_dt
\ No newline at end of file
+
+        return du_dt
+
+
+class _SolverRun:
+    '''
+    iter_solve()の1回の積分の状態(飛行フェーズ, イベントログ, 運動方程式, 計測)
+    '''
+    def __init__(self, rhs, descent_rhs, profiler):
+        self.phase = INITIAL_PHASE
+        self.log = {}
+        self.rhs = rhs
+        self.descent_rhs = descent_rhs
+        self.profiler = profiler
+        self.n_step = 0
+
+
+class _DescentSolution:
+    '''
+    3自由度降下モデル(局所座標系での位置と速度)のsolve_ivpの解を
+    13次元の状態量(機体座標系での速度, 一定の姿勢と角速度)として参照するためのラッパ
+    '''
+    def __init__(self, sol, Tbl, q, omega):
+        self.status = sol.status
+        self.message = sol.message
+        self.t_events = sol.t_events
+        self.t = sol.t
+        self.__sol = sol.sol
+        self.__Tbl = Tbl
+        self.__q = np.array(q, dtype=float)
+        self.__omega = np.array(omega, dtype=float)
+        self.y = self.__expand(sol.y)
+
+    def sol(self, t):
+        return self.__expand(self.__sol(t))
+
+    def __expand(self, y):
+        y = np.asarray(y)
+        y2d = y.reshape(6, -1)
+        n = y2d.shape[1]
+        u = np.empty((13, n))
+        u[0:3] = y2d[0:3]
+        u[3:6] = np.dot(self.__Tbl, y2d[3:6])
+        u[6:10] = self.__q[:, np.newaxis]
+        u[10:13] = self.__omega[:, np.newaxis]
+        return u if y.ndim == 2 else u[:, 0]
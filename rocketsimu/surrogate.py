@@ -0,0 +1,331 @@
+# -*- coding:utf-8 -*-
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.stats import qmc
+from . import dispersion
+from .vehicle import compile_parameters
+
+'''
+落下地点と最高高度の代替モデル(サロゲート)を作成するスクリプト
+
+設計変数(風速, 風向, Cd0の倍率, 射角など)の空間をラテン超方格でサンプリングして
+シミュレーションをプロセスプールで実行し, その結果を放射基底関数(RBF)で補間する.
+補間誤差はleave-one-out(LOO)誤差から見積もり, 誤差の大きい領域に追加の点を置いて
+モデルを逐次改良する.
+
+予測(RBFModel.predict)は補間点までの距離の計算と基底関数の評価をキャッシュに収まる大きさに分けて行い,
+4変数, 200点のモデルで1コアあたり100万点/s程度(benchmarks/run_benchmarks.py -k surrogate).
+推定誤差(error_estimate)は近傍探索を伴うため, これより数倍遅い.
+'''
+
+# 基準パラメータのキー以外で指定できる設計変数
+# wind_speed: 基準高度での風速[m/s], wind_azimuth: 風向[deg](北から時計回り, 風が吹いてくる方向)
+# Cd0_scale: Cd0の倍率
+WIND_FACTORS = ('wind_speed', 'wind_azimuth')
+SCALE_FACTORS = {'Cd0_scale': 'Cd0'}
+# RBFModel.predictで一度に計算する作業配列(点数×補間点数)の要素数
+CHUNK_ELEMENTS = 65536
+
+
+class RBFModel:
+    '''
+    thin plate spline (phi(r) = r^2 log r) と1次の多項式による散布データの補間モデル
+    入力は[0, 1]程度に正規化された特徴量を想定する
+    '''
+    def __init__(self, X, Y):
+        '''
+        INPUT
+            X: 補間点の特徴量 (N, d). N >= d + 2
+            Y: 補間点の値 (N, m)
+        '''
+        self.centers = np.array(X, dtype=float)
+        Y = np.array(Y, dtype=float)
+        n, d = self.centers.shape
+        if n < d + 2:
+            raise ValueError(
+                'At least {} points are needed to fit the model, but {} points were given.'.format(d + 2, n))
+
+        # 補間条件と多項式の直交条件をまとめた連立方程式
+        #   [[Phi, P], [P^T, 0]] [c; b] = [Y; 0]
+        P = self.__polynomial(self.centers)
+        A = np.zeros((n + d + 1, n + d + 1))
+        A[:n, :n] = self.__kernel(self.centers, self.centers, np.sum(self.centers**2, axis=1))
+        A[:n, n:] = P
+        A[n:, :n] = P.T
+        A_inv = np.linalg.inv(A)
+        coeffs = A_inv[:, :n] @ Y
+        self.weights = coeffs[:n]
+        self.poly_coeffs = coeffs[n:]
+
+        # LOO誤差 (Rippa): 点iを除いて補間したモデルの点iでの誤差 = c_i / (A^-1)_ii
+        self.loo_errors = self.weights / np.diag(A_inv)[:n, np.newaxis]
+        self.__tree = cKDTree(self.centers)
+
+        # 評価用: [x, |x|^2, 1] @ distance_basis = 補間点までの距離の2乗
+        self.__distance_basis = np.vstack((-2.0 * self.centers.T, np.ones((1, n)), np.sum(self.centers**2, axis=1)))
+        self.__half_weights = 0.5 * self.weights
+
+    def predict(self, X, chunksize=None):
+        '''
+        INPUT
+            X: 特徴量 (N, d)
+            chunksize: 一度に計算する点数. 省略時は作業配列(点数×補間点数)がキャッシュに収まるよう
+                補間点数から決める
+        OUTPUT
+            (N, m)
+        '''
+        X = np.asarray(X, dtype=float)
+        n_centers, d = self.centers.shape
+        if chunksize is None:
+            chunksize = max(16, CHUNK_ELEMENTS // n_centers)
+
+        Y = np.empty((len(X), self.weights.shape[1]))
+        A = np.empty((min(chunksize, len(X)), d + 2))
+        A[:, d + 1] = 1.0
+        for start in range(0, len(X), chunksize):
+            Xc = X[start:start + chunksize]
+            Ac = A[:len(Xc)]
+            Ac[:, :d] = Xc
+            Ac[:, d] = np.einsum('ij,ij->i', Xc, Xc)
+            # 距離の2乗を1回の行列積で求め, r^2 log r = 0.5 r^2 log r^2 (0.5は重みに含める)
+            r2 = Ac @ self.__distance_basis
+            np.maximum(r2, 1e-300, out=r2)
+            phi = np.log(r2)
+            phi *= r2
+            Yc = phi @ self.__half_weights
+            Yc += self.poly_coeffs[0]
+            Yc += Xc @ self.poly_coeffs[1:]
+            Y[start:start + chunksize] = Yc
+        return Y
+
+    def error_estimate(self, X, k=8):
+        '''
+        補間誤差の推定値. 近傍k点のLOO誤差の大きさを距離の逆数で重み付け平均する
+        (補間点上ではその点のLOO誤差, 補間点から離れるほど近傍の誤差の平均に近づく)
+        INPUT
+            X: 特徴量 (N, d)
+        OUTPUT
+            (N, m)
+        '''
+        k = min(k, len(self.centers))
+        dist, idx = self.__tree.query(np.asarray(X, dtype=float), k=k, workers=-1)
+        dist = dist.reshape(len(dist), k)
+        idx = idx.reshape(len(idx), k)
+        weights = 1.0 / np.maximum(dist, 1e-12)**2
+        weights /= np.sum(weights, axis=1, keepdims=True)
+        return np.einsum('nk,nkm->nm', weights, np.abs(self.loo_errors)[idx])
+
+    def nearest_distance(self, X):
+        '''
+        最も近い補間点までの距離 (N,)
+        '''
+        dist, _ = self.__tree.query(np.asarray(X, dtype=float), k=1, workers=-1)
+        return dist
+
+    @staticmethod
+    def __kernel(X, C, C_sq):
+        # r^2 log r = 0.5 r^2 log r^2 (平方根を避ける. r -> 0 で 0)
+        r2 = X @ (-2.0 * C.T)
+        r2 += C_sq
+        r2 += np.sum(X**2, axis=1)[:, np.newaxis]
+        np.maximum(r2, 1e-300, out=r2)
+        phi = np.log(r2)
+        phi *= r2
+        phi *= 0.5
+        return phi
+
+    @staticmethod
+    def __polynomial(X):
+        return np.hstack((np.ones((len(X), 1)), X))
+
+
+class LandingSurrogate:
+    '''
+    設計変数から落下地点(landing_x, landing_y)と最高高度(apogee)を求める代替モデル
+    '''
+    def __init__(
+            self,
+            parameters,
+            bounds,
+            outputs=('landing_x', 'landing_y', 'apogee'),
+            n_workers=None,
+            backend='python',
+            seed=0):
+        '''
+        INPUT
+            parameters: 基準となるロケットのパラメータ(Dict, ファイル名またはPreparedVehicle)
+            bounds: 設計変数の名前と範囲(下限, 上限)のDict
+                'wind_speed', 'wind_azimuth', 'Cd0_scale' または基準パラメータのキー(例: 'elev_angle')
+                風速/風向は基準の風モデルのwind_stdを置き換える(constant, powerモデルを想定).
+                一方のみ指定した場合, 他方は基準のwind_stdの値とする
+            outputs: モデル化する出力の名前(dispersion.OUTPUTSのキー)
+            n_workers: シミュレーションのワーカープロセス数. 省略時はCPU数
+            backend: 運動方程式の計算方法 'python' or 'numba' (simulate()と同じく省略時は'python')
+            seed: 設計点のサンプリングの乱数シード
+        '''
+        self.vehicle = compile_parameters(parameters)
+        params = self.vehicle.params
+        self.names = list(bounds)
+        for name in self.names:
+            if name not in WIND_FACTORS and name not in SCALE_FACTORS and name not in params:
+                raise ValueError('Invalid design variable "'+name+'" was indicated.')
+        self.lower = np.array([bounds[name][0] for name in self.names], dtype=float)
+        self.upper = np.array([bounds[name][1] for name in self.names], dtype=float)
+        self.outputs = list(outputs)
+        self.n_workers = n_workers
+        self.backend = backend
+        self.__rng = np.random.default_rng(seed)
+
+        self.X = np.empty((0, len(self.names)))
+        self.Y = np.empty((0, len(self.outputs)))
+        self.model = None
+
+    def sample(self, n):
+        '''
+        設計変数の空間からラテン超方格で n点をサンプリングする (n, 設計変数の数)
+        '''
+        sampler = qmc.LatinHypercube(d=len(self.names), seed=self.__rng)
+        return qmc.scale(sampler.random(n), self.lower, self.upper)
+
+    def cases(self, X):
+        '''
+        設計点を基準パラメータからの変更(dispersionのcase)に変換する
+        '''
+        params = self.vehicle.params
+        wind_std = np.asarray(params['wind_parameters'].get('wind_std', [0.0, 0.0, 0.0]), dtype=float)
+        base_speed = np.hypot(wind_std[0], wind_std[1])
+        base_azimuth = np.rad2deg(np.arctan2(-wind_std[0], -wind_std[1]))
+
+        cases = []
+        for point in np.atleast_2d(X):
+            values = dict(zip(self.names, point.tolist()))
+            case = {}
+            if any(name in values for name in WIND_FACTORS):
+                speed = values.pop('wind_speed', base_speed)
+                azimuth = np.deg2rad(values.pop('wind_azimuth', base_azimuth))
+                wind_parameters = dict(params['wind_parameters'])
+                wind_parameters['wind_std'] = [-speed * np.sin(azimuth), -speed * np.cos(azimuth), wind_std[2]]
+                case['wind_parameters'] = wind_parameters
+            for name, key in SCALE_FACTORS.items():
+                if name in values:
+                    case[key] = params[key] * values.pop(name)
+            case.update(values)
+            cases.append(case)
+        return cases
+
+    def evaluate(self, X):
+        '''
+        設計点でシミュレーションを実行し, 出力を返す (n, 出力の数)
+        '''
+        logs = dispersion.run_dispersion(
+                    self.vehicle,
+                    self.cases(X),
+                    n_workers=self.n_workers,
+                    backend=self.backend,
+                    trajectory=False)
+        return dispersion.log_outputs(logs, self.outputs)
+
+    def add_points(self, X):
+        '''
+        設計点を追加してシミュレーションを実行し, モデルを作り直す
+        '''
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        self.X = np.vstack((self.X, X))
+        self.Y = np.vstack((self.Y, self.evaluate(X)))
+        self.fit()
+
+    def fit(self):
+        # 出力がNaNの点(t_maxまでに着地しなかった条件など)は補間に使用しない
+        valid = np.isfinite(self.Y).all(axis=1)
+        self.model = RBFModel(self.features(self.X[valid]), self.Y[valid])
+
+    def build(self, n_initial, n_refine=0, n_iterations=1, n_candidates=10000):
+        '''
+        初期設計点でモデルを作成し, 誤差の大きい領域への点の追加をn_iterations回繰り返す
+        INPUT
+            n_initial: 初期設計点の数
+            n_refine: 1回の改良で追加する点の数
+            n_iterations: 改良の回数
+            n_candidates: 追加する点を選ぶ候補点の数
+        '''
+        self.add_points(self.sample(n_initial))
+        for _ in range(n_iterations if n_refine > 0 else 0):
+            self.refine(n_refine, n_candidates)
+        return self
+
+    def refine(self, n, n_candidates=10000):
+        '''
+        推定誤差の大きい点をn点選んで追加する
+        候補点の評価値は (出力ごとに標準偏差で無次元化した推定誤差の最大値) × (最も近い既存点までの距離)
+        で, 選んだ点の近くの候補は同じ回では選ばない
+        OUTPUT
+            追加した設計点 (n, 設計変数の数)
+        '''
+        candidates = self.sample(n_candidates)
+        features = self.features(candidates)
+        scale = np.nanstd(self.Y, axis=0)
+        scale = np.where(scale > 0, scale, 1.0)
+        error = np.max(self.model.error_estimate(features) / scale, axis=1)
+        distance = self.model.nearest_distance(features)
+        score = error * distance
+
+        # 既存点の間隔の中央値の半分以内にある候補は除外して, 評価値の大きい順に選ぶ
+        spacing = np.median(cKDTree(self.model.centers).query(self.model.centers, k=2)[0][:, 1])
+        selected = []
+        for i in np.argsort(score)[::-1]:
+            if len(selected) >= n:
+                break
+            if all(np.linalg.norm(features[i] - features[j]) > 0.5*spacing for j in selected):
+                selected.append(i)
+        X_new = candidates[selected]
+        self.add_points(X_new)
+        return X_new
+
+    def predict(self, X, return_error=False):
+        '''
+        INPUT
+            X: 設計点 (N, 設計変数の数) または (設計変数の数,)
+            return_error: Trueの場合は推定誤差も返す
+        OUTPUT
+            出力 (N, 出力の数) [, 推定誤差 (N, 出力の数)]
+        '''
+        X = np.asarray(X, dtype=float)
+        features = self.features(np.atleast_2d(X))
+        Y = self.model.predict(features)
+        if return_error:
+            error = self.model.error_estimate(features)
+            return (Y[0], error[0]) if X.ndim == 1 else (Y, error)
+        return Y[0] if X.ndim == 1 else Y
+
+    def loo_rms(self):
+        '''
+        出力ごとのLOO誤差の二乗平均平方根 (出力の名前: 誤差のDict)
+        '''
+        rms = np.sqrt(np.mean(self.model.loo_errors**2, axis=0))
+        return dict(zip(self.outputs, rms.tolist()))
+
+    def features(self, X):
+        '''
+        設計点をモデルの特徴量に変換する
+        各設計変数は範囲を[0, 1]に正規化し, 風速と風向は風ベクトルの成分(最大風速で正規化)に置き換える
+        (落下地点は風ベクトルに対してほぼ線形で, 風向の周期性も扱える)
+        '''
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        span = np.where(self.upper > self.lower, self.upper - self.lower, 1.0)
+        columns = [
+            (X[:, i] - self.lower[i]) / span[i]
+            for i, name in enumerate(self.names) if name not in WIND_FACTORS
+        ]
+        if 'wind_azimuth' in self.names:
+            i_azimuth = self.names.index('wind_azimuth')
+            azimuth = np.deg2rad(X[:, i_azimuth])
+            if 'wind_speed' in self.names:
+                i_speed = self.names.index('wind_speed')
+                speed = X[:, i_speed] / max(abs(self.lower[i_speed]), abs(self.upper[i_speed]), 1e-12)
+            else:
+                speed = np.ones(len(X))
+            columns += [speed * np.sin(azimuth), speed * np.cos(azimuth)]
+        elif 'wind_speed' in self.names:
+            i_speed = self.names.index('wind_speed')
+            columns.append((X[:, i_speed] - self.lower[i_speed]) / span[i_speed])
+        return np.stack(columns, axis=1)
@@ -0,0 +1,193 @@
+# -*- coding:utf-8 -*-
+import os
+import json
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from .rocket import Rocket
+from .engine import RocketEngine, getFileHash, clearThrustCache
+from .air import standard_aero_coeff
+
+'''
+シミュレーションの前処理(推力履歴の読み込みとフィルタ処理, 重量特性テーブルの作成)を
+パラメータごとに一度だけ行い, 結果を使い回すためのスクリプト
+'''
+
+# 推力履歴の読み込み結果に影響するパラメータ
+ENGINE_KEYS = (
+    'thrust_curve_csv', 'thrust_dt', 'thrust_lpf_method', 'thrust_resample_tol',
+    'mass_prop', 'MOI_prop')
+# 重量特性テーブルに影響するパラメータ(ENGINE_KEYS以外)
+MASS_KEYS = ('mass_dry', 'CG_dry', 'MOI_dry', 'CG_prop')
+
+# compile_parametersのキャッシュ (ハッシュ値 -> PreparedVehicle)
+CACHE_SIZE = 16
+_cache = OrderedDict()
+# スレッドから並行に参照/更新するためのロック
+_cache_lock = threading.Lock()
+
+
+class PreparedVehicle:
+    '''
+    前処理済みの機体データ(不変)
+    simulate(), simulate_batch()にパラメータの代わりに渡すことができる
+
+    保持するもの
+        params: パラメータのDict(参照時はコピーを返す)
+        engine: 推力履歴を読み込み/フィルタ処理済みのRocketEngine
+            (参照時はコピーを返す. 配列は読み取り専用で共有する)
+        mass_table, mass_table_dry: Rocket.getMassPropertiesのテーブル
+        aero_coeff: 空力係数テーブル(モジュール共通のstandard_aero_coeff.
+            pickleには含めず, 復元時にモジュールのものを参照する)
+        key: パラメータと推力ファイルの内容から求めたハッシュ値
+    '''
+    def __init__(self, params, engine, mass_table, mass_table_dry, key):
+        object.__setattr__(self, '_PreparedVehicle__params_json', json.dumps(params, sort_keys=True))
+        object.__setattr__(self, '_PreparedVehicle__engine', _freeze_engine(engine))
+        object.__setattr__(self, 'mass_table', _readonly(mass_table))
+        object.__setattr__(self, 'mass_table_dry', _readonly(mass_table_dry))
+        object.__setattr__(self, 'aero_coeff', standard_aero_coeff)
+        object.__setattr__(self, 'key', key)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PreparedVehicle is immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('PreparedVehicle is immutable.')
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['aero_coeff']
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+        # pickleから復元した配列は書き込み可能になっているため再度読み取り専用にする
+        _freeze_engine(self.__engine)
+        _readonly(self.mass_table)
+        _readonly(self.mass_table_dry)
+        object.__setattr__(self, 'aero_coeff', standard_aero_coeff)
+
+    def __eq__(self, other):
+        return isinstance(other, PreparedVehicle) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    @property
+    def params(self):
+        return json.loads(self.__params_json)
+
+    @property
+    def engine(self):
+        # 属性の再代入がキャッシュ中のエンジンに影響しないようにコピーを返す
+        engine = copy.copy(self.__engine)
+        for name, value in list(vars(engine).items()):
+            if not isinstance(value, np.ndarray):
+                setattr(engine, name, copy.deepcopy(value))
+        return engine
+
+    def replace(self, overrides):
+        '''
+        パラメータの一部を変更したPreparedVehicleを返す
+        推力/重量特性に関係しないパラメータのみの変更であれば前処理結果を共有する
+        INPUT
+            overrides: 変更するキーと値のDict(トップレベルのキーで上書き)
+        '''
+        params = self.params
+        params.update(copy.deepcopy(overrides))
+        if any(key in overrides for key in ENGINE_KEYS):
+            return compile_parameters(params)
+
+        key = _params_hash(params)
+        cached = _lookup(key)
+        if cached is not None:
+            return cached
+        if any(key in overrides for key in MASS_KEYS):
+            mass_table, mass_table_dry = _mass_tables(params, self.engine)
+        else:
+            mass_table, mass_table_dry = self.mass_table, self.mass_table_dry
+        return _store(PreparedVehicle(params, self.__engine, mass_table, mass_table_dry, key))
+
+
+def compile_parameters(parameters):
+    '''
+    パラメータの前処理を行いPreparedVehicleを返す
+    同じ内容のパラメータ(推力ファイルの内容を含む)に対してはキャッシュした結果を返す
+    INPUT
+        parameters: ロケットのパラメータが格納されているDictまたはファイル名
+    '''
+    if isinstance(parameters, PreparedVehicle):
+        return parameters
+    if type(parameters) is str:
+        with open(parameters, 'r') as f:
+            params = json.load(f)
+    else:
+        params = copy.deepcopy(parameters)
+
+    key = _params_hash(params)
+    cached = _lookup(key)
+    if cached is not None:
+        return cached
+
+    engine = RocketEngine(params)
+    engine.loadThrust(
+        params['thrust_curve_csv'],
+        params['thrust_dt'],
+        lpf_method=params.get('thrust_lpf_method', 'fft'),
+        resample_tol=params.get('thrust_resample_tol'))
+    mass_table, mass_table_dry = _mass_tables(params, engine)
+    return _store(PreparedVehicle(params, engine, mass_table, mass_table_dry, key))
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+    clearThrustCache()
+
+
+def _lookup(key):
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    return None
+
+
+def _store(vehicle):
+    with _cache_lock:
+        _cache[vehicle.key] = vehicle
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return vehicle
+
+
+def _mass_tables(params, engine):
+    rocket = Rocket(params)
+    rocket.joinEngine(engine, position=params['CG_prop'])
+    return rocket.mass_table, rocket.mass_table_dry
+
+
+def _params_hash(params):
+    h = hashlib.sha1(json.dumps(params, sort_keys=True).encode())
+    h.update(getFileHash(params['thrust_curve_csv']).encode())
+    return h.hexdigest()
+
+
+def _freeze_engine(engine):
+    '''
+    エンジンが保持する配列(thrust_tableのビューを含む)をすべて読み取り専用にする
+    '''
+    for value in vars(engine).values():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+    return engine
+
+
+def _readonly(array):
+    array = np.asarray(array)
+    array.flags.writeable = False
+    return array
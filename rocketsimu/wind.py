@@ -1,12 +1,92 @@
+import io
+import os
+import copy
+import hashlib
 import numpy as np
-import scipy.interpolate as interpolate
+import pandas as pd
+
+# 読み込み済みの予報風ファイル ((path, mtime, size) -> (times, alt_axis, profiles))
+_forecast_cache = {}
+# 予報風ファイルの解析結果を保存するディレクトリ (環境変数ROCKETSIMU_CACHE_DIRで変更できる)
+FORECAST_CACHE_DIR = os.environ.get(
+                        'ROCKETSIMU_CACHE_DIR',
+                        os.path.join(os.path.expanduser('~'), '.cache', 'rocketsimu'))
 
 class Wind:
+    '''
+    風モデルの基底クラス
+    wind(h)は高度h[m]のスカラに対して風ベクトル(3,)を, 配列(N,)に対して(N, 3)の配列を返す
+    '''
     def __call__(self, h):
         return self.wind(h)
     
     def wind(self, h):
-        return 0
+        return np.zeros(np.shape(h) + (3,))
+
+    def tabulate(self, h_min=0., h_max=20000., dh=1.):
+        '''
+        高度[h_min, h_max]を刻みdhの等間隔格子で評価したテーブルから線形補間する風モデル(WindTable)を返す
+        合成したモデル(HybridWindなど)も一度の評価で一つのテーブルにまとめられる
+        '''
+        n = int(np.ceil((h_max - h_min) / dh)) + 1
+        h_array = h_min + dh * np.arange(n)
+        return WindTable(h_min, dh, self.wind(h_array))
+
+    def resolution(self):
+        '''
+        テーブル化する際に必要な高度方向の刻み[m]. 細かい構造を持たないモデルはNone
+        '''
+        return None
+
+
+class WindTable(Wind):
+    '''
+    等間隔の高度格子上の風ベクトルのテーブルを線形補間する風モデル
+    格子の範囲外は端の値とする
+    '''
+    def __init__(self, h_min, dh, table):
+        '''
+        INPUT
+            h_min: 格子の最小高度 [m]
+            dh: 格子の刻み [m]
+            table: 各格子点の風ベクトル (n, 3)
+        '''
+        self.h_min = float(h_min)
+        self.dh = float(dh)
+        self.table = np.ascontiguousarray(table, dtype=float)
+        self.h_max = self.h_min + self.dh * (len(self.table) - 1)
+        self.__table_list = None
+
+    def wind(self, h):
+        if np.ndim(h) == 0:
+            # スカラはfloatのまま計算する
+            # floatのリストは最初のスカラ評価時に作成する(多数のテーブルを一括で作成する場合のため)
+            if self.__table_list is None:
+                self.__table_list = self.table.tolist()
+            idx = (float(h) - self.h_min) / self.dh
+            n = len(self.__table_list)
+            if idx <= 0.0:
+                return self.table[0].copy()
+            elif idx >= n - 1:
+                return self.table[n - 1].copy()
+            i = int(idx)
+            frac = idx - i
+            w0 = self.__table_list[i]
+            w1 = self.__table_list[i + 1]
+            return np.array([w0[k] + (w1[k] - w0[k]) * frac for k in range(3)])
+
+        idx = np.clip((np.asarray(h, dtype=float) - self.h_min) / self.dh, 0.0, len(self.table) - 1)
+        i = np.minimum(idx.astype(int), len(self.table) - 2)
+        frac = (idx - i)[..., np.newaxis]
+        return self.table[i] + (self.table[i + 1] - self.table[i]) * frac
+
+    def resolution(self):
+        return self.dh
+
+    def tabulate(self, h_min=0., h_max=20000., dh=1.):
+        if h_min == self.h_min and dh == self.dh and h_max <= self.h_max:
+            return self
+        return super().tabulate(h_min, h_max, dh)
 
 
 class HybridWind(Wind):
@@ -40,16 +120,24 @@ class HybridWind(Wind):
         h0 = self.h0
         h1 = self.h1
         if self.kind == 'linear':
-            if h < h0:
-                return w0
-            elif h < h1:
-                w_trans = (w1 - w0) * (h - h0)/(h1 - h0) + w0
-                return w_trans
-            else:
-                return w1
+            if np.ndim(h) == 0:
+                if h < h0:
+                    return w0
+                elif h < h1:
+                    w_trans = (w1 - w0) * (h - h0)/(h1 - h0) + w0
+                    return w_trans
+                else:
+                    return w1
+            h = np.asarray(h, dtype=float)
+            w_trans = (w1 - w0) * (h - h0)/(h1 - h0 if h1 != h0 else 1.0) + w0
+            return np.where(h < h0, w0, np.where(h < h1, w_trans, w1))[..., np.newaxis]
 
     def wind(self, h):
-        return self.wind0(h) * (1.0 - self.__w(h)) + self.wind1(h) * self.__w(h)
+        w = self.__w(h)
+        return self.wind0(h) * (1.0 - w) + self.wind1(h) * w
+
+    def resolution(self):
+        return _min_resolution([self.wind0, self.wind1])
 
 
 class WindPower(Wind):
@@ -60,28 +148,320 @@ class WindPower(Wind):
         self.z0 = z0
 
     def wind(self, h):
-        if h < 0.:
-            h = 0.
-        
-        wind_vec = self.wind_std * (h / self.z0)**(1. / self.n)
-        return wind_vec
+        if np.ndim(h) == 0:
+            if h < 0.:
+                h = 0.
+            return self.wind_std * (h / self.z0)**(1. / self.n)
+
+        h = np.maximum(np.asarray(h, dtype=float), 0.)
+        return self.wind_std * ((h / self.z0)**(1. / self.n))[..., np.newaxis]
 
 
 class WindConstant(Wind):
     def __init__(self, wind=np.array([0., 0., 0.])):
         self.wind_std = np.array(wind)
     def wind(self, h):
-        return self.wind_std
+        if np.ndim(h) == 0:
+            return self.wind_std
+        return np.tile(self.wind_std, np.shape(h) + (1,))
 
 
 class WindForecast(Wind):
-    def __init__(self, forecast_filename):
-        input_data = np.loadtxt(forecast_filename, comments=['#','$','%'], delimiter=',')
-        self.alt_axis = input_data[:, 0]
-        self.wind_vec_array = input_data[:, 1:]
-        self._w = interpolate.interp1d(self.alt_axis, self.wind_vec_array, axis=0)
+    '''
+    予報風(高度ごとの風ベクトルのプロファイル)を線形補間する風モデル
+    複数の予報時刻のプロファイルを一つの配列(profiles)として保持し,
+    指定した時刻のプロファイルを時間方向に線形補間して使用する.
+    ファイルの高度範囲外は端の値とする
+
+    ファイル形式(カンマ区切り. '#', '$', '%'で始まる行はコメント)
+        4列: 高度[m], 風ベクトルx, y, z [m/s] (単一のプロファイル. 予報時刻は0とする)
+        5列: 予報時刻[h], 高度[m], 風ベクトルx, y, z [m/s] (複数のプロファイル)
+    '''
+    def __init__(self, forecast_filename, time=None, cache=True):
+        '''
+        INPUT
+            forecast_filename: 予報風ファイル名. 単一プロファイルのファイル名のリストも指定できる
+                (この場合のファイルの予報時刻はリストの順に0, 1, 2, ...[h]とする)
+            time: 使用する予報時刻[h]. 省略時は最初の予報時刻
+            cache: Trueの場合, 解析結果をFORECAST_CACHE_DIRにバイナリ(npz)で保存し,
+                次回以降(ファイルが更新されるまで)はそれを読み込む
+        '''
+        self.times, self.alt_axis, self.profiles = load_forecast(forecast_filename, cache)
+        self.__set_time(self.times[0] if time is None else time)
+
+    def at(self, time):
+        '''
+        予報時刻timeのプロファイルを使用するWindForecastを返す(ファイルは再読み込みしない)
+        '''
+        wind = copy.copy(self)
+        wind.__set_time(time)
+        return wind
+
+    def wind(self, h):
+        return np.stack(
+            [np.interp(h, self.alt_axis, w) for w in self.wind_vec_array.T],
+            axis=-1)
+
+    def __set_time(self, time):
+        times = self.times
+        if time < times[0] or time > times[-1]:
+            raise ValueError('Forecast time '+str(time)+' is out of range ['+str(times[0])+', '+str(times[-1])+'].')
+        i = min(int(np.searchsorted(times, time, side='right')) - 1, len(times) - 1)
+        if i == len(times) - 1 or time == times[i]:
+            self.wind_vec_array = self.profiles[i]
+        else:
+            a = (time - times[i]) / (times[i+1] - times[i])
+            self.wind_vec_array = (1.0 - a) * self.profiles[i] + a * self.profiles[i+1]
+        self.time = time
+
+
+def load_forecast(forecast_filename, cache=True):
+    '''
+    予報風ファイル(WindForecastを参照)を読み込む
+    同じファイル(パス, 更新時刻, サイズが同じ)はプロセス内で一度だけ読み込む
+    OUTPUT
+        times: 予報時刻 (n_t,) [h]
+        alt_axis: 全プロファイル共通の高度軸 (n_h,) [m]
+        profiles: 各予報時刻の風ベクトル (n_t, n_h, 3) [m/s]
+    '''
+    if not isinstance(forecast_filename, str):
+        # 単一プロファイルのファイルのリスト
+        loaded = [load_forecast(filename, cache) for filename in forecast_filename]
+        return _merge_profiles(
+                    np.arange(len(loaded), dtype=float),
+                    [alt_axis for _, alt_axis, _ in loaded],
+                    [profiles[0] for _, _, profiles in loaded])
+
+    stat = os.stat(forecast_filename)
+    key = (os.path.abspath(forecast_filename), stat.st_mtime_ns, stat.st_size)
+    if key in _forecast_cache:
+        return _forecast_cache[key]
+
+    cache_filename = os.path.join(
+                        FORECAST_CACHE_DIR,
+                        'forecast_' + hashlib.sha1(key[0].encode()).hexdigest() + '.npz')
+    loaded = None
+    if cache and os.path.exists(cache_filename):
+        try:
+            with np.load(cache_filename) as npz:
+                if int(npz['source_mtime']) == stat.st_mtime_ns and int(npz['source_size']) == stat.st_size:
+                    loaded = (npz['times'], npz['alt_axis'], npz['profiles'])
+        except Exception:
+            # 壊れたキャッシュは無視して読み込み直す
+            loaded = None
+
+    if loaded is None:
+        loaded = _parse_forecast(forecast_filename)
+        if cache:
+            try:
+                os.makedirs(FORECAST_CACHE_DIR, exist_ok=True)
+                # 複数のプロセスが同時に書き込んでも壊れないよう一時ファイルから置き換える
+                tmp_filename = cache_filename[:-len('.npz')] + '.' + str(os.getpid()) + '.tmp.npz'
+                np.savez(
+                    tmp_filename,
+                    times=loaded[0],
+                    alt_axis=loaded[1],
+                    profiles=loaded[2],
+                    source_mtime=stat.st_mtime_ns,
+                    source_size=stat.st_size)
+                os.replace(tmp_filename, cache_filename)
+            except OSError:
+                # キャッシュを書き込めない場合は保存しない
+                pass
+
+    for array in loaded:
+        array.flags.writeable = False
+    _forecast_cache[key] = loaded
+    return loaded
+
+
+def _parse_forecast(forecast_filename):
+    with open(forecast_filename, 'r') as f:
+        lines = [line for line in f if line.strip() and line.lstrip()[0] not in '#$%']
+    data = pd.read_csv(io.StringIO(''.join(lines)), header=None).to_numpy(dtype=float)
+    if data.shape[1] == 4:
+        order = np.argsort(data[:, 0], kind='stable')
+        return np.zeros(1), data[order, 0], data[order, 1:][np.newaxis]
+    elif data.shape[1] == 5:
+        times = np.unique(data[:, 0])
+        alt_list = []
+        profile_list = []
+        for t in times:
+            rows = data[data[:, 0] == t]
+            rows = rows[np.argsort(rows[:, 1], kind='stable')]
+            alt_list.append(rows[:, 1])
+            profile_list.append(rows[:, 2:])
+        return _merge_profiles(times, alt_list, profile_list)
+    raise ValueError('Invalid forecast file "'+forecast_filename+'": 4 or 5 columns are expected.')
+
+
+def _merge_profiles(times, alt_list, profile_list):
+    # 予報時刻ごとに高度が異なる場合は全高度の和集合を共通の高度軸とする
+    # (各プロファイルの折れ線は和集合の格子上で厳密に再現される)
+    if all(len(alt) == len(alt_list[0]) and (alt == alt_list[0]).all() for alt in alt_list):
+        return np.asarray(times, dtype=float), alt_list[0], np.array(profile_list)
+    alt_axis = np.unique(np.concatenate(alt_list))
+    profiles = np.array([
+        np.stack([np.interp(alt_axis, alt, w) for w in profile.T], axis=-1)
+        for alt, profile in zip(alt_list, profile_list)
+    ])
+    return np.asarray(times, dtype=float), alt_axis, profiles
+
+
+class WindTurbulence(Wind):
+    '''
+    平均風(base)に高度方向の乱流(突風)成分を加えた風モデル
+
+    乱流成分は高度方向の空間スペクトル(DrydenまたはvonKarman)に従う不規則変動とし,
+    乱数の系列(seed, realization)ごとに一つの実現値を等間隔の高度格子上でFFTにより合成して
+    テーブルとして保持する. 評価時はテーブルの線形補間のみで乱数は使用しない.
+    ロケットは主に鉛直方向に風の場を通過するため, 鉛直成分(z)には縦方向のスペクトル,
+    水平成分(x, y)には横方向のスペクトルを用いる
+    '''
+    def __init__(
+            self,
+            base=None,
+            sigma=1.0,
+            length_scale=300.,
+            spectrum='dryden',
+            seed=0,
+            realization=0,
+            h_max=20000.,
+            dh=1.0,
+            gust_table=None
+        ):
+        '''
+        INPUT
+            base: 平均風のWind. 省略時は無風
+            sigma: 乱流の標準偏差 [m/s] (スカラまたはx, y, z成分ごとの3要素)
+            length_scale: 乱流のスケール長 [m] (スカラまたはx, y, z成分ごと)
+            spectrum: 'dryden' or 'von_karman'
+            seed: 乱数のシード. 同じ(seed, realization)からは常に同じ実現値が得られる
+            realization: 実現値の番号. 番号ごとに独立な乱数系列(SeedSequenceの子)を用いる
+            h_max: 乱流を合成する最大高度 [m] (以上と0m以下は端の値)
+            dh: 合成する高度格子の刻み [m]
+            gust_table: 合成済みの乱流成分のテーブル(turbulence_tables()の結果の1つ).
+                指定した場合は合成を省略する
+        '''
+        self.base = Wind() if base is None else base
+        self.sigma = sigma
+        self.length_scale = length_scale
+        self.spectrum = spectrum
+        self.seed = seed
+        self.realization = realization
+        if gust_table is None:
+            gust_table = turbulence_tables(
+                            [realization], sigma, length_scale, spectrum, seed, h_max, dh)[0]
+        self.gust = WindTable(0.0, dh, gust_table)
+
+    @classmethod
+    def ensemble(cls, n, base=None, first_realization=0, **kwargs):
+        '''
+        実現値番号 first_realization から n個のWindTurbulenceを一括で合成して返す
+        (引数はWindTurbulenceと同じ)
+        '''
+        realizations = range(first_realization, first_realization + n)
+        names = ('sigma', 'length_scale', 'spectrum', 'seed', 'h_max', 'dh')
+        defaults = (1.0, 300., 'dryden', 0, 20000., 1.0)
+        args = [kwargs.get(name, default) for name, default in zip(names, defaults)]
+        tables = turbulence_tables(realizations, *args)
+        return [
+            cls(base, realization=i, gust_table=table, **kwargs)
+            for i, table in zip(realizations, tables)
+        ]
+
     def wind(self, h):
-        return self._w(h)
+        return self.base.wind(h) + self.gust.wind(h)
+
+    def resolution(self):
+        return _min_resolution([self.base, self.gust])
+
+
+def wind_altitude_grid(winds=(), dh=20., h_max=20000.):
+    '''
+    風をテーブル化して線形補間する際の高度格子(batch.BatchTrajectorySolver, rhs_numba.NumbaRHSで使用)
+    低高度ほど細かい刻みとし, 風モデルが固有の刻み(resolution())を持つ場合はそれ以下の刻みとする
+    INPUT
+        winds: Windまたはそのリスト
+        dh: 1000m以上での刻み [m]
+        h_max: 格子の最大高度 [m]
+    OUTPUT
+        昇順の高度の配列 [m]
+    '''
+    if isinstance(winds, Wind):
+        winds = [winds]
+    resolution = _min_resolution(winds)
+    if resolution is not None:
+        dh = min(dh, resolution)
+    return np.unique(np.r_[
+        np.arange(0.0, 100.0, min(dh, 0.5)),
+        np.arange(100.0, 1000.0, min(dh, 5.0)),
+        np.arange(1000.0, h_max + dh, dh)
+    ])
+
+
+def _min_resolution(winds):
+    values = [w.resolution() for w in winds]
+    values = [v for v in values if v is not None]
+    return min(values) if values else None
+
+
+def turbulence_tables(
+        realizations,
+        sigma=1.0,
+        length_scale=300.,
+        spectrum='dryden',
+        seed=0,
+        h_max=20000.,
+        dh=1.0):
+    '''
+    乱流成分の実現値を高度0~h_maxの等間隔格子上でFFTにより一括で合成する
+    INPUT
+        realizations: 実現値の番号のリスト
+        (その他はWindTurbulenceを参照)
+    OUTPUT
+        (len(realizations), n_h, 3) の配列. n_h = ceil(h_max/dh) + 1
+    '''
+    n_h = int(np.ceil(h_max / dh)) + 1
+    # 周期境界の影響を避けるため, 合成する長さは高度範囲の2倍以上の2のべき乗とする
+    n_fft = 1 << int(np.ceil(np.log2(2 * n_h)))
+    omega = 2.0 * np.pi * np.fft.rfftfreq(n_fft, dh)  # 空間角周波数 [rad/m]
+    d_omega = omega[1]
+
+    sigma = np.broadcast_to(np.asarray(sigma, dtype=float), (3,))
+    length_scale = np.broadcast_to(np.asarray(length_scale, dtype=float), (3,))
+    # x, y: 横方向, z: 縦方向のスペクトル
+    psd = np.stack([
+        _turbulence_psd(omega, sigma[i], length_scale[i], spectrum, longitudinal=(i == 2))
+        for i in range(3)
+    ])
+    psd[:, 0] = 0.0  # 平均値は0
+
+    # 各周波数成分の複素振幅 c_k (E|c_k|^2 = 2 * psd * d_omega) をirfftの係数に換算する
+    amplitude = np.sqrt(psd * d_omega) * (n_fft / 2.0)
+    # 実現値ごとに独立な乱数系列から係数を生成し, 逆FFTは全実現値をまとめて行う
+    coeff = np.empty((len(realizations), 3, len(omega)), dtype=complex)
+    for j, i in enumerate(realizations):
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(i),)))
+        coeff[j].real = rng.standard_normal((3, len(omega)))
+        coeff[j].imag = rng.standard_normal((3, len(omega)))
+    coeff *= amplitude
+    return np.fft.irfft(coeff, n=n_fft, axis=-1)[:, :, :n_h].transpose(0, 2, 1).copy()
+
+
+def _turbulence_psd(omega, sigma, L, spectrum, longitudinal):
+    # 片側の空間パワースペクトル密度 (0~無限大の積分がsigma^2)
+    if spectrum == 'dryden':
+        x = (L * omega)**2
+        if longitudinal:
+            return sigma**2 * 2.0 * L / np.pi / (1.0 + x)
+        return sigma**2 * L / np.pi * (1.0 + 3.0*x) / (1.0 + x)**2
+    elif spectrum == 'von_karman':
+        x = (1.339 * L * omega)**2
+        if longitudinal:
+            return sigma**2 * 2.0 * L / np.pi / (1.0 + x)**(5.0/6.0)
+        return sigma**2 * L / np.pi * (1.0 + 8.0/3.0*x) / (1.0 + x)**(11.0/6.0)
+    raise ValueError('Invalid turbulence spectrum "'+str(spectrum)+'" was indicated.')
 
 
 def createWind(wind_model, params_dict):
@@ -89,7 +469,7 @@ def createWind(wind_model, params_dict):
     create instance of Wind class.  
     INPUT
         wind_model: name of wind model.
-            `constant`, `power` or `forecast` is currently available(v0.1.0).
+            `constant`, `power`, `forecast`, `hybrid` or `turbulence` is currently available.
         params_dict: dict of parameters that is needed for the model
 
         NOTE:ハイブリッド風モデルの場合、params_dictの2つのWindオブジェクトには以下の二種類の指定方法が利用できる
@@ -124,8 +504,10 @@ def createWind(wind_model, params_dict):
     elif wind_model == 'power':
         return WindPower(params_dict['z0'], params_dict['n'], params_dict['wind_std'])
     elif wind_model == 'forecast':
-        return
-        #return WindForecast()
+        return WindForecast(
+                    params_dict['filename'],
+                    params_dict.get('time'),
+                    params_dict.get('cache', True))
     elif wind_model == 'hybrid':
         '''
         Hybridモデルで合成する2つの風モデル：wind0, wind1も
@@ -150,5 +532,16 @@ def createWind(wind_model, params_dict):
                     params_dict['border_height1'],
                     params_dict['weight0'],
                     params_dict['weight1'])
+    elif wind_model == 'turbulence':
+        # 平均風(base)もディクショナリ型で指定できる
+        base = params_dict.get('base')
+        if type(base) is dict:
+            base = createWind(base['wind_model'], base['wind_parameters'])
+        kwargs = {
+            name: params_dict[name]
+            for name in ('sigma', 'length_scale', 'spectrum', 'seed', 'realization', 'h_max', 'dh')
+            if name in params_dict
+        }
+        return WindTurbulence(base, **kwargs)
     else:
-        ValueError('Invalid wind model')
\ No newline at end of file
+        raise ValueError('Invalid wind model "'+str(wind_model)+'" was indicated.')
\ No newline at end of file
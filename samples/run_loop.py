@@ -1,52 +1,24 @@
 import rocketsimu.simulator as simu
+import rocketsimu.dispersion as dispersion
+from rocketsimu.result_store import ResultStoreWriter, ResultStore
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import argparse
-import multiprocessing
 import os
 import json
 import numpy as np
-import pandas as pd
 import quaternion
 
 from lib import kmlplot
-from lib.numpy2json import NumpyEncoder
 
-def run_simu(params, idx, foldername='tmp'):
-    
-    print(f'[PID:{os.getpid()}] Start')
-
-    # シミュレーション
-    t, x, v, q, omega, log = simu.simulate(params, cons_out=False)
-
-    print(f'[PID:{os.getpid()}] landing XYZ:', log['landing']['x'])
-    log.update({'loop_id': idx})
-    with open(os.path.join(foldername, str(idx)+'.json'), 'w') as f:
-        json.dump(log, f, indent=2, cls=NumpyEncoder)
-
-    # 結果を弾道履歴表(csv), パラメータ(json), 特異点ログ(json)に分けてファイル出力
-    # q_float = quaternion.as_float_array(q)
-    trajectory = {
-        't': t,
-        'x': x[0],
-        'y': x[1],
-        'z': x[2],
-        'vx': v[0],
-        'vy': v[1],
-        'vz': v[2],
-        'qx': q[0],
-        'qy': q[1],
-        'qz': q[2],
-        'qw': q[3],
-        'wx': omega[0],
-        'wy': omega[1],
-        'wz': omega[2]
-    }
-    df = pd.DataFrame(trajectory)
-    df = df.set_index('t')
-    df.to_csv(os.path.join(foldername, str(idx)+'.csv')) #弾道表
+def run_batch(params, speed_array, azimuth_array, writer):
+    winds = []
+    for case in dispersion.wind_cases(params, speed_array, azimuth_array):
+        winds.append({'wind_model': params['wind_model'], 'wind_parameters': case['wind_parameters']})
 
-    print(f'[PID:{os.getpid()}] End')
+    logs = simu.simulate_batch(params, winds=winds)
+    for idx, log in enumerate(logs):
+        writer.append(idx, log)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -56,6 +28,7 @@ if __name__ == '__main__':
     parser.add_argument("out", help="output directory")
     parser.add_argument("-k", "--kml", help="kml filename")
     parser.add_argument("-p", "--process", help="max number of processes to be used. laptop:4~8, desktop:8~16")
+    parser.add_argument("-b", "--batch", action="store_true", help="integrate all cases at once with the batch solver (event logs only, no trajectory output)")
     args = parser.parse_args()
 
     # パラメータ読み込み
@@ -83,38 +56,19 @@ if __name__ == '__main__':
     speed_array = np.arange(speed_range[0], speed_range[1], speed_range[2])
     print('azimuth arrray: ', azimuth_array)
     print('speed array:', speed_array)
-    proc = []
-    idx = 0
-    for speed in speed_array:
-        # 風向ごとにプロセス並列化して処理（ノートPCでは他のソフトの処理が重くなります）
-        for azimuth in azimuth_array:
-            wind_std = [-speed * np.sin(azimuth), -speed * np.cos(azimuth), 0]
-            params['wind_parameters']['wind_std'] = wind_std
-            p = multiprocessing.Process(target=run_simu, args=(params, idx, args.out))
-            proc.append(p)
-            p.start()
-            idx += 1
-
-            # 終了したプロセスは削除
-            for i, _p in enumerate(proc):
-                if not _p.is_alive():
-                    proc.pop(i)
-
-            # 使用プロセス数が上限に達したらプロセス終了を待つ
-            if len(proc) >= n_process:
-                # いずれかのプロセスの終了を待つ
-                loopf=True
-                while loopf:
-                    for i, _p in enumerate(proc):
-                        if not _p.is_alive():
-                            proc.pop(i)
-                            loopf=False
-                            break
-
-    # 全プロセスの処理終了を待つ
-    for p in proc:
-        p.join()
-    proc = []
+    # 全条件の弾道履歴とイベントログを一つのファイルにまとめて保存する
+    result_path = os.path.join(args.out, 'results.npz')
+    with ResultStoreWriter(result_path) as writer:
+        if args.batch:
+            # 全条件を一つの配列として一括で積分
+            run_batch(params, speed_array, azimuth_array, writer)
+        else:
+            # 条件ごとにプロセスプールで並列に計算し, 終了した条件から保存する
+            cases = dispersion.wind_cases(params, speed_array, azimuth_array)
+            for idx, (t, x, v, q, omega, log) in dispersion.iter_dispersion(params, cases, n_workers=n_process, progress=True):
+                print(f'[case {idx}] landing XYZ:', log['landing']['x'])
+                writer.append(idx, log, t, x, v, q, omega)
+    print('results:', result_path)
 
     if args.kml:
         
@@ -122,16 +76,12 @@ if __name__ == '__main__':
         with open('location_parameters/izu.json') as f:
             regulations = json.load(f)
         
-        idx=0
+        # 落下地点の列のみを読み出す
+        store = ResultStore(result_path)
+        landing = np.asarray(store.log('landing', 'x'))[:, :2]
         scatter = np.zeros((len(speed_array), len(azimuth_array)+1, 2))
-        for r, speed in enumerate(speed_array):
-            for theta, azimuth in enumerate(azimuth_array):
-                wind_std = [-speed * np.sin(azimuth), -speed * np.cos(azimuth), 0]
-                with open(os.path.join(args.out, str(idx)+'.json')) as f:
-                    data = json.load(f)
-                scatter[r, theta] = np.array(data['landing']['x'])[:2]
-                idx += 1
-            scatter[r, -1] = scatter[r, 0] # 楕円の始端と終端を結ぶ
+        scatter[:, :-1] = landing.reshape(len(speed_array), len(azimuth_array), 2)
+        scatter[:, -1] = scatter[:, 0] # 楕円の始端と終端を結ぶ
 
         print('scatter:', scatter)
         for item in regulations:
@@ -0,0 +1,19 @@
+import unittest
+import shutil
+import tempfile
+from rocketsimu import engine
+
+
+class ThrustCacheTestCase(unittest.TestCase):
+    '''
+    推力履歴のキャッシュをホームディレクトリではなく一時ディレクトリに保存するTestCase
+    推力履歴を読み込むテストはこれを継承し, setUp/tearDownでsuper()を呼ぶこと
+    '''
+    def setUp(self):
+        self.thrust_cache_dir = engine.THRUST_CACHE_DIR
+        self.thrust_cache_tmpdir = tempfile.mkdtemp()
+        engine.THRUST_CACHE_DIR = self.thrust_cache_tmpdir
+
+    def tearDown(self):
+        engine.THRUST_CACHE_DIR = self.thrust_cache_dir
+        shutil.rmtree(self.thrust_cache_tmpdir)
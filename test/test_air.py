@@ -1,6 +1,7 @@
 import unittest
 from rocketsimu import air
 import math
+import numpy as np
 
 class TestAir(unittest.TestCase):
     def setUp(self):
@@ -33,6 +34,70 @@ class TestAir(unittest.TestCase):
             1.0
             )
 
+    def test_coefficients(self):
+        # 高速評価が従来の補間と一致すること
+        coeff = air.standard_aero_coeff
+        rng = np.random.default_rng(0)
+        mach = rng.uniform(0.0, 10.0, 200)
+        alpha = rng.uniform(0.0, math.pi, 200)
+        Cd, Cl, CP = coeff.coefficients(mach, alpha, 0.5, 12.0, 1.2)
+        for i in range(len(mach)):
+            self.assertAlmostEqual(Cd[i], coeff.Cd(mach[i], alpha[i], 0.5), places=10)
+            self.assertAlmostEqual(Cl[i], coeff.Cl(mach[i], alpha[i], 12.0), places=10)
+            self.assertAlmostEqual(CP[i], coeff.CP(mach[i], alpha[i], 1.2), places=10)
+            # スカラ入力でも同じ値
+            Cd_s, Cl_s, CP_s = coeff.coefficients(float(mach[i]), float(alpha[i]), 0.5, 12.0, 1.2)
+            self.assertAlmostEqual(Cd_s, Cd[i], places=12)
+            self.assertAlmostEqual(Cl_s, Cl[i], places=12)
+            self.assertAlmostEqual(CP_s, CP[i], places=12)
+
+
+class TestStandardAir(unittest.TestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        self.air = air.Air(None)
+        self.h_array = np.r_[np.linspace(-500., 120000., 1001), self.air.LAYER_TOP]
+
+    def tearDown(self):
+        # procedures after every tests are finished. 
+        # This code block is executed every time
+        pass
+
+    def test_sea_level(self):
+        T, p, rho, a = self.air.standard_air(0.0)
+        self.assertAlmostEqual(T, 298.0)
+        self.assertAlmostEqual(p, 1.013e5)
+
+    def test_layer_continuity(self):
+        '''
+        各層の境界で気温と気圧が連続しているかのテスト
+        '''
+        for h in self.air.LAYER_TOP:
+            lower = np.array(self.air.standard_air(h))
+            upper = np.array(self.air.standard_air(h + 1e-6))
+            np.testing.assert_allclose(lower, upper, rtol=1e-9)
+
+    def test_array_input(self):
+        '''
+        配列入力とスカラ入力の結果が一致するかのテスト
+        '''
+        values_array = np.array(self.air.standard_air(self.h_array))
+        values_scalar = np.array([self.air.standard_air(h) for h in self.h_array]).T
+        self.assertTupleEqual(values_array.shape, (4, len(self.h_array)))
+        np.testing.assert_allclose(values_array, values_scalar, rtol=1e-12)
+
+    def test_table(self):
+        '''
+        補間テーブルの誤差が保持している最大誤差以内に収まるかのテスト
+        '''
+        air_table = air.Air(None, table_dh=10.0)
+        self.assertLess(air_table.table_max_rel_error, 1e-6)
+        exact = np.array(self.air.standard_air(self.h_array))
+        approx = np.array(air_table.standard_air(self.h_array))
+        rel_error = np.abs(approx - exact) / exact
+        self.assertLessEqual(rel_error.max(), air_table.table_max_rel_error * 1.01)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
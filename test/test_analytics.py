@@ -0,0 +1,73 @@
+import unittest
+import os
+import json
+import numpy as np
+import quaternion
+import rocketsimu.simulator as simu
+from rocketsimu.analytics import flight_analytics
+from test import ThrustCacheTestCase
+
+
+class TestAnalytics(ThrustCacheTestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        super().setUp()
+        rootpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../samples'))
+        with open(os.path.join(rootpath, 'sample_parameters.json')) as f:
+            self.params = json.load(f)
+        self.params['thrust_curve_csv'] = os.path.join(rootpath, self.params['thrust_curve_csv'])
+
+    def tearDown(self):
+        # procedures after every tests are finished.
+        # This code block is executed every time
+        super().tearDown()
+
+    def test_flight_analytics(self):
+        '''
+        一括で求めた時間履歴が各時刻で個別に計算した値と一致するかのテスト
+        '''
+        t, x, v, q, omega, log = simu.simulate(self.params, cons_out=False, backend='numba', analytics=True)
+        result = log['analytics']
+        self.assertEqual(result['v_air'].shape, x.shape)
+        self.assertEqual(result['Q'].shape, t.shape)
+
+        # 極値ログは対気速度から求める
+        self.assertEqual(np.max(result['Q']), log['MaxQ']['Q'])
+        self.assertEqual(np.max(result['mach']), log['MaxMach']['mach'])
+        self.assertEqual(np.max(result['airspeed']), log['MaxV']['speed'])
+        self.assertNotEqual(log['MaxV']['speed'], log['MaxV']['ground_speed'])
+
+        _, rocket = simu._prepare_rocket(self.params)
+        for i in np.linspace(1, len(t) - 1, 15).astype(int):
+            Tbl = quaternion.as_rotation_matrix(np.conj(quaternion.as_quat_array(q[:, i])))
+            v_air = -v[:, i] + np.dot(Tbl, rocket.air.wind(x[2, i]))
+            airspeed = np.linalg.norm(v_air)
+            _, _, rho, a = rocket.air.standard_air(x[2, i])
+            alpha = np.arccos(np.abs(v_air[0])/airspeed)
+            _, CG, _, _ = rocket.getMassProperties(t[i])
+            CP = rocket.getCP(airspeed/a, alpha)
+
+            self.assertAlmostEqual(result['airspeed'][i], airspeed, delta=1e-3)
+            self.assertAlmostEqual(result['mach'][i], airspeed/a, delta=1e-5)
+            self.assertAlmostEqual(result['Q'][i], 0.5*rho*airspeed**2, delta=0.5)
+            self.assertAlmostEqual(result['alpha'][i], alpha, delta=1e-4)
+            self.assertAlmostEqual(result['CG'][i], CG, places=10)
+            self.assertAlmostEqual(result['static_margin'][i], (CP - CG)/rocket.diameter, delta=1e-3)
+
+        # 弾道飛行中の鉛直加速度の積分が速度の変化と一致する
+        coast = (t > log['MECO']['t'] + 1.0) & (t < log['apogee']['t'])
+        v_local = np.einsum(
+            'nji,jn->in',
+            quaternion.as_rotation_matrix(np.conj(quaternion.as_quat_array(q.T))),
+            v)
+        dv = np.trapz(result['acceleration'][2, coast], t[coast])
+        self.assertAlmostEqual(dv, v_local[2, coast][-1] - v_local[2, coast][0], delta=0.05)
+
+        # 直接呼び出しても同じ結果
+        direct = flight_analytics(rocket, t, x, v, q, omega)
+        np.testing.assert_array_equal(direct['static_margin'], result['static_margin'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+import quaternion
+from rocketsimu import attitude
+
+
+class TestAttitude(unittest.TestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        rng = np.random.default_rng(1)
+        self.q = rng.normal(size=(20, 4))
+        self.q_unit = self.q / np.linalg.norm(self.q, axis=1, keepdims=True)
+        self.omega = rng.normal(size=(20, 3))
+
+    def tearDown(self):
+        # procedures after every tests are finished.
+        # This code block is executed every time
+        pass
+
+    def test_dcm(self):
+        '''
+        numpy-quaternionによる変換行列と一致するかのテスト(単一/配列, 正規化されていない場合を含む)
+        '''
+        expected = quaternion.as_rotation_matrix(np.conj(quaternion.as_quat_array(self.q)))
+        np.testing.assert_allclose(attitude.dcm(self.q), expected, atol=1e-12)
+        for q, R in zip(self.q, expected):
+            np.testing.assert_allclose(attitude.dcm(q), R, atol=1e-12)
+        np.testing.assert_allclose(attitude.dcm(self.q.reshape(4, 5, 4)), expected.reshape(4, 5, 3, 3), atol=1e-12)
+
+    def test_quaternion_derivative(self):
+        q_omega = quaternion.as_quat_array(np.c_[np.zeros(20), self.omega])
+        expected = quaternion.as_float_array(0.5 * quaternion.as_quat_array(self.q_unit) * q_omega)
+        np.testing.assert_allclose(attitude.quaternion_derivative(self.q_unit, self.omega), expected, atol=1e-12)
+        for q, omega, dq in zip(self.q_unit, self.omega, expected):
+            np.testing.assert_allclose(attitude.quaternion_derivative(q, omega), dq, atol=1e-12)
+
+        # 補正項はノルムのずれを1に引き戻す方向
+        q = self.q_unit * 1.01
+        dq = attitude.quaternion_derivative(q, self.omega)
+        self.assertTrue((np.sum(q*dq, axis=1) < 0.0).all())
+        np.testing.assert_allclose(
+            attitude.quaternion_derivative(q, self.omega, gain=0.0),
+            quaternion.as_float_array(0.5 * quaternion.as_quat_array(q) * q_omega),
+            atol=1e-12)
+
+    def test_normalize(self):
+        np.testing.assert_allclose(np.linalg.norm(attitude.normalize(self.q), axis=1), 1.0)
+        np.testing.assert_allclose(attitude.normalize(self.q[0]), self.q_unit[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
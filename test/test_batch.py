@@ -0,0 +1,51 @@
+import unittest
+import os
+import json
+import copy
+import numpy as np
+import rocketsimu.simulator as simu
+from test import ThrustCacheTestCase
+
+
+class TestBatch(ThrustCacheTestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        super().setUp()
+        rootpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../samples'))
+        with open(os.path.join(rootpath, 'sample_parameters.json')) as f:
+            self.params = json.load(f)
+        self.params['thrust_curve_csv'] = os.path.join(rootpath, self.params['thrust_curve_csv'])
+
+    def tearDown(self):
+        # procedures after every tests are finished. 
+        # This code block is executed every time
+        super().tearDown()
+
+    def test_batch_vs_single(self):
+        '''
+        一括積分の各メンバの落下地点が単独のシミュレーション結果と一致するかのテスト
+        '''
+        winds = [
+            {'wind_model': 'constant', 'wind_parameters': {'wind_std': [3.0, 0.0, 0.0]}},
+            {'wind_model': 'constant', 'wind_parameters': {'wind_std': [0.0, -5.0, 0.0]}}
+        ]
+        elev_angle = [80.0, 85.0]
+        logs = simu.simulate_batch(self.params, winds=winds, elev_angle=elev_angle, cons_out=False)
+        self.assertEqual(len(logs), 2)
+
+        for wind, elev, log_batch in zip(winds, elev_angle, logs):
+            params = copy.deepcopy(self.params)
+            params.update(wind)
+            params['elev_angle'] = elev
+            *_, log = simu.simulate(params, cons_out=False)
+            self.assertAlmostEqual(log_batch['MECO']['t'], log['MECO']['t'], places=6)
+            self.assertLess(abs(log_batch['apogee']['x'][2] - log['apogee']['x'][2]), 1.0)
+            self.assertLess(np.linalg.norm(log_batch['landing']['x'] - log['landing']['x']), 2.0)
+            # 極値は対気速度から求める
+            self.assertAlmostEqual(log_batch['MaxQ']['Q'] / log['MaxQ']['Q'], 1.0, delta=0.02)
+            self.assertAlmostEqual(log_batch['MaxV']['speed'] / log['MaxV']['speed'], 1.0, delta=0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
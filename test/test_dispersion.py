@@ -0,0 +1,82 @@
+import unittest
+import os
+import json
+import copy
+import numpy as np
+import rocketsimu.simulator as simu
+import rocketsimu.dispersion as dispersion
+from test import ThrustCacheTestCase
+
+
+class TestDispersion(ThrustCacheTestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        super().setUp()
+        rootpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../samples'))
+        with open(os.path.join(rootpath, 'sample_parameters.json')) as f:
+            self.params = json.load(f)
+        self.params['thrust_curve_csv'] = os.path.join(rootpath, self.params['thrust_curve_csv'])
+
+    def tearDown(self):
+        # procedures after every tests are finished.
+        # This code block is executed every time
+        super().tearDown()
+
+    def test_wind_cases(self):
+        cases = dispersion.wind_cases(self.params, [1.0, 2.0], np.linspace(0, 2*np.pi, 4, endpoint=False))
+        self.assertEqual(len(cases), 8)
+        # 北風(azimuth=0)は南向き(-y)の風
+        np.testing.assert_allclose(cases[4]['wind_parameters']['wind_std'], [0.0, -2.0, 0.0], atol=1e-12)
+        self.assertEqual(cases[4]['wind_parameters']['kind'], self.params['wind_parameters']['kind'])
+
+    def test_dispersion_vs_single(self):
+        '''
+        プロセスプールで計算した各条件の結果が単独のシミュレーション結果と一致するかのテスト
+        '''
+        self.params['wind_model'] = 'power'
+        self.params['wind_parameters'] = {'z0': 2.0, 'n': 4.5, 'wind_std': [0.0, 0.0, 0.0]}
+        cases = dispersion.wind_cases(self.params, [2.0], np.linspace(0, 2*np.pi, 3, endpoint=False))
+        cases[1]['elev_angle'] = 85.0
+        n_progress = []
+        results = dispersion.run_dispersion(
+                    self.params,
+                    cases,
+                    n_workers=2,
+                    backend='numba',
+                    trajectory=False,
+                    progress=lambda n_done, n_total: n_progress.append((n_done, n_total))
+                    )
+        self.assertEqual(len(results), 3)
+        self.assertEqual(n_progress[-1], (3, 3))
+
+        # スレッドプールでも同じ結果
+        results_thread = dispersion.run_dispersion(
+                    self.params, cases, n_workers=2, backend='numba', trajectory=False, executor='thread')
+        for log, log_thread in zip(results, results_thread):
+            np.testing.assert_array_equal(log['landing']['x'], log_thread['landing']['x'])
+
+        for case, log in zip(cases, results):
+            params = copy.deepcopy(self.params)
+            params.update(case)
+            *_, log_single = simu.simulate(params, cons_out=False, backend='numba')
+            np.testing.assert_allclose(log['landing']['x'], log_single['landing']['x'])
+            self.assertEqual(log['landing']['t'], log_single['landing']['t'])
+
+    def test_missing_event(self):
+        '''
+        t_maxまでに着地しない条件の出力がNaNとなり, 他の条件の計算を止めないかのテスト
+        '''
+        results = dispersion.run_dispersion(
+                    self.params, [{}, {'t_max': 30.0}], n_workers=1, backend='numba', trajectory=False)
+        self.assertNotIn('landing', results[1])
+        Y = dispersion.log_outputs(results, ['landing_x', 'apogee', 'max_q'])
+        self.assertTrue(np.isfinite(Y[0]).all())
+        self.assertTrue(np.isnan(Y[1, :2]).all())
+        self.assertTrue(np.isfinite(Y[1, 2]))
+        with self.assertRaises(ValueError):
+            dispersion.log_outputs(results, ['no_such_output'])
+
+
+if __name__ == '__main__':
+    unittest.main()
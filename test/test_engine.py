@@ -1,4 +1,8 @@
 import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
 from rocketsimu import engine
 import numpy as np
 
@@ -49,6 +53,96 @@ class TestEngine(unittest.TestCase):
         self.assertAlmostEqual(float(impulse_array[self.time_array == 9.00]), 3000.0)
         self.assertAlmostEqual(float(impulse_array[self.time_array == 9.99]), 3000.0)
 
+    def test_resample(self):
+        '''
+        推力の間引き(誤差の上限)と, まとめたテーブルからの補間のテスト
+        '''
+        t = np.arange(0.0, 10.0, 1e-4)
+        f = np.interp(t, [0.0, 0.2, 8.0, 10.0], [0.0, 3000.0, 1500.0, 0.0]) +\
+            1000.0 * np.exp(-t) * np.sin(2*np.pi*2.0*t)
+        tol = 1e-3
+        index = engine.getResampleIndices(t, f, tol)
+        self.assertEqual(index[0], 0)
+        self.assertEqual(index[-1], len(t) - 1)
+        self.assertLess(len(index), len(t) // 100)
+        f_resampled = np.interp(t, t[index], f[index])
+        self.assertLessEqual(np.max(np.abs(f_resampled - f)), tol * np.max(f))
+        self.assertLessEqual(abs(np.trapz(f_resampled, t) - np.trapz(f, t)), tol * np.trapz(f, t))
+        # 推力の変化が大きい時刻に点が集まる
+        self.assertGreater(np.sum(t[index] < 1.0), 2 * np.sum((t[index] > 4.0) & (t[index] < 5.0)))
+        # 間隔の上限
+        index = engine.getResampleIndices(t, np.ones_like(t), tol, max_interval=0.5)
+        self.assertLessEqual(np.max(np.diff(t[index])), 0.5)
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            csv_filename = os.path.join(tmpdir, 'thrust.csv')
+            np.savetxt(csv_filename, np.c_[self.time_array, self.thrust_array], delimiter=',')
+            params = {'mass_prop': 1.0, 'MOI_prop': np.array([0.1, 1.0, 1.0])}
+            engine_full = engine.RocketEngine(params)
+            engine_full.loadThrust(csv_filename, self.dt, cutoff_freq=0., cache=False)
+            engine_resampled = engine.RocketEngine(params)
+            engine_resampled.loadThrust(csv_filename, self.dt, cutoff_freq=0., resample_tol=tol, cache=False)
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertTupleEqual(engine_full.thrust_table.shape, (engine_full.thrust_n_samples, 6))
+        self.assertLess(engine_resampled.thrust_n_samples, engine_full.thrust_n_samples // 10)
+        self.assertEqual(engine_resampled.impulse_total, engine_full.impulse_total)
+
+        t_eval = np.linspace(-1.0, engine_full.thrust_cutoff_time - 1e-3, 101)
+        time_full = engine_full.thrust_time_array
+        for e in (engine_full, engine_resampled):
+            self.assertEqual(e.thrust(100.0), 0.0)
+            np.testing.assert_allclose(e.propMOI(100.0), np.zeros(3))
+            for t_i in t_eval:
+                self.assertAlmostEqual(e.thrust(t_i), np.interp(t_i, time_full, engine_full.thrust_array), delta=1.0)
+                self.assertAlmostEqual(e.propMass(t_i), np.interp(t_i, time_full, engine_full.mass_prop_array), delta=1.5e-3)
+            np.testing.assert_allclose(e.thrust(t_eval), [e.thrust(t_i) for t_i in t_eval])
+            np.testing.assert_allclose(e.impulse(t_eval), [e.impulse(t_i) for t_i in t_eval])
+            np.testing.assert_allclose(e.propMOI(t_eval), [e.propMOI(t_i) for t_i in t_eval])
+
+    def test_thrust_cache(self):
+        '''
+        推力の前処理結果のキャッシュ(プロセス内, ファイル)のテスト
+        '''
+        tmpdir = tempfile.mkdtemp()
+        try:
+            csv_filename = os.path.join(tmpdir, 'thrust.csv')
+            np.savetxt(csv_filename, np.c_[self.time_array, self.thrust_array], delimiter=',')
+            cache_dir = os.path.join(tmpdir, 'cache')
+            engine.clearThrustCache()
+            with mock.patch.object(engine, 'THRUST_CACHE_DIR', cache_dir):
+                params = {'mass_prop': 1.0, 'MOI_prop': np.array([0.1, 1.0, 1.0])}
+                engine_ref = engine.RocketEngine(params)
+                engine_ref.loadThrust(csv_filename, self.dt, cache=False)
+                self.assertFalse(os.path.exists(cache_dir))
+
+                engine_1 = engine.RocketEngine(params)
+                engine_1.loadThrust(csv_filename, self.dt)
+                self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+                # プロセス内のキャッシュ, ファイルのキャッシュの順に使用し, 前処理をやり直さない
+                with mock.patch.object(engine, '_preprocessThrust', side_effect=AssertionError):
+                    engine_2 = engine.RocketEngine(params)
+                    engine_2.loadThrust(csv_filename, self.dt)
+                    engine.clearThrustCache()
+                    engine_3 = engine.RocketEngine(params)
+                    engine_3.loadThrust(csv_filename, self.dt)
+
+                for e in (engine_1, engine_2, engine_3):
+                    np.testing.assert_array_equal(e.thrust_time_array, engine_ref.thrust_time_array)
+                    np.testing.assert_array_equal(e.thrust_array, engine_ref.thrust_array)
+                    np.testing.assert_array_equal(e.prop_table, engine_ref.prop_table)
+
+                # フィルタの方法が異なれば別のキャッシュになる
+                engine_4 = engine.RocketEngine(params)
+                engine_4.loadThrust(csv_filename, self.dt, lpf_method='sosfiltfilt')
+                self.assertEqual(len(os.listdir(cache_dir)), 2)
+                self.assertFalse(np.array_equal(engine_4.thrust_array, engine_ref.thrust_array))
+        finally:
+            engine.clearThrustCache()
+            shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
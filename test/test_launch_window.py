@@ -0,0 +1,90 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from unittest import mock
+import numpy as np
+from rocketsimu import launch_window, dispersion, engine, wind
+
+
+class TestLaunchWindow(unittest.TestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        rootpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../samples'))
+        with open(os.path.join(rootpath, 'sample_parameters.json')) as f:
+            self.params = json.load(f)
+        self.params['thrust_curve_csv'] = os.path.join(rootpath, self.params['thrust_curve_csv'])
+        self.params['wind_model'] = 'constant'
+        self.params['wind_parameters'] = {'wind_std': [0.0, 0.0, 0.0]}
+        self.tmpdir = tempfile.mkdtemp()
+        self.forecast_filename = os.path.join(self.tmpdir, 'forecast.csv')
+        launch_window.clear_cache()
+
+    def tearDown(self):
+        # procedures after every tests are finished.
+        # This code block is executed every time
+        launch_window.clear_cache()
+        shutil.rmtree(self.tmpdir)
+
+    def write_forecast(self, winds):
+        # 予報時刻ごとに高度によらず一定の風
+        with open(self.forecast_filename, 'w') as f:
+            for hour, wind in enumerate(winds):
+                for alt in (0.0, 1000.0, 5000.0):
+                    f.write('{},{},{},{},0.0\n'.format(hour, alt, wind[0], wind[1]))
+
+    def test_landing_ellipse(self):
+        rng = np.random.default_rng(0)
+        cov = np.array([[4.0, 1.5], [1.5, 1.0]])
+        points = rng.multivariate_normal([10.0, -5.0], cov, 20000)
+        ellipse = launch_window.landing_ellipse(points, confidence=0.9)
+        np.testing.assert_allclose(ellipse['center'], [10.0, -5.0], atol=0.05)
+        # 楕円内の割合は信頼度と一致する
+        d = points - ellipse['center']
+        angle = np.deg2rad(ellipse['angle'])
+        u = d[:, 0]*np.cos(angle) + d[:, 1]*np.sin(angle)
+        v = -d[:, 0]*np.sin(angle) + d[:, 1]*np.cos(angle)
+        inside = (u/ellipse['semi_major'])**2 + (v/ellipse['semi_minor'])**2 <= 1.0
+        self.assertAlmostEqual(np.mean(inside), 0.9, delta=0.01)
+        # 着地しなかった条件(NaN)は除く
+        with_nan = launch_window.landing_ellipse(np.vstack((points, [np.nan, np.nan])), confidence=0.9)
+        self.assertEqual(with_nan['semi_major'], ellipse['semi_major'])
+
+    def test_sweep_cache(self):
+        '''
+        予報が変わった時刻のみ計算し直すかのテスト
+        '''
+        perturbations = launch_window.turbulence_perturbations(2, sigma=2.0)
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        with mock.patch.object(launch_window, 'CACHE_DIR', cache_dir),\
+                mock.patch.object(wind, 'FORECAST_CACHE_DIR', self.tmpdir),\
+                mock.patch.object(engine, 'THRUST_CACHE_DIR', self.tmpdir),\
+                mock.patch.object(dispersion, 'run_dispersion', wraps=dispersion.run_dispersion) as run:
+            self.write_forecast([[2.0, 0.0], [0.0, 2.0], [-2.0, 0.0]])
+            results = launch_window.launch_window_sweep(
+                        self.params, self.forecast_filename, [0.0, 1.0], perturbations, n_workers=1, backend='numba')
+            self.assertEqual(len(run.call_args[0][1]), 4)
+            self.assertListEqual([r['cached'] for r in results], [False, False])
+            self.assertTupleEqual(results[0]['values'].shape, (2, 3))
+            self.assertTupleEqual(results[0]['landing'].shape, (2, 2))
+            # 乱流の実現値ごとに落下地点が異なる
+            self.assertGreater(results[0]['ellipse']['semi_major'], 0.0)
+            # 予報時刻ごとに風が異なる
+            self.assertGreater(np.linalg.norm(results[0]['ellipse']['center'] - results[1]['ellipse']['center']), 10.0)
+
+            # 1時の予報のみ更新
+            self.write_forecast([[2.0, 0.0], [0.0, 4.0], [-2.0, 0.0]])
+            launch_window.clear_cache()
+            updated = launch_window.launch_window_sweep(
+                        self.params, self.forecast_filename, [0.0, 1.0], perturbations, n_workers=1, backend='numba')
+            self.assertEqual(run.call_count, 2)
+            self.assertEqual(len(run.call_args[0][1]), 2)
+            self.assertListEqual([r['cached'] for r in updated], [True, False])
+            np.testing.assert_array_equal(updated[0]['values'], results[0]['values'])
+            self.assertFalse(np.allclose(updated[1]['values'], results[1]['values']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -31,5 +31,26 @@ class TestLPF(unittest.TestCase):
         self.assertEqual(mask_10.all(), True)
         self.assertEqual(mask_8.all(), True)
 
+    def test_long_signal(self):
+        '''
+        高速な長さまで延長する長い信号と, sosfiltfiltのテスト
+        '''
+        dt = 1e-4
+        t = np.arange(0., 7.0001, dt)  # 70001点(高速なFFT長ではない)
+        y = np.sin(2*np.pi*3*t) + 0.5*np.sin(2*np.pi*500*t)
+        expected = np.sin(2*np.pi*3*t)
+
+        lpf_fft = LPF(y, dt, 50.0)
+        self.assertEqual(len(lpf_fft), len(y))
+        # 端部以外は低周波成分のみが残る
+        np.testing.assert_allclose(lpf_fft[1000:-1000], expected[1000:-1000], atol=1e-2)
+
+        lpf_sos = LPF(y, dt, 50.0, method='sosfiltfilt')
+        self.assertEqual(len(lpf_sos), len(y))
+        np.testing.assert_allclose(lpf_sos[1000:-1000], expected[1000:-1000], atol=1e-2)
+
+        with self.assertRaises(ValueError):
+            LPF(y, dt, 50.0, method='no_such_method')
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,86 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from unittest import mock
+import numpy as np
+from rocketsimu import motors, engine
+from rocketsimu.vehicle import compile_parameters
+
+
+class TestMotors(unittest.TestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        rootpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../samples'))
+        with open(os.path.join(rootpath, 'sample_parameters.json')) as f:
+            self.params = json.load(f)
+        self.params['thrust_curve_csv'] = os.path.join(rootpath, self.params['thrust_curve_csv'])
+        self.tmpdir = tempfile.mkdtemp()
+
+        # サンプルの推力を2倍にしたモータ
+        data = engine.readThrustCSV(self.params['thrust_curve_csv'])
+        self.double_csv = os.path.join(self.tmpdir, 'double.csv')
+        np.savetxt(self.double_csv, np.c_[data[:, 0], 2.0 * data[:, 1]], delimiter=',')
+
+    def tearDown(self):
+        # procedures after every tests are finished.
+        # This code block is executed every time
+        shutil.rmtree(self.tmpdir)
+
+    def test_impulse_class(self):
+        self.assertEqual(motors.impulse_class(1.0), 'A')
+        self.assertEqual(motors.impulse_class(2.5), 'A')
+        self.assertEqual(motors.impulse_class(2.6), 'B')
+        self.assertEqual(motors.impulse_class(640.0), 'I')
+        self.assertEqual(motors.impulse_class(641.0), 'J')
+
+    def test_library(self):
+        path = os.path.join(self.tmpdir, 'library')
+        library = motors.MotorLibrary(path)
+        sample = library.add('sample', self.params['thrust_curve_csv'], 0.0001, 10.0, maker='test')
+        double = library.add('sample x2', self.double_csv, 0.0001, 20.0, MOI_prop=[0.1, 2.0, 2.0])
+        self.assertAlmostEqual(double['total_impulse'], 2.0 * sample['total_impulse'], places=6)
+        self.assertEqual(ord(double['impulse_class']) - ord(sample['impulse_class']), 1)
+        self.assertEqual(sample['maker'], 'test')
+
+        # 索引はファイルに保存され, 開き直すと推力履歴を読み込まずに検索できる
+        with mock.patch.object(motors, 'readThrustCSV', side_effect=AssertionError):
+            library = motors.MotorLibrary(path)
+            self.assertListEqual(library.names(), ['sample', 'sample x2'])
+            self.assertListEqual(library.select(impulse_class=sample['impulse_class']), ['sample'])
+            self.assertListEqual(library.select(min_impulse=sample['total_impulse'] * 1.5), ['sample x2'])
+            self.assertListEqual(library.select(max_burn_time=sample['burn_time'] + 1.0), ['sample', 'sample x2'])
+            self.assertListEqual(list(library.table().index), ['sample', 'sample x2'])
+
+        # 推力履歴は一度だけ読み込む
+        with mock.patch.object(motors, 'readThrustCSV', wraps=motors.readThrustCSV) as read:
+            time_array, thrust_array = library.curve('sample x2')
+            library.curve('sample x2')
+            self.assertEqual(read.call_count, 1)
+        self.assertFalse(thrust_array.flags.writeable)
+
+        # 単一ファイルにまとめたライブラリ
+        bundle_filename = os.path.join(self.tmpdir, 'library.npz')
+        library.export(bundle_filename)
+        bundle = motors.MotorLibrary(bundle_filename)
+        self.assertListEqual(bundle.names(), library.names())
+        np.testing.assert_array_equal(bundle.curve('sample x2')[1], thrust_array)
+        with self.assertRaises(ValueError):
+            bundle.add('other', self.double_csv, 0.0001, 20.0)
+
+        with mock.patch.object(engine, 'THRUST_CACHE_DIR', os.path.join(self.tmpdir, 'cache')):
+            for lib in (library, bundle):
+                cases = lib.cases()
+                self.assertEqual(len(cases), 2)
+                self.assertListEqual(cases[1]['MOI_prop'], [0.1, 2.0, 2.0])
+                vehicle = compile_parameters(self.params)
+                engine_1 = vehicle.replace(cases[0]).engine
+                engine_2 = vehicle.replace(cases[1]).engine
+                self.assertAlmostEqual(engine_2.impulse_total, 2.0 * engine_1.impulse_total)
+                self.assertEqual(vehicle.replace(cases[1]).params['mass_prop'], 20.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+import os
+import tempfile
+import shutil
+import numpy as np
+import quaternion
+from unittest import mock
+from rocketsimu import result_store
+from rocketsimu.result_store import ResultStoreWriter, ResultStore
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'results.npz')
+
+    def tearDown(self):
+        # procedures after every tests are finished.
+        # This code block is executed every time
+        shutil.rmtree(self.tmpdir)
+
+    def make_result(self, case_id, n):
+        t = np.linspace(0.0, 1.0, n) + case_id
+        x = np.vstack((t, 2*t, 3*t))
+        v = -x
+        q = np.vstack((np.ones(n), np.zeros((3, n)))) * case_id
+        omega = x * 0.5
+        log = {
+            'apogee': {'t': 10.0 + case_id, 'x': x[:, -1], 'q': np.quaternion(1, 0, 0, case_id)},
+            'landing': {'t': 20.0 + case_id, 'x': np.array([case_id, -case_id, 0.0])},
+            'MaxQ': {'Q': 100.0 * case_id, 't': 1.0}
+        }
+        if case_id == 0:
+            log['drogue'] = {'t': 11.0}
+        return t, x, v, q, omega, log
+
+    def test_write_read(self):
+        '''
+        順不同で追記した結果が条件番号順に読み出せるかのテスト
+        '''
+        results = {i: self.make_result(i, 5 + 3*i) for i in range(4)}
+        with ResultStoreWriter(self.path) as writer:
+            for i in (2, 0, 3, 1):
+                t, x, v, q, omega, log = results[i]
+                writer.append(i, log, t, x, v, q, omega)
+
+        store = ResultStore(self.path)
+        self.assertEqual(len(store), 4)
+        np.testing.assert_array_equal(store.case_id, [0, 1, 2, 3])
+        self.assertEqual(store.events(), ['MaxQ', 'apogee', 'drogue', 'landing'])
+        self.assertIsInstance(store.column('t'), np.memmap)
+
+        for i in range(4):
+            for a, b in zip(store.trajectory(i), results[i][:5]):
+                np.testing.assert_array_equal(a, b)
+
+        np.testing.assert_array_equal(store.log('landing', 'x')[:, 0], [0, 1, 2, 3])
+        np.testing.assert_array_equal(store.log('MaxQ', 'Q'), [0., 100., 200., 300.])
+        np.testing.assert_array_equal(store.log('apogee', 'q')[3], [1, 0, 0, 3])
+        # 存在しないイベントはNaN
+        self.assertEqual(store.log('drogue', 't')[0], 11.0)
+        self.assertTrue(np.isnan(store.log('drogue', 't')[1:]).all())
+
+        # numpyのnpzとしても読める
+        with np.load(self.path) as npz:
+            np.testing.assert_array_equal(npz['x'], store.column('x'))
+
+        # 一時ファイルが残っていない
+        self.assertEqual(os.listdir(self.tmpdir), ['results.npz'])
+
+    def test_log_only(self):
+        with ResultStoreWriter(self.path) as writer:
+            writer.append(0, self.make_result(0, 3)[-1])
+            writer.append(1, self.make_result(1, 3)[-1])
+        store = ResultStore(self.path)
+        self.assertEqual(len(store.column('t')), 0)
+        np.testing.assert_array_equal(store.log('landing', 't'), [20.0, 21.0])
+
+    def test_skip_non_numeric(self):
+        '''
+        数値でない項目やネストしたDict(profile=Trueの計測結果)を含むログのテスト
+        '''
+        log = self.make_result(0, 3)[-1]
+        log['profile'] = {
+            'wall_time': 0.5,
+            'rhs_count': {2: 10, 3: 20},
+            'step_size': {2: {'n': 3, 'steps': np.ones(3)}}
+        }
+        log['landing']['label'] = 'landing'
+        with ResultStoreWriter(self.path) as writer:
+            writer.append(0, log)
+        store = ResultStore(self.path)
+        np.testing.assert_array_equal(store.log('profile', 'wall_time'), [0.5])
+        np.testing.assert_array_equal(store.log('landing', 't'), [20.0])
+        self.assertNotIn('log/profile/rhs_count', store.keys())
+        self.assertNotIn('log/landing/label', store.keys())
+
+    def test_skip_variable_shape(self):
+        '''
+        条件によって長さが異なる項目(analytics=Trueの時間履歴)を含むログのテスト
+        '''
+        logs = []
+        for i, n in enumerate((17, 24)):
+            log = self.make_result(i, 3)[-1]
+            log['analytics'] = {'t': np.linspace(0.0, 1.0, n), 'speed': np.ones(n), 'launch_clear': 30.0 + i}
+            logs.append(log)
+        with ResultStoreWriter(self.path) as writer:
+            for i, log in enumerate(logs):
+                writer.append(i, log, *self.make_result(i, 3)[:5])
+        store = ResultStore(self.path)
+        self.assertNotIn('log/analytics/speed', store.keys())
+        self.assertNotIn('log/analytics/t', store.keys())
+        np.testing.assert_array_equal(store.log('analytics', 'launch_clear'), [30.0, 31.0])
+        np.testing.assert_array_equal(store.log('landing', 't'), [20.0, 21.0])
+        self.assertEqual(os.listdir(self.tmpdir), ['results.npz'])
+
+        # 長さが同じでも時間履歴は保存しない
+        with ResultStoreWriter(self.path) as writer:
+            for i in range(2):
+                log = self.make_result(i, 3)[-1]
+                log['analytics'] = {'speed': np.ones(24), 'vector': np.ones(3)}
+                writer.append(i, log)
+        store = ResultStore(self.path)
+        self.assertNotIn('log/analytics/speed', store.keys())
+        np.testing.assert_array_equal(store.log('analytics', 'vector'), np.ones((2, 3)))
+
+    def test_write_error(self):
+        '''
+        書き込みに失敗した場合に一時ファイルと作りかけのファイルが残らないかのテスト
+        '''
+        writer = ResultStoreWriter(self.path)
+        writer.append(0, self.make_result(0, 3)[-1])
+        with mock.patch.object(result_store, '_write_member', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                writer.close()
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import os
+import json
+import numpy as np
+from rocketsimu.rocket import Rocket
+from rocketsimu.engine import RocketEngine
+
+
+class TestRocket(unittest.TestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        rootpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../samples'))
+        with open(os.path.join(rootpath, 'sample_parameters.json')) as f:
+            params = json.load(f)
+
+        self.rocket = Rocket(params)
+        engine = RocketEngine(params)
+        engine.loadThrust(os.path.join(rootpath, params['thrust_curve_csv']), params['thrust_dt'], cache=False)
+        self.rocket.joinEngine(engine, position=params['CG_prop'])
+
+    def tearDown(self):
+        # procedures after every tests are finished.
+        # This code block is executed every time
+        pass
+
+    def test_mass_properties(self):
+        '''
+        重量特性テーブルの補間値がgetMass, getCG, getMOIと一致し,
+        慣性モーメントの微分が差分近似と一致するかのテスト
+        '''
+        rocket = self.rocket
+        h = 1.0e-4
+        for t in [0.0, 0.37, 5.2, 10.01, 19.9, 25.0]:
+            mass, CG, MOI, dMOI_dt = rocket.getMassProperties(t)
+            self.assertAlmostEqual(mass, rocket.getMass(t), places=6)
+            self.assertAlmostEqual(CG, rocket.getCG(t), places=6)
+            np.testing.assert_allclose(MOI, rocket.getMOI(t), rtol=1e-6)
+            if t > h:
+                dMOI_fd = (rocket.getMOI(t+h) - rocket.getMOI(t-h)) / (2*h)
+                np.testing.assert_allclose(dMOI_dt, dMOI_fd, rtol=1e-4)
+
+        # 燃焼終了後は乾燥時の値
+        mass, CG, MOI, dMOI_dt = rocket.getMassProperties(rocket.engine.thrust_cutoff_time + 1.0)
+        self.assertEqual(mass, rocket.mass_dry)
+        self.assertEqual(CG, rocket.CG_dry)
+        np.testing.assert_array_equal(dMOI_dt, np.zeros(3))
+
+
+if __name__ == '__main__':
+    unittest.main()
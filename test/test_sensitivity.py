@@ -0,0 +1,68 @@
+import unittest
+import os
+import json
+import copy
+import numpy as np
+import rocketsimu.simulator as simu
+from rocketsimu import sensitivity
+from test import ThrustCacheTestCase
+
+
+class TestSensitivity(ThrustCacheTestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        super().setUp()
+        rootpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../samples'))
+        with open(os.path.join(rootpath, 'sample_parameters.json')) as f:
+            self.params = json.load(f)
+        self.params['thrust_curve_csv'] = os.path.join(rootpath, self.params['thrust_curve_csv'])
+        self.params['wind_model'] = 'power'
+        self.params['wind_parameters'] = {'z0': 2.0, 'n': 4.5, 'wind_std': [1.0, 2.0, 0.0]}
+
+    def tearDown(self):
+        # procedures after every tests are finished.
+        # This code block is executed every time
+        super().tearDown()
+
+    def test_perturbed_case(self):
+        case = sensitivity._perturbed_case(self.params, 'wind_parameters.wind_std.0', 1.5)
+        self.assertListEqual(case['wind_parameters']['wind_std'], [1.5, 2.0, 0.0])
+        self.assertEqual(case['wind_parameters']['z0'], 2.0)
+        self.assertListEqual(self.params['wind_parameters']['wind_std'], [1.0, 2.0, 0.0])
+        self.assertDictEqual(sensitivity._perturbed_case(self.params, 'Cd0', 0.6), {'Cd0': 0.6})
+        self.assertEqual(sensitivity._get_value(self.params, 'MOI_dry.1'), 70.888)
+
+    def test_sensitivity_vs_single(self):
+        '''
+        一括計算したヤコビ行列が個別のシミュレーションの差分と一致するかのテスト
+        '''
+        names = ['Cd0', 'wind_parameters.wind_std.0']
+        result = sensitivity.sensitivity(
+                    self.params, names, steps={'wind_parameters.wind_std.0': 0.5}, n_workers=2, backend='numba')
+        self.assertListEqual(result['outputs'], list(sensitivity.DEFAULT_OUTPUTS))
+        self.assertTupleEqual(result['jacobian'].shape, (5, 2))
+        np.testing.assert_allclose(result['steps'], [0.005, 0.5])
+
+        outputs = []
+        for Cd0 in (0.505, 0.495):
+            params = copy.deepcopy(self.params)
+            params['Cd0'] = Cd0
+            *_, log = simu.simulate(params, cons_out=False, backend='numba')
+            outputs.append([log['landing']['x'][0], log['landing']['x'][1], log['apogee']['x'][2]])
+        np.testing.assert_allclose(
+            result['jacobian'][:3, 0], (np.array(outputs[0]) - np.array(outputs[1])) / 0.01, rtol=1e-6)
+        # 抗力が増えると最高高度は下がる. 東向き(+x)の風では風上に向く効果が大きく落下地点は西へ
+        self.assertLess(result['jacobian'][2, 0], 0.0)
+        self.assertLess(result['jacobian'][0, 1], 0.0)
+
+        forward = sensitivity.sensitivity(
+                    self.params, ['Cd0'], outputs=['apogee'], scheme='forward', n_workers=1, backend='numba')
+        np.testing.assert_allclose(forward['nominal'], result['nominal'][2])
+        np.testing.assert_allclose(forward['jacobian'][0, 0], result['jacobian'][2, 0], rtol=0.1)
+        with self.assertRaises(ValueError):
+            sensitivity.sensitivity(self.params, ['Cd0'], scheme='backward')
+
+
+if __name__ == '__main__':
+    unittest.main()
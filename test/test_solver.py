@@ -0,0 +1,246 @@
+import unittest
+import os
+import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import rocketsimu.simulator as simu
+from rocketsimu.solver import TrajectorySolver
+from rocketsimu import phase
+from test import ThrustCacheTestCase
+
+
+class TestSolver(ThrustCacheTestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        super().setUp()
+        rootpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../samples'))
+        with open(os.path.join(rootpath, 'sample_parameters.json')) as f:
+            self.params = json.load(f)
+        self.params['thrust_curve_csv'] = os.path.join(rootpath, self.params['thrust_curve_csv'])
+
+    def tearDown(self):
+        # procedures after every tests are finished. 
+        # This code block is executed every time
+        super().tearDown()
+
+    def test_event_times(self):
+        '''
+        イベント駆動型積分で各イベントの状態量が遷移条件の境界上にあるかのテスト
+        '''
+        t, x, v, q, omega, log = simu.simulate(self.params, cons_out=False)
+
+        self.assertAlmostEqual(log['MECO']['t'], 20.0, places=6)
+        self.assertAlmostEqual(log['landing']['x'][2], 0.0, places=6)
+        self.assertAlmostEqual(log['para']['x'][2], self.params['para_trigger']['altitude'], places=6)
+        self.assertAlmostEqual(log['drogue']['t'] - log['apogee']['t'], self.params['drogue_trigger']['fall_time'], places=6)
+        self.assertTrue((t < log['landing']['t']).all())
+        self.assertTrue((x[2][t > 1.0] > 0.0).all())
+
+    def test_numba_backend(self):
+        '''
+        numbaでコンパイルした運動方程式の結果が従来の計算と一致するかのテスト
+        '''
+        logs = {}
+        for backend in ('python', 'numba'):
+            rocket = simu._build_rocket(self.params)
+            solver = TrajectorySolver(
+                        rocket,
+                        dt=self.params['dt'],
+                        max_t=self.params['t_max'],
+                        cons_out=False,
+                        backend=backend
+                        )
+            solver.solve()
+            logs[backend] = solver.solver_log
+
+        for name in ('1stlug_off', '2ndlug_off', 'MECO', 'apogee', 'drogue', 'para', 'landing'):
+            self.assertAlmostEqual(logs['numba'][name]['t'], logs['python'][name]['t'], places=2)
+        np.testing.assert_allclose(logs['numba']['apogee']['x'], logs['python']['apogee']['x'], atol=1.0)
+        np.testing.assert_allclose(logs['numba']['landing']['x'], logs['python']['landing']['x'], atol=1.0)
+
+        with self.assertRaises(ValueError):
+            TrajectorySolver(simu._build_rocket(self.params), backend='fortran')
+
+    def test_output_policy(self):
+        '''
+        出力方針ごとの出力点がgrid出力と同じ弾道上にあるかのテスト
+        '''
+        def solve(**kwargs):
+            solver = TrajectorySolver(
+                        simu._build_rocket(self.params),
+                        dt=self.params['dt'],
+                        max_t=self.params['t_max'],
+                        cons_out=False,
+                        backend='numba',
+                        **kwargs
+                        )
+            return solver, solver.solve()
+
+        solver_grid, solution_grid = solve()
+        t_landing = solver_grid.solver_log['landing']['t']
+        self.assertTrue((solver_grid.t < t_landing).all())
+        self.assertEqual(len(solver_grid.t), len(solution_grid))
+
+        # イベントのみ: 初期状態 + 各イベント
+        solver, solution = solve(output='events')
+        event_t = sorted(item['t'] for item in solver_grid.solver_log.values())
+        np.testing.assert_allclose(solver.t, [0.0] + event_t)
+        np.testing.assert_allclose(solution[-1, :3], solver_grid.solver_log['landing']['x'])
+
+        # 刻み10回ごと: イベント時の状態量も含む
+        solver, solution = solve(output='steps', output_every=10)
+        self.assertTrue(set(event_t) <= set(solver.t))
+        self.assertLess(len(solver.t), len(solver_grid.t) / 10)
+
+        # 時間間引き
+        solver, solution = solve(output_dt=1.0)
+        np.testing.assert_allclose(np.diff(solver.t), 1.0)
+        i = np.argmin(np.abs(solver_grid.t - 100.0))
+        np.testing.assert_allclose(solution[100], solution_grid[i], rtol=1e-6, atol=1e-6)
+
+        # callback
+        received = []
+        solver, solution = solve(output='events', callback=lambda t, u: received.append(t))
+        self.assertIsNone(solution)
+        np.testing.assert_allclose(received, [0.0] + event_t)
+
+
+    def test_profile(self):
+        '''
+        計測モードの集計結果と, 計測の有無で弾道が変わらないかのテスト
+        '''
+        *_, log = simu.simulate(self.params, cons_out=False)
+        rocket = simu._build_rocket(self.params)
+        solver = TrajectorySolver(
+                    rocket,
+                    dt=self.params['dt'],
+                    max_t=self.params['t_max'],
+                    cons_out=False,
+                    output='events',
+                    profile=True
+                    )
+        solver.solve()
+        profile = solver.solver_log['profile']
+        np.testing.assert_array_equal(solver.solver_log['landing']['x'], log['landing']['x'])
+
+        self.assertEqual(set(profile['rhs_count']), {1, 1.1, 2, 3, 3.5, 4})
+        n_rhs = sum(profile['rhs_count'].values())
+        n_rhs_descent = profile['rhs_count'][3.5] + profile['rhs_count'][4]
+        # 運動方程式の1回の評価で重量特性を1回参照する. 空力係数は3自由度の降下モデルでは参照しない
+        self.assertEqual(profile['component_count']['aero'], n_rhs - n_rhs_descent)
+        self.assertEqual(profile['component_count']['mass'], n_rhs)
+        self.assertGreater(profile['component_time']['wind'], 0.0)
+        self.assertLessEqual(sum(profile['component_time'].values()), sum(profile['rhs_time'].values()))
+        self.assertLessEqual(sum(profile['rhs_time'].values()), profile['wall_time'])
+        self.assertGreater(profile['step_size'][3]['n'], 0)
+        self.assertAlmostEqual(
+            sum(np.sum(item['steps']) for item in profile['step_size'].values()),
+            log['landing']['t'])
+
+        # 計測中も共有するRocketは変更せず, 同じRocketを並行に積分しても計測結果は変わらない
+        def attrs():
+            return (set(vars(rocket)), set(vars(rocket.air)), set(vars(rocket.air.wind)))
+        rocket_attrs = attrs()
+        seen = []
+
+        def solve(profile):
+            solver = TrajectorySolver(
+                        rocket,
+                        dt=self.params['dt'],
+                        max_t=self.params['t_max'],
+                        cons_out=False,
+                        output='events',
+                        profile=profile,
+                        callback=lambda t, u: seen.append(attrs())
+                        )
+            solver.solve()
+            return solver.solver_log
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            logs = list(pool.map(solve, [True, False]))
+        self.assertDictEqual(logs[0]['profile']['component_count'], profile['component_count'])
+        self.assertDictEqual(logs[0]['profile']['rhs_count'], profile['rhs_count'])
+        self.assertNotIn('profile', logs[1])
+        self.assertTrue(all(a == rocket_attrs for a in seen))
+        self.assertNotIn('profile', simu.simulate(self.params, cons_out=False, backend='numba')[-1])
+
+
+    def test_descent_model(self):
+        '''
+        パラシュート展開後の3自由度モデルの結果が全自由度モデルと一致するかのテスト
+        '''
+        results = {}
+        for descent in ('3dof', '6dof'):
+            solver = TrajectorySolver(
+                        simu._build_rocket(self.params),
+                        dt=self.params['dt'],
+                        max_t=self.params['t_max'],
+                        cons_out=False,
+                        backend='numba',
+                        descent=descent
+                        )
+            solution = solver.solve()
+            results[descent] = (solver.t, solution, solver.solver_log)
+
+        t, solution, log = results['3dof']
+        _, solution_6dof, log_6dof = results['6dof']
+        for name in ('drogue', 'para', 'landing'):
+            self.assertAlmostEqual(log[name]['t'], log_6dof[name]['t'], places=4)
+        np.testing.assert_allclose(log['landing']['x'], log_6dof['landing']['x'], atol=0.05)
+        n = min(len(solution), len(solution_6dof))
+        np.testing.assert_allclose(solution[:n, 0:6], solution_6dof[:n, 0:6], atol=0.05)
+
+        # 展開後の姿勢と角速度は展開時の値のまま
+        deployed = t > log['drogue']['t']
+        np.testing.assert_array_equal(solution[deployed, 6:], np.tile(solution[deployed][0, 6:], (deployed.sum(), 1)))
+
+        with self.assertRaises(ValueError):
+            TrajectorySolver(simu._build_rocket(self.params), descent='2dof')
+
+    def test_flight_phase(self):
+        '''
+        飛行フェーズの遷移判定が(t, u, phase)のみから決まるかのテスト
+        '''
+        _, rocket = simu._prepare_rocket(self.params)
+        u = np.zeros(13)
+        u[6] = 1.0
+        self.assertIsNone(phase.immediate_transition(rocket, 0.0, u, phase.INITIAL_PHASE))
+        u[2] = rocket.launcher.height_1stlug_off + 0.01
+        self.assertEqual(phase.immediate_transition(rocket, 0.5, u, phase.INITIAL_PHASE), '1stlug_off')
+
+        # 頂点到達前は高度のトリガでは展開しない
+        coasting = phase.FlightPhase(3, None)
+        u[2] = 250.0
+        self.assertIsNone(phase.immediate_transition(rocket, 30.0, u, coasting))
+        descending = phase.advance(coasting, 'apogee', 30.0)
+        self.assertEqual(descending, phase.FlightPhase(3, 30.0))
+        self.assertEqual(phase.immediate_transition(rocket, 31.5, u, descending), 'drogue')
+        self.assertEqual(phase.advance(descending, 'drogue', 31.5), phase.FlightPhase(3.5, 30.0))
+        self.assertEqual(phase.immediate_transition(rocket, 31.5, u, phase.FlightPhase(3.5, 30.0)), 'para')
+
+    def test_shared_rocket(self):
+        '''
+        同じRocketを複数のソルバでスレッドから並行に積分しても
+        逐次に積分した結果と一致し, Rocketが変更されないかのテスト
+        '''
+        _, rocket = simu._prepare_rocket(self.params)
+        x0 = rocket.x.copy()
+
+        def solve(mode):
+            solver = TrajectorySolver(rocket, dt=0.05, max_t=300.0, cons_out=False, mode=mode, output='events')
+            solver.solve()
+            self.assertEqual(solver.phase.state, 5)
+            return solver.solver_log['landing']['x']
+
+        expected = [solve('event'), solve('odeint')]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(solve, ['event', 'odeint'] * 2))
+        for i, x in enumerate(results):
+            np.testing.assert_array_equal(x, expected[i % 2])
+        np.testing.assert_array_equal(rocket.x, x0)
+        self.assertIsNone(rocket.t_apogee)
+        self.assertEqual(rocket.t, 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
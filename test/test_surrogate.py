@@ -0,0 +1,77 @@
+import unittest
+import os
+import json
+import numpy as np
+from rocketsimu import surrogate
+from test import ThrustCacheTestCase
+
+
+class TestSurrogate(ThrustCacheTestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        super().setUp()
+        rootpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../samples'))
+        with open(os.path.join(rootpath, 'sample_parameters.json')) as f:
+            self.params = json.load(f)
+        self.params['thrust_curve_csv'] = os.path.join(rootpath, self.params['thrust_curve_csv'])
+        self.params['wind_model'] = 'power'
+        self.params['wind_parameters'] = {'z0': 2.0, 'n': 4.5, 'wind_std': [0.0, 0.0, 0.0]}
+
+    def tearDown(self):
+        # procedures after every tests are finished.
+        # This code block is executed every time
+        super().tearDown()
+
+    def test_rbf_model(self):
+        '''
+        補間点での一致, LOO誤差(個別に除いて補間した結果との比較), 推定誤差のテスト
+        '''
+        rng = np.random.default_rng(0)
+        X = rng.random((60, 3))
+        f = lambda X: np.c_[np.sin(3*X[:, 0]) + X[:, 1]**2, X[:, 1] * X[:, 2]]
+        model = surrogate.RBFModel(X, f(X))
+        np.testing.assert_allclose(model.predict(X), f(X), atol=1e-9)
+        np.testing.assert_allclose(model.predict(X, chunksize=7), model.predict(X))
+
+        for i in (0, 17, 59):
+            model_i = surrogate.RBFModel(np.delete(X, i, axis=0), np.delete(f(X), i, axis=0))
+            np.testing.assert_allclose(f(X)[i] - model_i.predict(X[i:i+1])[0], model.loo_errors[i], atol=1e-9)
+
+        np.testing.assert_allclose(model.error_estimate(X), np.abs(model.loo_errors), rtol=1e-6)
+        # 推定誤差は実際の誤差と同程度
+        Xq = rng.random((2000, 3))
+        error = np.mean(np.abs(model.predict(Xq) - f(Xq)), axis=0)
+        estimate = np.mean(model.error_estimate(Xq), axis=0)
+        self.assertTrue(((estimate > error / 5) & (estimate < error * 5)).all())
+
+        with self.assertRaises(ValueError):
+            surrogate.RBFModel(X[:4], f(X)[:4])
+
+    def test_landing_surrogate(self):
+        bounds = {'wind_speed': (0.0, 6.0), 'wind_azimuth': (0.0, 360.0), 'elev_angle': (78.0, 85.0)}
+        model = surrogate.LandingSurrogate(self.params, bounds, n_workers=1, backend='numba', seed=1)
+
+        X = model.sample(50)
+        self.assertTupleEqual(X.shape, (50, 3))
+        self.assertTrue(((X >= model.lower) & (X <= model.upper)).all())
+        # 北風(wind_azimuth=0)は南向き(-y)の風
+        case = model.cases([[2.0, 0.0, 80.0]])[0]
+        np.testing.assert_allclose(case['wind_parameters']['wind_std'], [0.0, -2.0, 0.0], atol=1e-12)
+        self.assertEqual(case['elev_angle'], 80.0)
+        self.assertEqual(model.cases([[2.0, 0.0, 80.0]])[0]['wind_parameters']['z0'], 2.0)
+        with self.assertRaises(ValueError):
+            surrogate.LandingSurrogate(self.params, {'no_such_key': (0.0, 1.0)})
+
+        model.build(12, n_refine=3)
+        self.assertEqual(len(model.X), 15)
+        self.assertTupleEqual(model.Y.shape, (15, 3))
+        np.testing.assert_allclose(model.predict(model.X), model.Y, rtol=1e-8)
+        Y, error = model.predict(model.X[0], return_error=True)
+        np.testing.assert_allclose(Y, model.Y[0], rtol=1e-8)
+        self.assertTupleEqual(error.shape, (3,))
+        self.assertListEqual(list(model.loo_rms()), ['landing_x', 'landing_y', 'apogee'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import os
+import json
+import pickle
+import numpy as np
+import rocketsimu.simulator as simu
+from rocketsimu import vehicle
+from test import ThrustCacheTestCase
+
+
+class TestVehicle(ThrustCacheTestCase):
+    def setUp(self):
+        # procedures before every tests are started.
+        # This code block is executed every time
+        super().setUp()
+        rootpath = os.path.abspath(os.path.join(os.path.dirname(__file__), '../samples'))
+        with open(os.path.join(rootpath, 'sample_parameters.json')) as f:
+            self.params = json.load(f)
+        self.params['thrust_curve_csv'] = os.path.join(rootpath, self.params['thrust_curve_csv'])
+        vehicle.clear_cache()
+
+    def tearDown(self):
+        # procedures after every tests are finished.
+        # This code block is executed every time
+        vehicle.clear_cache()
+        super().tearDown()
+
+    def test_cache(self):
+        '''
+        同じ内容のパラメータでは前処理結果が使い回されるかのテスト
+        '''
+        v1 = vehicle.compile_parameters(self.params)
+        v2 = vehicle.compile_parameters(json.loads(json.dumps(self.params)))
+        self.assertIs(v1, v2)
+
+        params = dict(self.params, thrust_dt=self.params['thrust_dt']*2)
+        v3 = vehicle.compile_parameters(params)
+        self.assertIsNot(v3, v1)
+        self.assertNotEqual(v3.key, v1.key)
+
+        # 推力/重量特性に関係しない変更では前処理結果を共有する
+        v4 = v1.replace({'elev_angle': 85.0})
+        self.assertIs(v4.engine.thrust_table, v1.engine.thrust_table)
+        self.assertIs(v4.mass_table, v1.mass_table)
+        self.assertEqual(v4.params['elev_angle'], 85.0)
+        self.assertEqual(v1.params['elev_angle'], self.params['elev_angle'])
+        v5 = v1.replace({'mass_dry': 41.0})
+        self.assertIs(v5.engine.thrust_table, v1.engine.thrust_table)
+        self.assertNotEqual(v5.mass_table[0, 0], v1.mass_table[0, 0])
+
+    def test_immutable_picklable(self):
+        v = vehicle.compile_parameters(self.params)
+        with self.assertRaises(AttributeError):
+            v.engine = None
+        # エンジンの配列(thrust_tableのビューを含む)はすべて読み取り専用
+        for name in ('thrust_time_array', 'thrust_table', 'thrust_array', 'impulse_array',
+                     'mass_prop_array', 'MOI_prop_array', 'prop_table'):
+            with self.assertRaises(ValueError):
+                getattr(v.engine, name)[0] = 0.0
+        # 参照したエンジンへの再代入はキャッシュ中のエンジンに影響しない
+        e = v.engine
+        cutoff_time = e.thrust_cutoff_time
+        e.thrust_cutoff_time = 0.0
+        self.assertEqual(v.engine.thrust_cutoff_time, cutoff_time)
+        with self.assertRaises(ValueError):
+            v.mass_table[0, 0] = 0.0
+        params = v.params
+        params['mass_dry'] = 0.0
+        self.assertEqual(v.params['mass_dry'], self.params['mass_dry'])
+
+        v_loaded = pickle.loads(pickle.dumps(v))
+        self.assertEqual(v_loaded, v)
+        self.assertIs(v_loaded.aero_coeff, v.aero_coeff)
+        np.testing.assert_array_equal(v_loaded.mass_table, v.mass_table)
+        with self.assertRaises(ValueError):
+            v_loaded.engine.impulse_array[0] = 0.0
+
+    def test_simulate(self):
+        '''
+        PreparedVehicleを渡したシミュレーション結果がパラメータを渡した場合と一致するかのテスト
+        '''
+        params = dict(self.params, mass_dry=41.0)
+        v = vehicle.compile_parameters(self.params).replace({'mass_dry': 41.0})
+        *_, log = simu.simulate(v, cons_out=False, backend='numba')
+        *_, log_params = simu.simulate(params, cons_out=False, backend='numba')
+        np.testing.assert_array_equal(log['landing']['x'], log_params['landing']['x'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,17 +2,24 @@ import unittest
 from rocketsimu import wind
 import numpy as np
 import os
+import tempfile
+import shutil
+from unittest import mock
 
 class TestLPF(unittest.TestCase):
     def setUp(self):
         # procedures before every tests are started.
         # This code block is executed every time
-        pass
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = wind.FORECAST_CACHE_DIR
+        wind.FORECAST_CACHE_DIR = os.path.join(self.tmpdir, 'cache')
 
     def tearDown(self):
         # procedures after every tests are finished. 
         # This code block is executed every time
-        pass
+        wind.FORECAST_CACHE_DIR = self.cache_dir
+        wind._forecast_cache.clear()
+        shutil.rmtree(self.tmpdir)
 
     def testForecastFileLoading(self):
         rootpath = os.path.abspath(os.path.dirname(__file__))
@@ -49,5 +56,140 @@ class TestLPF(unittest.TestCase):
         self.assertEqual((wind_hybrid(150) == np.array([0.75, 0.0, 0.25])).all(), True)
         self.assertEqual((wind_hybrid(200.1) == np.array([1.0, 0.0, 0.0])).all(), True)
 
+    def testArrayInput(self):
+        '''
+        高度の配列に対する結果がスカラでの結果と一致するかのテスト
+        '''
+        rootpath = os.path.abspath(os.path.dirname(__file__))
+        winds = [
+            wind.WindConstant([1.0, -2.0, 0.0]),
+            wind.WindPower(2.0, 4.5, [3.0, 1.0, 0.0]),
+            wind.WindForecast(os.path.join(rootpath, 'sample_wind.csv')),
+            wind.HybridWind(
+                wind.WindPower(2.0, 4.5, [3.0, 1.0, 0.0]),
+                wind.WindForecast(os.path.join(rootpath, 'sample_wind.csv')),
+                'linear', 100.0, 300.0, 0.0, 1.0)
+        ]
+        h_array = np.r_[-10.0, np.linspace(0.0, 5000.0, 101)]
+        for w in winds:
+            result = w.wind(h_array)
+            self.assertTupleEqual(result.shape, (len(h_array), 3))
+            for h, value in zip(h_array, result):
+                np.testing.assert_allclose(value, w(h), rtol=1e-12)
+
+    def testTabulate(self):
+        w = wind.HybridWind(
+            wind.WindPower(2.0, 4.5, [3.0, 1.0, 0.0]),
+            wind.WindConstant([0.0, 5.0, 0.0]),
+            'linear', 100.0, 300.0, 0.0, 1.0)
+        table = w.tabulate(0.0, 1000.0, 0.5)
+        self.assertIsInstance(table, wind.WindTable)
+        # 格子点上では元のモデルと一致
+        np.testing.assert_allclose(table.wind(np.arange(0.0, 1000.5, 0.5)), w.wind(np.arange(0.0, 1000.5, 0.5)))
+        h_array = np.linspace(10.0, 990.0, 57)
+        np.testing.assert_allclose(table.wind(h_array), w.wind(h_array), atol=2e-3)
+        for h in (-5.0, 0.25, 123.4, 999.9, 2000.0):
+            np.testing.assert_allclose(table(h), table.wind(np.array([h]))[0])
+        # 範囲外は端の値
+        np.testing.assert_allclose(table(2000.0), w(1000.0))
+        np.testing.assert_allclose(table(-5.0), w(0.0))
+        self.assertIs(table.tabulate(0.0, 500.0, 0.5), table)
+
+
+    def testMultiProfileForecast(self):
+        '''
+        複数の予報時刻のプロファイルの読み込み, 時間補間, キャッシュのテスト
+        '''
+        filename = os.path.join(self.tmpdir, 'forecast.csv')
+        with open(filename, 'w') as f:
+            f.write('#time,altitude,x,y,z\n')
+            for h, wx in ((100.0, 1.0), (0.0, 0.0), (200.0, 2.0)):
+                f.write('0,{},{},0,0\n'.format(h, wx))
+            for h, wy in ((0.0, 0.0), (50.0, 5.0), (150.0, 15.0)):
+                f.write('6,{},0,{},0\n'.format(h, wy))
+
+        w = wind.createWind('forecast', {'filename': filename, 'time': 3.0})
+        np.testing.assert_array_equal(w.times, [0.0, 6.0])
+        np.testing.assert_array_equal(w.alt_axis, [0.0, 50.0, 100.0, 150.0, 200.0])
+        self.assertTupleEqual(w.profiles.shape, (2, 5, 3))
+        np.testing.assert_allclose(w(100.0), [0.5, 5.0, 0.0])
+        np.testing.assert_allclose(w(300.0), [1.0, 7.5, 0.0])
+        np.testing.assert_allclose(w.wind(np.array([50.0, 100.0])), [[0.25, 2.5, 0.0], [0.5, 5.0, 0.0]])
+
+        w0 = w.at(0.0)
+        self.assertIs(w0.profiles, w.profiles)
+        np.testing.assert_allclose(w0(150.0), [1.5, 0.0, 0.0])
+        self.assertEqual(w.time, 3.0)
+        with self.assertRaises(ValueError):
+            w.at(7.0)
+
+        # 2回目以降はバイナリキャッシュから読み込む
+        self.assertEqual(len(os.listdir(wind.FORECAST_CACHE_DIR)), 1)
+        wind._forecast_cache.clear()
+        with mock.patch.object(wind, '_parse_forecast', side_effect=AssertionError):
+            w_cached = wind.WindForecast(filename, time=3.0)
+        np.testing.assert_array_equal(w_cached.wind_vec_array, w.wind_vec_array)
+
+    def testTurbulence(self):
+        '''
+        乱流風モデルの再現性, 実現値の独立性, 一括生成, 統計量のテスト
+        '''
+        base = wind.WindConstant([3.0, 0.0, 0.0])
+        params = {'sigma': [2.0, 2.0, 1.0], 'length_scale': 100.0, 'h_max': 2000.0, 'dh': 1.0, 'seed': 7}
+        w = wind.WindTurbulence(base, realization=3, **params)
+        # 同じシード, 実現値番号からは同じ実現値
+        np.testing.assert_array_equal(w.gust.table, wind.WindTurbulence(base, realization=3, **params).gust.table)
+        self.assertFalse(np.allclose(w.gust.table, wind.WindTurbulence(base, realization=4, **params).gust.table))
+
+        # 一括生成は個別の生成と一致
+        ensemble = wind.WindTurbulence.ensemble(64, base, **params)
+        self.assertEqual(len(ensemble), 64)
+        np.testing.assert_array_equal(ensemble[3].gust.table, w.gust.table)
+
+        # 平均風 + 乱流成分, スカラと配列の評価が一致
+        h_array = np.array([-10.0, 0.0, 12.3, 500.5, 1999.9, 3000.0])
+        np.testing.assert_allclose(w.wind(h_array), base.wind(h_array) + w.gust.wind(h_array))
+        for h, w_h in zip(h_array, w.wind(h_array)):
+            np.testing.assert_allclose(w(h), w_h)
+
+        # 乱流成分の標準偏差は指定値に近い
+        gust = np.array([wt.gust.table for wt in ensemble])
+        np.testing.assert_allclose(gust.std(axis=(0, 1)), params['sigma'], rtol=0.1)
+        self.assertLess(np.abs(gust.mean()), 0.1)
+
+        w_dict = wind.createWind('turbulence', {
+            'base': {'wind_model': 'constant', 'wind_parameters': {'wind_std': [3.0, 0.0, 0.0]}},
+            'spectrum': 'von_karman',
+            'realization': 3,
+            **params
+        })
+        self.assertIsInstance(w_dict, wind.WindTurbulence)
+        np.testing.assert_allclose(w_dict(0.0)[0] - w_dict.gust(0.0)[0], 3.0)
+        with self.assertRaises(ValueError):
+            wind.WindTurbulence(spectrum='gaussian')
+
+    def testAltitudeGrid(self):
+        '''
+        テーブル化する高度格子が風モデル固有の刻みを保持するかのテスト
+        '''
+        power = wind.WindPower(2.0, 4.5, [1.0, 2.0, 0.0])
+        h = wind.wind_altitude_grid(power, dh=20.0, h_max=5000.0)
+        self.assertEqual(h[-1], 5000.0)
+        self.assertEqual(np.max(np.diff(h)), 20.0)
+        self.assertIsNone(power.resolution())
+
+        # 乱流は合成した刻み(1m)で格子を作り, 格子上の線形補間が元の風とほぼ一致する
+        # (20m刻みでは乱流が平滑化され, 誤差は0.7m/s程度になる)
+        turbulence = wind.WindTurbulence(power, sigma=2.0, length_scale=50.0, h_max=5000.0, dh=1.0)
+        hybrid = wind.HybridWind(power, turbulence, border_height0=100.0, border_height1=200.0)
+        self.assertEqual(hybrid.resolution(), 1.0)
+        h = wind.wind_altitude_grid([power, hybrid], dh=20.0, h_max=5000.0)
+        self.assertEqual(np.max(np.diff(h)), 1.0)
+        table = turbulence.wind(h)
+        h_eval = np.linspace(1000.0, 4999.0, 7777)
+        w_interp = np.stack([np.interp(h_eval, h, table[:, i]) for i in range(3)], axis=-1)
+        np.testing.assert_allclose(w_interp, turbulence.wind(h_eval), atol=1e-5)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file